@@ -2,38 +2,43 @@ import math
 import numpy as np
 
 from helpers.types import *
+from helpers.history import History
 from helpers.conversions import *
 from helpers.solar_conversions import *
 
 
 
 class Crop:
-    def __init__(self, time_period: s, initial_weight, initial_leaf_area, grow_period, target_DLI, plants_per_barrel, barrel_count):
+    def __init__(self, time_period: s, initial_weight, initial_leaf_area, grow_period, target_DLI, plants_per_barrel, barrel_count, cohort_count=None, history_mode="latest"):
         # Init class with structure specific values
         self.plants_per_barrel = plants_per_barrel
         self.barrel_count = barrel_count
         self.time_period = time_period
         self.total_count = self.plants_per_barrel * self.barrel_count
 
+        # Plants of identical age are tracked together as cohorts, so the cost of growing does not scale with the plant count.
+        # By default every plant of a barrel is its own cohort.
+        self.cohort_count = self.plants_per_barrel if cohort_count is None else cohort_count
+        assert 0 < self.cohort_count <= self.plants_per_barrel, f"cohort_count ({self.cohort_count}) must be between 1 and plants_per_barrel ({self.plants_per_barrel})"
+
         # Init crop specific variables which should be populated in subclasses
         self.initial_weight: g = initial_weight
         self.initial_leaf_area: cm2 = initial_leaf_area
         self.grow_period: d = grow_period
         self.target_DLI: mol_per_m2_day = target_DLI
 
-        # Init accumulators (for 1 barrel)
-        self.weights = []
-        self.leaf_areas = []
+        # Init accumulators (for 1 plant of each cohort). See `History` for supported `history_mode` values.
+        self.weights = History(history_mode)
+        self.leaf_areas = History(history_mode)
 
         # Init accumulators (for all barrels)
         self.harvested_weight: kg = 0
 
-        # Init a vector with one scalar for each plant in a barrel
-        self.hours_after_transplant = np.zeros(self.plants_per_barrel)
+        # Number of plants of a barrel in each cohort
+        self.cohort_sizes = np.bincount(np.arange(self.plants_per_barrel) * self.cohort_count // self.plants_per_barrel)
 
-        # Spread out growth phase evenly
-        for i, _ in enumerate(self.hours_after_transplant):
-            self.hours_after_transplant[i] = (i / self.plants_per_barrel) * self.grow_period * 24 
+        # Init a vector with one scalar for each cohort in a barrel, spreading out growth phase evenly
+        self.hours_after_transplant = (np.arange(self.cohort_count) / self.cohort_count) * self.grow_period * 24
 
         # Init weight and leaf_area
         self._initiate_crops()
@@ -41,7 +46,41 @@ class Crop:
 
     @property
     def total_leaf_area(self) -> m2:
-        return self.barrel_count * self.leaf_areas[-1].sum() / 10000
+        return self.barrel_count * (self.leaf_areas[-1] * self.cohort_sizes).sum() / 10000
+
+
+    def get_state(self) -> dict:
+        """
+        Copy of the growth state of the crop (age, weight and leaf area of each cohort, harvest so far), to restore it
+        with `set_state` (see `Greenhouse.get_checkpoint`).
+        """
+        return {
+            "hours_after_transplant": self.hours_after_transplant.copy(),
+            "weights": self.weights.get_state(),
+            "leaf_areas": self.leaf_areas.get_state(),
+            "harvested_weight": self.harvested_weight,
+        }
+
+
+    def set_state(self, state):
+        assert len(state["hours_after_transplant"]) == self.cohort_count, f"Cannot restore a crop of {len(state['hours_after_transplant'])} cohorts into one of {self.cohort_count}."
+        self.hours_after_transplant = state["hours_after_transplant"].copy()
+        self.weights.set_state(state["weights"])
+        self.leaf_areas.set_state(state["leaf_areas"])
+        self.harvested_weight = state["harvested_weight"]
+
+
+    def estimate_state_after(self, elapsed_hours: h):
+        """
+        Sets the crop of a new simulation to an estimate of its state `elapsed_hours` later, e.g. to start a simulation
+        in the middle of a year. The ages of the cohorts are exact, as transplanting repeats every `grow_period`.
+        Their weights and leaf areas are initialized for these ages as if they had grown at the target DLI, so they
+        converge to the actual ones once every cohort has been harvested (within `grow_period`).
+        """
+        self.hours_after_transplant = (self.hours_after_transplant + elapsed_hours) % (self.grow_period * 24)
+        self.weights = History(self.weights.mode)
+        self.leaf_areas = History(self.leaf_areas.mode)
+        self._initiate_crops()
 
 
     def grow(self, PAR_photon_amount: mol_per_m2):
@@ -86,16 +125,13 @@ class Crop:
 
     def _get_growth_coeffs(self):
         """
-        Calculates for each plant how many hours elapsed since their transplants at the beginning and end of the current `time_period`.
+        Calculates the growth coefficients of each cohort at the beginning and end of the current `time_period`, based on the hours elapsed since their transplants.
+        `_get_growth_coeff_at` is applied to the whole `hours_after_transplant` vector at once, so it needs to be a NumPy ufunc expression.
         """
-        growth_coeffs_at_start = []
-        growth_coeffs_at_end = []
+        growth_coeffs_at_start = self._get_growth_coeff_at(self.hours_after_transplant)
+        growth_coeffs_at_end = self._get_growth_coeff_at(self.hours_after_transplant + (self.time_period / 3600))
 
-        for hour_of_plant in self.hours_after_transplant:
-            growth_coeffs_at_start.append(self._get_growth_coeff_at(hour_of_plant))
-            growth_coeffs_at_end.append(self._get_growth_coeff_at(hour_of_plant + (self.time_period / 3600)))
-
-        return np.array(growth_coeffs_at_start), np.array(growth_coeffs_at_end)
+        return growth_coeffs_at_start, growth_coeffs_at_end
 
 
     def _init_property(self, prop_name, final_prop_value):
@@ -121,12 +157,11 @@ class Crop:
         self._init_property("leaf_area", final_leaf_area)
 
 
-    def _register_property_change(self, prop_name, final_prop_value):
+    def _register_property_change(self, prop_name, final_prop_value, growth_coeffs):
         """
         Calculates plant property change (such as weight, leaf area) during a `time_period`, and saves it to the appropriate register.
         This way it computes the increment during the time period given a `dli` amount and adds it to the last property of the plant.
         """
-        growth_coeffs = self._get_growth_coeffs()
         props_at_start = growth_coeffs[0] * final_prop_value
         props_at_end = growth_coeffs[1] * final_prop_value
         props_delta = props_at_end - props_at_start
@@ -137,8 +172,11 @@ class Crop:
     def _register_plant_growth(self, dli: mol_per_m2_day):
         final_weight, final_leaf_area = self._get_final_plant_props(dli)
 
-        self._register_property_change("weight", final_weight)
-        self._register_property_change("leaf_area", final_leaf_area)
+        # Growth coefficients are the same for every property, compute them once per step
+        growth_coeffs = self._get_growth_coeffs()
+
+        self._register_property_change("weight", final_weight, growth_coeffs)
+        self._register_property_change("leaf_area", final_leaf_area, growth_coeffs)
 
 
     def _harvest(self):
@@ -149,7 +187,7 @@ class Crop:
         plants_to_harvest = self.hours_after_transplant >= (self.grow_period * 24)
 
         # Sum their weight and add it to harvest accumulator
-        harvested_weight: g = self.weights[-1][plants_to_harvest].sum() * self.barrel_count
+        harvested_weight: g = (self.weights[-1][plants_to_harvest] * self.cohort_sizes[plants_to_harvest]).sum() * self.barrel_count
         self.harvested_weight += harvested_weight
 
         # Initialize new plants in the place of the harvested ones (==transplant seedlings)
@@ -159,7 +197,7 @@ class Crop:
         # Start over counting `hours_after_transplant` if any plant goes over `grow_period` (== being harvested)
         self.hours_after_transplant = self.hours_after_transplant % (self.grow_period * 24)
 
-        harvested_count = len([p for p in plants_to_harvest if p]) * self.barrel_count
+        harvested_count = int(self.cohort_sizes[plants_to_harvest].sum()) * self.barrel_count
 
         return harvested_weight, harvested_count
 
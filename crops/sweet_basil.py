@@ -0,0 +1,56 @@
+import numpy as np
+
+from crops.crop import Crop
+from helpers.types import *
+
+
+class SweetBasil(Crop):
+    """
+    Source of magic numbers: https://docs.google.com/spreadsheets/d/15W7doRV3CC-cBJzIBFd_GSMAgq3gd0UYVjLGZALZG58/edit#gid=0
+    """
+    def __init__(self, *args, **kwargs):
+        # Define crop specific constants
+        self.initial_weight: g = 2
+        self.initial_leaf_area: cm2 = 40
+        self.grow_period: d = 28
+        self.photoperiod: h = 16
+        self.target_DLI: mol_per_m2_day = 13
+
+        super(SweetBasil, self).__init__(
+            initial_weight=self.initial_weight, 
+            initial_leaf_area=self.initial_leaf_area, 
+            grow_period=self.grow_period, 
+            target_DLI=self.target_DLI, 
+            *args, 
+            **kwargs
+        )
+
+
+    def _get_final_plant_props(self, dli: mol_per_m2_day) -> g:
+        # Diminishing returns above DLI 17
+        if dli > 17:
+            dli = 17
+
+        final_weight: g = 1.25 * dli + 2.35 # TODO: very rough linear approximation, come up with a better function
+        final_leaf_area: cm2 = 25.4 * dli + 184 # TODO: very rough linear approximation, come up with a better function
+        return final_weight, final_leaf_area
+
+
+    def _get_growth_coeff_at(self, hour: h):
+        return 0.0754 * np.exp(0.124 * (hour / 24))
+
+
+    def _get_specific_photosynthetic_rate(self, dli: mol_per_m2_day) -> umol_per_m2_s:
+        # Diminishing returns above DLI 17
+        if dli > 17:
+            dli = 17
+
+        return 0.706 * dli + 0.115
+
+
+    def _get_specific_transpiration_rate(self, dli: mol_per_m2_day) -> mmol_per_m2_s:
+        # Diminishing returns above DLI 17
+        if dli > 17:
+            dli = 17
+            
+        return 0.101 * dli + 0.472
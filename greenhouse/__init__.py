@@ -0,0 +1,37 @@
+"""
+Greenhouse simulation model. The classes below are imported from their modules on first access, so that importing
+the package (or one of its modules) does not load the whole model and its dependencies:
+
+    from greenhouse import Greenhouse, SweetBasil
+
+Run `python -m greenhouse.self_test` to validate the model functions.
+"""
+import importlib
+
+
+# Class name -> module it is defined in
+_class_modules = {
+    "Greenhouse": "greenhouse.greenhouse",
+    "GreenhouseBatch": "greenhouse.greenhouse",
+    "Structure": "greenhouse.structure.structure",
+    "AdaptiveLighting": "greenhouse.adaptive_lighting.adaptive_lighting",
+    "SolarPanel": "greenhouse.adaptive_lighting.solarpanel",
+    "LED_Lighting": "greenhouse.adaptive_lighting.LED_lighting",
+    "BarrelRotation": "greenhouse.adaptive_lighting.barrel_rotation",
+    "HeatPump": "greenhouse.heatpump.heatpump",
+    "Fan": "greenhouse.fan.fan",
+    "Dehumidifier": "greenhouse.dehumidifier.dehumidifier",
+    "SweetBasil": "crops.sweet_basil",
+}
+
+__all__ = list(_class_modules)
+
+
+def __getattr__(name):
+    if name not in _class_modules:
+        raise AttributeError(f"module 'greenhouse' has no attribute '{name}'")
+    return getattr(importlib.import_module(_class_modules[name]), name)
+
+
+def __dir__():
+    return sorted([*globals(), *__all__])
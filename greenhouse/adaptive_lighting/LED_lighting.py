@@ -0,0 +1,46 @@
+import numpy as np
+
+from helpers.types import *
+from helpers.history import History
+
+
+class LED_Lighting:
+    def __init__(self, barrel_count, history_mode="latest"):
+        # VU-HORTI-BLADE-LMRR-2036-80W-CCHV-IP68
+        self.energy_efficiency: mol_per_joule = 2.7e-6
+        self.max_power_per_light: W = 80
+        self.max_PPF: umol_per_s = 216
+        self.price: EUR = 120
+        self.efficiency = 0.85
+        self.heat_per_driver: W = 20
+
+        # Lighting config
+        self.driver_count = 2
+        self.barrel_count = barrel_count
+        self.light_count_per_barrel = 3
+        self.barrel_surface: m2 = 1.8 * 1.5
+
+        # Derived properties
+        self.max_PPFD: umol_per_m2_s = self.light_count_per_barrel * self.max_PPF / self.barrel_surface
+        self.installed_power: W = self.barrel_count * self.light_count_per_barrel * self.max_power_per_light
+
+        # Registers
+        self.dimmer = History(history_mode)
+
+
+    def run(self, timestamp, photoperiod, time_period: s, PPFD_to_supplement: umol_per_m2_s):
+        total_PPFD_amount_to_supplement: mol = PPFD_to_supplement * time_period * (self.barrel_surface * self.barrel_count) / 1e6
+        required_energy: J = total_PPFD_amount_to_supplement / self.energy_efficiency
+        required_power: W = required_energy / time_period
+        dimmer = required_power / self.installed_power
+
+        heat_by_drivers: J = self.driver_count * self.heat_per_driver * dimmer * time_period
+        heat_generated: J = (1 - self.efficiency) * required_energy + heat_by_drivers
+
+        if np.any(required_power > self.installed_power):
+            raise Exception(f"Light requirement ({round(np.max(required_power))} W) exceeds installed power available ({self.installed_power} W)")
+
+        # `PPFD_to_supplement` can be a single value or an array of values for consecutive periods
+        self.dimmer.extend(np.atleast_1d(dimmer))
+
+        return required_energy, heat_generated
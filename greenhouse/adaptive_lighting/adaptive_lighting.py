@@ -0,0 +1,125 @@
+import numpy as np
+
+from helpers.types import *
+from helpers.conversions import *
+from greenhouse.structure.structure import get_solar_geometry
+from greenhouse.adaptive_lighting.LED_lighting import LED_Lighting
+from greenhouse.adaptive_lighting.solarpanel import SolarPanel
+from greenhouse.adaptive_lighting.barrel_rotation import BarrelRotation
+
+
+class AdaptiveLighting:
+    # Keys of the dict returned by `run`
+    result_keys = [
+        "energy_used_by_lighting_J",
+        "energy_used_by_lighting_kWh",
+        "wasted_PAR_total_umol",
+        "wasted_PPFD_umol_per_m2_s",
+        "actual_PPFD_umol_per_m2_s",
+        "supplemented_PPFD_umol_per_m2_s",
+        "natural_PPFD_umol_per_m2_s",
+        "natural_PAR_total",
+        "supplemented_PAR_total",
+        "wasted_PAR_total",
+        "target_PAR",
+    ]
+
+    def __init__(self, time_period: s, structure, crop, roof_panel_type, history_mode="latest", barrel_light_model="surface_estimate"):
+        self.time_period = time_period
+        self.structure = structure
+        self.crop = crop
+
+        # Supported values:
+        #   surface_estimate: a fixed share of the barrel surface gets the light on a vertical surface facing north
+        #   rotation: the light of the rotating barrels, in closed form (see `BarrelRotation`)
+        #   faces: the light on each face of the barrels (see `get_natural_PAR_by_face`)
+        assert barrel_light_model in ["surface_estimate", "rotation", "faces"], f"Barrel light model '{barrel_light_model}' is not supported."
+        self.barrel_light_model = barrel_light_model
+
+        self.light = LED_Lighting(barrel_count=self.structure.barrel_count, history_mode=history_mode)
+        self.barrel_rotation = BarrelRotation(led_count=self.light.light_count_per_barrel)
+        self.solarpanel = SolarPanel(
+            time_period=self.time_period, 
+            photoperiod=self.crop.photoperiod, 
+            target_DLI=self.crop.target_DLI, 
+            irradiated_area=self.structure.compiled.irradiated_area,
+            roof_panel_type=roof_panel_type
+        )
+
+    def is_dark_hour(self, hour_of_day, photoperiod):
+        # Dark hours start at:
+        start_at = 21
+        is_dark = (hour_of_day >= start_at) | (hour_of_day < (24 - (24 - (start_at + 1)) - photoperiod))
+        return is_dark
+
+
+    def run(self, timestamp, natural_PAR_inside: umol_per_m2, coordinates):
+        """
+        Calculates light supplementation, resulting in energy used for it and wasted/actual PAR as umol_per_m2.
+        Depends only on time and weather, so `timestamp` and `natural_PAR_inside` can also be a whole DatetimeIndex and
+        an array of the same length, in which case every returned value is an array.
+        """
+        target_PAR_per_hour: umol_per_m2_hour = 1e6 * self.crop.target_DLI / self.crop.photoperiod
+
+        # Get the current target DLI, which is either the target DLI, or 0 during the night
+        target_PAR_current_hour: umol_per_m2_hour = np.where(self.is_dark_hour(timestamp.hour, self.crop.photoperiod), 0, target_PAR_per_hour)
+
+        # Get target PAR as amount of photons
+        target_PAR: umol_per_m2 = target_PAR_current_hour * (self.time_period / 3600)
+        target_PAR_total: umol = target_PAR * self.structure.compiled.barrel_surface_total
+
+        # Get natural PAR
+        elevation_angles, _, intensity_coeffs = get_solar_geometry(coordinates, timestamp, panel_tilts=[90], panel_azimuths=[0])
+        if self.barrel_light_model == "rotation":
+            # The plants pass in front of the sun as the barrels rotate, facing it (vertically) at the peak of their exposure
+            sun_facing_coeffs = np.cos(np.radians(elevation_angles)) * (elevation_angles > 0)
+            sun_facing_coeff = sun_facing_coeffs if np.ndim(natural_PAR_inside) else sun_facing_coeffs[0]
+            sun_exposure_fraction, _ = self.barrel_rotation.get_exposure_fractions()
+            natural_PAR_total: umol = np.clip(natural_PAR_inside, 0, None) * sun_facing_coeff * sun_exposure_fraction * self.structure.compiled.barrel_surface_total
+        elif self.barrel_light_model == "faces":
+            natural_PAR_total: umol = self.get_natural_PAR_by_face(timestamp, natural_PAR_inside).sum(axis=-1) * self.structure.compiled.barrel_face_area
+        else:
+            intensity_coeff = intensity_coeffs[:, 0] if np.ndim(natural_PAR_inside) else intensity_coeffs[0, 0]
+            effective_PAR_inside: umol_per_m2 = natural_PAR_inside * intensity_coeff
+            ## VERY VERY rough estimate. TODO: break up the curve to many panels and calculate based on different azimuth angles
+            natural_PAR_total: umol = effective_PAR_inside * self.structure.barrel_surface_exposed_to_sun / 2 
+
+        # Natural light is not enough, supplement needed
+        supplemented_PAR_total: umol = np.clip(target_PAR_total - natural_PAR_total, 0, None)
+        light_results: [J, J] = self.light.run(
+            timestamp,
+            self.crop.photoperiod,
+            self.time_period,
+            self.PAR_total_to_PPFD(supplemented_PAR_total)
+        )
+        energy_used_by_lighting, heat_generated_from_lighting = light_results
+        energy_used_by_lighting_kWh: kWh = J_to_kWh(energy_used_by_lighting)
+
+        # Natural light is too much, PAR above target is wasted
+        wasted_PAR_total: umol = np.clip(natural_PAR_total - target_PAR_total, 0, None)
+
+        return {
+            "energy_used_by_lighting_J": energy_used_by_lighting,
+            "energy_used_by_lighting_kWh": energy_used_by_lighting_kWh,
+            "wasted_PAR_total_umol": wasted_PAR_total,
+            "wasted_PPFD_umol_per_m2_s": self.PAR_total_to_PPFD(wasted_PAR_total),
+            "actual_PPFD_umol_per_m2_s": self.PAR_total_to_PPFD(natural_PAR_total + supplemented_PAR_total),
+            "supplemented_PPFD_umol_per_m2_s": self.PAR_total_to_PPFD(supplemented_PAR_total),
+            "natural_PPFD_umol_per_m2_s": self.PAR_total_to_PPFD(natural_PAR_total),
+            "natural_PAR_total": natural_PAR_total,
+            "supplemented_PAR_total": supplemented_PAR_total,
+            "wasted_PAR_total": wasted_PAR_total,
+            "target_PAR": target_PAR
+        }
+
+    def get_natural_PAR_by_face(self, timestamp, natural_PAR_inside: umol_per_m2) -> umol_per_m2:
+        """
+        Natural PAR on each face of the barrels (see `Structure.get_barrel_face_intensity_coeffs`), of shape
+        (timestep, face) for a DatetimeIndex and an array of `natural_PAR_inside`, or (face,) for a single timestamp.
+        Negative irradiance (an artefact of resampling the weather data) counts as no light.
+        """
+        natural_PAR_inside: umol_per_m2 = np.clip(natural_PAR_inside, 0, None)
+        return natural_PAR_inside[..., np.newaxis] * self.structure.get_barrel_face_intensity_coeffs(timestamp)
+
+    def PAR_total_to_PPFD(self, PAR_total: umol) -> umol_per_m2_s:
+        return (PAR_total / self.structure.compiled.barrel_surface_total) / self.time_period
@@ -0,0 +1,121 @@
+import math
+import numpy as np
+
+from helpers.types import *
+
+
+class BarrelRotation:
+    """
+    Light received by a plant on a rotating barrel, in closed form. As the barrel rotates, a plant passes in front of
+    the sun and of each LED fixture, and its exposure to each light source is a half-sine peak (see `get_curve_configs`
+    in barrel-realtime.ipynb). The integral of a half-sine peak of height A and duration L is 2AL/π, so the photon dose
+    of a rotation or a period does not need to be integrated numerically.
+
+    The plant faces the sun at the start of each rotation (rotations start at multiples of `rotation_period`, e.g. in
+    seconds since midnight), and the LED fixtures are on the opposite side of the barrel.
+    """
+    def __init__(self,
+        rotation_period: s = 600,
+        angle_exposed_to_sun: deg = 180,
+        angle_exposed_to_single_led: deg = 90,
+        inter_led_angle: deg = 45,
+        led_count=3
+    ):
+        self.rotation_period: s = rotation_period
+
+        def angle_to_s(angle: deg) -> s:
+            return angle / 360 * rotation_period
+
+        # Start (since the start of the rotation) and duration of the exposure to each light source. The sun peak
+        # starts before the rotation, its tail is at the start of the rotation and its head at the end.
+        self.sun_exposure: [s, s] = (angle_to_s(-angle_exposed_to_sun / 2), angle_to_s(angle_exposed_to_sun))
+        led_start: s = angle_to_s(180 - (led_count - 1) / 2 * inter_led_angle - angle_exposed_to_single_led / 2)
+        self.led_exposures: [[s, s]] = [
+            (led_start + led_index * angle_to_s(inter_led_angle), angle_to_s(angle_exposed_to_single_led))
+            for led_index in range(led_count)
+        ]
+
+
+    def get_exposure_fractions(self) -> [float, float]:
+        """
+        Mean PPFD of a plant over a rotation, relative to the PPFD of the sun and of a single LED fixture (2 / π of
+        the fraction of the rotation exposed to them). It is also the mean PPFD of the whole barrel surface at any
+        time, as its plants are spread evenly around the barrel.
+        """
+        sun_fraction = 2 / math.pi * self.sun_exposure[1] / self.rotation_period
+        led_fraction = sum(2 / math.pi * duration / self.rotation_period for _, duration in self.led_exposures)
+        return sun_fraction, led_fraction
+
+
+    def get_rotation_dose(self, sun_PPFD: umol_per_m2_s, led_PPFD: umol_per_m2_s) -> [umol_per_m2, umol_per_m2]:
+        """
+        Photon dose of a plant over a full rotation from the sun and from the LED fixtures, at the PPFD of the sun
+        (on a surface facing it) and of a single fixture. Both can be arrays.
+        """
+        sun_fraction, led_fraction = self.get_exposure_fractions()
+        return sun_PPFD * sun_fraction * self.rotation_period, led_PPFD * led_fraction * self.rotation_period
+
+
+    def get_cumulative_exposure(self, t: s) -> [s, s]:
+        """
+        Exposure of a plant to the sun and to the LED fixtures at unit PPFD from time 0 to `t` (a value or an array):
+        the dose of the full rotations, plus the antiderivative of the half-sine peaks within the current one.
+        """
+        t = np.asarray(t, dtype=float)
+        rotation_count, phase = np.divmod(t, self.rotation_period)
+        sun_fraction, led_fraction = self.get_exposure_fractions()
+
+        def get_peak_exposure(start: s, duration: s) -> s:
+            # Antiderivative of sin(π (τ - start) / duration) over the peak, from the start of the rotation to `phase`.
+            # A peak starting before the rotation contributes its tail at the start and its head at the end.
+            def get_antiderivative(x: s) -> s:
+                return duration / math.pi * (1 - np.cos(math.pi * np.clip(x, 0, duration) / duration))
+
+            return get_antiderivative(phase - start) - get_antiderivative(-start) + get_antiderivative(phase - start - self.rotation_period)
+
+        sun_exposure: s = rotation_count * sun_fraction * self.rotation_period + get_peak_exposure(*self.sun_exposure)
+        led_exposure: s = rotation_count * led_fraction * self.rotation_period + sum(get_peak_exposure(*led_exposure) for led_exposure in self.led_exposures)
+        return sun_exposure, led_exposure
+
+
+    def get_period_dose(self, sun_PPFD: umol_per_m2_s, led_PPFD: umol_per_m2_s, t_from: s, t_to: s) -> [umol_per_m2, umol_per_m2]:
+        """
+        Photon dose of a plant between `t_from` and `t_to` from the sun and from the LED fixtures, at a PPFD constant
+        over the period. All arguments can be arrays, e.g. one value per period of a simulation. Over a whole number
+        of rotations, it is the rotation dose times the number of rotations.
+        """
+        sun_exposure_from, led_exposure_from = self.get_cumulative_exposure(t_from)
+        sun_exposure_to, led_exposure_to = self.get_cumulative_exposure(t_to)
+        return sun_PPFD * (sun_exposure_to - sun_exposure_from), led_PPFD * (led_exposure_to - led_exposure_from)
+
+
+### VALIDATION
+def validate():
+    def get_sampled_PPFD(rotation, sun_PPFD, led_PPFD, t):
+        # Superposition of the half-sine peaks sampled at times t, like `get_sun_and_led_ppfd` in barrel-realtime.ipynb
+        phase = np.mod(t, rotation.rotation_period)
+        def get_peak(start, duration):
+            x = np.mod(phase - start, rotation.rotation_period)
+            return np.where(x <= duration, np.sin(math.pi * np.minimum(x, duration) / duration), 0)
+        return sun_PPFD * get_peak(*rotation.sun_exposure), led_PPFD * sum(get_peak(*led_exposure) for led_exposure in rotation.led_exposures)
+
+    sc = "1: A rotation gets 2 A L / π from each half-sine peak."
+    rotation = BarrelRotation()
+    sun_dose, led_dose = rotation.get_rotation_dose(1000, 343)
+    assert np.isclose(sun_dose, 2 * 1000 * 300 / math.pi) and np.isclose(led_dose, 3 * 2 * 343 * 150 / math.pi), f"BarrelRotation validation FAILED - {sc}"
+
+    sc = "2: Agrees with the sampled exposure curves over partial rotations."
+    t = np.arange(0, 1000, 0.01) + 0.005
+    sun_PPFD, led_PPFD = get_sampled_PPFD(rotation, 1000, 343, t)
+    for t_from, t_to in [(0, 600), (0, 1000), (120, 470), (555, 610)]:
+        is_in_period = (t > t_from) & (t < t_to)
+        sun_dose, led_dose = rotation.get_period_dose(1000, 343, t_from, t_to)
+        assert np.isclose(sun_dose, sun_PPFD[is_in_period].sum() * 0.01, rtol=1e-3, atol=1), f"BarrelRotation validation FAILED - {sc}"
+        assert np.isclose(led_dose, led_PPFD[is_in_period].sum() * 0.01, rtol=1e-3, atol=1), f"BarrelRotation validation FAILED - {sc}"
+
+    sc = "3: Period doses are vectorized and add up to the dose of the whole span."
+    t_steps = np.arange(0, 3601, 300)
+    sun_doses, led_doses = rotation.get_period_dose(1000, 343, t_steps[:-1], t_steps[1:])
+    assert np.isclose(sun_doses.sum(), 6 * rotation.get_rotation_dose(1000, 343)[0]) and len(led_doses) == 12, f"BarrelRotation validation FAILED - {sc}"
+
+    print("Validation PASSED: barrel_rotation.py")
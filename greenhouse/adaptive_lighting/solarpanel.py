@@ -0,0 +1,87 @@
+import numpy as np
+
+from helpers.types import *
+from helpers.solar_conversions import *
+
+
+class NonSolar:
+    def __init__(self):
+        self.transparency = 0.8
+        self.efficiency = 0
+        self.configuration = "static"
+
+
+class SolarBrite:
+    def __init__(self, transparency=0.44):
+        self.transparency_limits = [0.44, 0.82]
+        assert transparency >= self.transparency_limits[0] and transparency <= self.transparency_limits[1], f"SolarBrite transparency ({transparency}) is not within limits {self.transparency_limits}"
+        self.transparency = transparency
+        self.efficiency = 0.22 # As portion of non-transmitted sunlight
+        self.configuration = "static"
+
+
+class Insolight2:
+    def __init__(self):
+        self.transparency_limits = [0.2, 0.78]
+        self.transparency = 0.4
+        self.efficiency = 0.2 # As portion of non-transmitted sunlight
+        self.configuration = "dynamic"
+
+
+class SolarPanel:
+    def __init__(self, time_period: s, photoperiod: h, target_DLI: mol_per_m2_day, irradiated_area: m2, roof_panel_type):
+        self.time_period: s = time_period
+        self.photoperiod: h = photoperiod
+        self.target_DLI: dli = target_DLI
+        self.irradiated_area: m2 = irradiated_area
+
+        supported_roof_panel_types = ["solarbrite", "insolight", "polycarbonate"]
+        assert roof_panel_type in supported_roof_panel_types, f"roof_panel_type must to be in {supported_roof_panel_types}"
+
+        if roof_panel_type == "solarbrite":
+            self.panel = SolarBrite()
+        elif roof_panel_type == "insolight":
+            self.panel = Insolight2()
+        elif roof_panel_type == "polycarbonate":
+            self.panel = NonSolar()
+
+
+    def distribute_irradiance_static(self, irradiance: W_per_m2) -> [W_per_m2, W_per_m2]:
+        transmitted_irradiance: W_per_m2 = irradiance * self.panel.transparency
+        irradiance_on_panels: W_per_m2 = irradiance * (1 - self.panel.transparency)
+        return transmitted_irradiance, irradiance_on_panels, self.panel.transparency
+
+
+    def distribute_irradiance_dynamic(self, irradiance: W_per_m2) -> [W_per_m2, W_per_m2]:
+        PPFD: mol_per_m2_s = irradiance_to_PPFD(irradiance)
+        projected_DLI: mol_per_m2_day = PPFD_to_projected_DLI(PPFD, self.photoperiod)
+
+        transparency = self.target_DLI / (projected_DLI + 1e-10) # add a small number to avoid ZeroDivisionError
+
+        # Keep transparency within valid limits (works on scalars and arrays of irradiance values too)
+        transparency = np.clip(transparency, self.panel.transparency_limits[0], self.panel.transparency_limits[1])
+
+        transmitted_irradiance: W_per_m2 = irradiance * transparency
+        irradiance_on_panels: W_per_m2 = irradiance * (1 - transparency)
+
+        return transmitted_irradiance, irradiance_on_panels, transparency
+
+
+    def run(self, irradiance_on_solar_panel: W_per_m2) -> [W, W, W_per_m2]:
+        if self.panel.configuration == "static":
+            transmitted_irradiance, irradiance_on_panels, transparency = self.distribute_irradiance_static(irradiance_on_solar_panel)
+        elif self.panel.configuration == "dynamic":
+            transmitted_irradiance, irradiance_on_panels, transparency = self.distribute_irradiance_dynamic(irradiance_on_solar_panel)
+
+        solar_power_transmitted: W = transmitted_irradiance * self.irradiated_area
+        power_captured: W = irradiance_on_panels * self.irradiated_area
+        electrical_power_generated: W = self.panel.efficiency * power_captured
+
+        # transmitted_PPFD: umol_per_m2_s = irradiance_to_PPFD(transmitted_irradiance)
+        # target_PPFD: umol_per_m2_s = projected_DLI_to_PPFD(self.target_DLI, self.photoperiod)
+
+        # wasted_PPFD: umol_per_m2_s = 0
+        # if transmitted_PPFD > target_PPFD:
+        #     wasted_PPFD = transmitted_PPFD - target_PPFD
+
+        return electrical_power_generated, solar_power_transmitted, transparency
@@ -0,0 +1,19 @@
+from helpers.types import *
+
+
+class Dehumidifier:
+    def __init__(self):
+        # self.energy_factor: l_per_kWh = 2
+        self.energy_factor: l_per_J = 2 / 3.6e+6
+
+    def run(self, mass_to_remove: g) -> J:
+        """
+        Energy used and heat released to remove `mass_to_remove` of water, a single value or an array.
+        """
+        volume_to_remove: l = mass_to_remove / 1000
+        water_evaporation_heat: J_per_g = 2501
+
+        energy_used: J = volume_to_remove / self.energy_factor
+        heat_released: J = volume_to_remove * water_evaporation_heat * 1000
+
+        return energy_used, heat_released
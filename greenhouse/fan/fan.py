@@ -0,0 +1,20 @@
+from helpers.types import *
+
+
+class Fan:
+    def __init__(self):
+        # https://www.industrialfansdirect.com/collections/duct-inline-exhaust-fans/products/airflo-tube-axial-duct-fan-12-inch-1875-cfm-direct-drive-nd12-c-1-t-national-fan-co
+        self.name = "AirFlo Tube Axial Duct Fan 12 inch 1875 CFM Direct Drive ND12-C-1-T"
+        self.max_cfm = 1875
+        self.max_hp = 0.5
+
+        self.max_airflow: m3_per_s = self.max_cfm / 35.315 / 60
+        self.max_power: W = self.max_hp * 746
+
+    def get_energy_usage(self, volume: m3) -> J:
+        """
+        Energy used to move `volume` of air, a single value or an array.
+        """
+        # J/s per m3/s simplifies to J/m3
+        volume_per_energy: J_per_m3 = self.max_power / self.max_airflow
+        return volume * volume_per_energy
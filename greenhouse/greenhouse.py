@@ -1,5 +1,10 @@
+import math
+from functools import lru_cache
+import numpy as np
+import pandas as pd
 import psychrolib
-from scipy.ndimage.filters import uniform_filter1d
+from scipy.integrate import solve_ivp
+from scipy.sparse import csc_matrix
 
 import sys
 sys.path.insert(0, '/work/greenhouse-simulator-2/')
@@ -7,6 +12,20 @@ sys.path.insert(0, '/work/greenhouse-simulator-2/')
 from helpers.types import *
 from helpers.psychro import *
 from helpers.conversions import *
+from helpers.solar_conversions import *
+from helpers.math_helpers import is_scalar, where, maximum, minimum, clip, any_true
+from helpers.cost import step_energy_keys
+from helpers.history import History
+from helpers.control_recorder import ControlRecorder
+from helpers.result_collector import ResultCollector
+from helpers.kpi import KPIAccumulator
+from helpers.profiler import Profiler, disabled_profiler
+from crops.sweet_basil import SweetBasil
+from greenhouse.structure.structure import Structure, stack_compiled_structures
+from greenhouse.adaptive_lighting.adaptive_lighting import AdaptiveLighting
+from greenhouse.heatpump.heatpump import HeatPump
+from greenhouse.fan.fan import Fan
+from greenhouse.dehumidifier.dehumidifier import Dehumidifier
 
 psychrolib.SetUnitSystem(psychrolib.SI)
 
@@ -14,6 +33,10 @@ psychrolib.SetUnitSystem(psychrolib.SI)
 pressure: Pa = 101325 # TODO: get this from weather data
 air_density: kg_per_m3 = 1.1839 # TODO: take humidity into account with psychrolib
 water_evaporation_heat: J_per_g = 2501
+ambient_CO2: ppm = 410
+
+# All model functions accept a single state (floats) or a batch of states (arrays), so the right hand side can be
+# evaluated with `solve_ivp(..., vectorized=True)`. Piecewise conditions use the element-wise `where` / `clip` helpers.
 
 
 def get_airflow(
@@ -22,11 +45,19 @@ def get_airflow(
         ambient_humidity_at_inside_temp: RH, 
         temp: C, 
         ambient_data, 
-        control_register, 
+        control_recorder, 
         prev_airflows_at_t_steps,
         control_config
     ) -> m3_per_s:
 
+    if not isinstance(airflow_mode, str):
+        # Batch of configurations with different airflow modes (array of modes): the airflow of each mode, where it is used
+        new_airflow = 0
+        for mode in np.unique(airflow_mode):
+            mode_airflow = get_airflow(str(mode), rel_humidity, ambient_humidity_at_inside_temp, temp, ambient_data, control_recorder, prev_airflows_at_t_steps, control_config)
+            new_airflow = where(airflow_mode == mode, mode_airflow, new_airflow)
+        return new_airflow
+
     if ":" in airflow_mode:
         assert airflow_mode.split(":")[0] == "CONST" and float(airflow_mode.split(":")[1]) >= 0, f"CONST airflow mode '{airflow_mode} is not valid."
     else:
@@ -38,19 +69,28 @@ def get_airflow(
         hum_airflow: m3_per_s = abs(rel_humidity - 70) * 1
         airflow_offset = hum_airflow
     elif airflow_mode == "light_control":
-        airflow_offset = 0.5 if control_config["is_light"] else 0.05
+        airflow_offset = where(control_config["is_light"], 0.5, 0.05)
     elif "CONST" in airflow_mode:
         airflow_offset = float(airflow_mode.split(":")[1])
 
-    if airflow_offset < 0:
-        airflow_offset = 0
+    new_airflow = 0 + clip(airflow_offset, 0, 2)
 
-    if airflow_offset > 2:
-        airflow_offset = 2
+    return new_airflow
 
-    new_airflow = 0 + airflow_offset
 
-    return new_airflow
+def get_airflow_humidity_sensitivity(airflow_mode, rel_humidity: RH):
+    """
+    Derivative of `get_airflow` with respect to the relative humidity (m3/s per RH%), for the Jacobian.
+    Only the humidity control mode depends on the state; it is flat where the airflow is clipped.
+    """
+    if not isinstance(airflow_mode, str):
+        return where(airflow_mode == "humidity_control", get_airflow_humidity_sensitivity("humidity_control", rel_humidity), 0)
+
+    if airflow_mode != "humidity_control":
+        return 0 * rel_humidity
+
+    hum_airflow: m3_per_s = abs(rel_humidity - 70) * 1
+    return where((hum_airflow > 0) & (hum_airflow < 2), np.sign(rel_humidity - 70), 0)
 
 
 def derive_H2O(
@@ -65,16 +105,13 @@ def derive_H2O(
 
     # Unpack input values
     H2O_mass_evaporation_rate: g_per_s = input_values["H2O_mass_evaporation_rate"]
-    structure_volume: m3 = input_values["structure_volume"]
+    structure_volume: m3 = input_values["structure"].volume
 
     # Get mass air inflow
     mass_airflow: kg_per_s = air_density * airflow
 
     max_humidity = control_config["max_humidity"]
-    if humidity > max_humidity:
-        dehum_rate = (humidity - max_humidity) * 0.2
-    else:
-        dehum_rate = 0
+    dehum_rate: g_per_s = maximum(humidity - max_humidity, 0) * 0.2
 
     H2O_inflow: g_per_s = ambient_humidity_ratio * mass_airflow * 1000
     H2O_outflow: g_per_s = humidity_ratio * mass_airflow * 1000
@@ -85,40 +122,40 @@ def derive_H2O(
     return humidity_ratio_change_rate, dehum_rate
 
 
-def derive_temp(airflow: m3_per_s, humidity: RH, ambient_humidity_at_inside_temp: RH, temp: C, input_values, dehum_rate: g_per_s, control_config) -> C_per_s:
-    min_temp = control_config["min_temp"]
-    max_temp = control_config["max_temp"]
+def get_target_temp(ambient_humidity_at_inside_temp: RH, control_config) -> C:
+    """
+    Temperature the heat pump aims for. In dynamic mode it is lowered by the amount ambient air (warmed up to
+    the inside temperature) is drier than the humidity limit, so that ventilation can do the dehumidification.
+    """
+    RH_diff: RH = maximum(control_config["max_humidity"] - ambient_humidity_at_inside_temp, 0)
 
-    RH_diff: RH = control_config["max_humidity"] - ambient_humidity_at_inside_temp
-    if RH_diff < 0:
-        RH_diff = 0
+    # Element-wise for a batch of configurations with different temp modes
+    target_temp: C = where(control_config["temp_mode"] == "dynamic", control_config["max_temp"] - RH_diff, control_config["max_temp"])
 
-    target_temp: C = max_temp
-    if control_config["temp_mode"] == "dynamic":
-        target_temp -= RH_diff
-    
-    if target_temp < min_temp:
-        target_temp = min_temp
+    return maximum(target_temp, control_config["min_temp"])
 
-    if temp > target_temp:
-        heating_rate: J_per_s = (temp - max_temp) * -2300
-    else:
-        heating_rate: J_per_s = (target_temp - temp) * 2000
+
+def derive_temp(airflow: m3_per_s, humidity: RH, ambient_humidity_at_inside_temp: RH, temp: C, input_values, dehum_rate: g_per_s, control_config, sat_vap_pres: Pa = None) -> C_per_s:
+    max_temp = control_config["max_temp"]
+
+    target_temp: C = get_target_temp(ambient_humidity_at_inside_temp, control_config)
+
+    heating_rate: J_per_s = where(temp > target_temp, (temp - max_temp) * -2300, (target_temp - temp) * 2000)
 
     # Unpack input values
     ambient_temp = input_values["ambient_data"]["temp"]
     ambient_humidity = input_values["ambient_data"]["humidity"]
     H2O_mass_evaporation_rate = input_values["H2O_mass_evaporation_rate"]
     power_irradiated = input_values["power_irradiated"]
-    get_heat_transfer_rate = input_values["get_heat_transfer_rate"]
+    heat_transfer_coefficient: W_per_K = input_values["structure"].heat_transfer_coefficient
 
     mass_airflow: kg_per_s = air_density * airflow
 
     # Ambient air
-    enthalpy_of_airflow_in: J_per_s = get_humid_air_specific_enthalpy(ambient_temp, ambient_humidity) * mass_airflow
+    enthalpy_of_airflow_in: J_per_s = get_ambient_air_properties(ambient_temp, ambient_humidity)[1] * mass_airflow
 
     # Inside air
-    enthalpy_of_airflow_out: J_per_s = get_humid_air_specific_enthalpy(temp, humidity) * mass_airflow
+    enthalpy_of_airflow_out: J_per_s = get_humid_air_specific_enthalpy(temp, humidity, pressure, sat_vap_pres) * mass_airflow
 
     # Sunlight
     radiation_loss = 0.2
@@ -128,7 +165,7 @@ def derive_temp(airflow: m3_per_s, humidity: RH, ambient_humidity_at_inside_temp
     enthalpy_absorbed_by_air: J_per_s = enthalpy_absorbed_by_plants_and_air - enthalpy_absorbed_by_evapotranspiration
 
     # Conductive loss
-    conductive_enthalpy_loss: J_per_s = get_heat_transfer_rate(temp - ambient_temp)
+    conductive_enthalpy_loss: J_per_s = heat_transfer_coefficient * (temp - ambient_temp)
 
     # Condensation heat in dehumidifier
     condensation_heating_rate: J_per_s = water_evaporation_heat * dehum_rate
@@ -140,8 +177,7 @@ def derive_temp(airflow: m3_per_s, humidity: RH, ambient_humidity_at_inside_temp
 
 
 def derive_CO2(airflow, CO2_concentration: ppm, input_values):
-    ambient_CO2: ppm = 410
-    structure_volume = input_values["structure_volume"]
+    structure_volume: m3 = input_values["structure"].volume
     CO2_assimilation_rate: mol_per_s = input_values["CO2_assimilation_rate"]
 
     CO2_inflow: mol_per_s = ppm_to_amount(ambient_CO2, airflow)
@@ -157,34 +193,65 @@ def derive_CO2(airflow, CO2_concentration: ppm, input_values):
     return net_change_concentration, CO2_release_rate
 
 
-def airflow_model(t, y, t_max, input_values, control_register, prev_airflows_at_t_steps, control_config):
+@lru_cache(maxsize=64)
+def get_ambient_air_properties(ambient_temp: C, ambient_humidity: RH) -> (kg_H2O_per_kg_air, J_per_kg):
+    """
+    Humidity ratio and specific enthalpy of ambient air. Constant during a period, so they are cached instead of being
+    recomputed at every evaluation of the right hand side.
+    """
+    ambient_humidity_ratio: kg_H2O_per_kg_air = get_hum_ratio_from_rel_hum(ambient_temp, ambient_humidity / 100, pressure)
+    ambient_enthalpy: J_per_kg = get_humid_air_specific_enthalpy(ambient_temp, ambient_humidity, pressure)
+    return float(ambient_humidity_ratio), float(ambient_enthalpy)
+
+
+def get_humidity_state(y, input_values, report_limits=True):
+    """
+    Unpacks the measured variables and derives the relative humidity values the controls depend on.
+    The state is clipped to the range where the psychrometric functions are valid.
+    The saturation vapor pressure is computed with `input_values["get_sat_vap_pres"]` (exact or tabulated).
+    """
     # Destructure y values (== measured variables)
-    humidity_ratio, temp, CO2_concentration = y
+    y = np.asarray(y, dtype=float)
+    if y.size == 3:
+        # Single state, plain floats are much faster than 1 element arrays
+        humidity_ratio, temp, CO2_concentration = y.ravel().tolist()
+    else:
+        humidity_ratio, temp, CO2_concentration = y
 
-    # To avoid psychrolib errors
-    if humidity_ratio < 0:
-        print("Humidity ratio under limit", humidity_ratio)
-        humidity_ratio = 0
+    # To avoid invalid psychrometric values
+    if any_true(humidity_ratio < 0):
+        if report_limits: print("Humidity ratio under limit", humidity_ratio)
+        humidity_ratio = maximum(humidity_ratio, 0)
 
-    if temp < -100:
-        print("Temp under limit", temp)
-        temp = -100
-    if temp > 200:
-        print("Temp over limit", temp)
-        temp = 200
+    if any_true(temp < -100):
+        if report_limits: print("Temp under limit", temp)
+        temp = maximum(temp, -100)
+    if any_true(temp > 200):
+        if report_limits: print("Temp over limit", temp)
+        temp = minimum(temp, 200)
 
-    humidity = psychrolib.GetRelHumFromHumRatio(temp, humidity_ratio, pressure) * 100
+    sat_vap_pres: Pa = input_values["get_sat_vap_pres"](temp)
+    humidity: RH = get_rel_hum_from_hum_ratio(temp, humidity_ratio, pressure, sat_vap_pres) * 100
 
-    # To avoid psychrolib errors
-    if humidity > 100:
-        print("Humidity over limit", humidity)
-        humidity = 100
+    if any_true(humidity > 100):
+        if report_limits: print("Humidity over limit", humidity)
+        humidity = minimum(humidity, 100)
 
     # Get ambient humidity ratio and rel humidity at inside temp
     ambient_temp: C = input_values["ambient_data"]["temp"]
     ambient_humidity: RH = input_values["ambient_data"]["humidity"]
-    ambient_humidity_ratio: kg_H2O_per_kg_air = psychrolib.GetHumRatioFromRelHum(ambient_temp, ambient_humidity / 100, pressure)
-    ambient_humidity_at_inside_temp: RH = psychrolib.GetRelHumFromHumRatio(temp, ambient_humidity_ratio, pressure) * 100
+    ambient_humidity_ratio, _ = get_ambient_air_properties(ambient_temp, ambient_humidity)
+    ambient_humidity_at_inside_temp: RH = get_rel_hum_from_hum_ratio(temp, ambient_humidity_ratio, pressure, sat_vap_pres) * 100
+
+    return humidity_ratio, temp, CO2_concentration, humidity, ambient_humidity_ratio, ambient_humidity_at_inside_temp, sat_vap_pres
+
+
+def get_change_rates(y, input_values, control_recorder, prev_airflows_at_t_steps, control_config):
+    """
+    Change rates of the measured variables at state(s) y, and the control signals behind them (in the order of
+    `ControlRecorder.signal_names`).
+    """
+    humidity_ratio, temp, CO2_concentration, humidity, ambient_humidity_ratio, ambient_humidity_at_inside_temp, sat_vap_pres = get_humidity_state(y, input_values)
 
     # Determine airflow
     airflow = get_airflow(
@@ -193,7 +260,7 @@ def airflow_model(t, y, t_max, input_values, control_register, prev_airflows_at_
         ambient_humidity_at_inside_temp, 
         temp, 
         input_values["ambient_data"], 
-        control_register, 
+        control_recorder, 
         prev_airflows_at_t_steps,
         control_config
     )
@@ -216,24 +283,1132 @@ def airflow_model(t, y, t_max, input_values, control_register, prev_airflows_at_
         temp, 
         input_values, 
         dehum_rate, 
-        control_config
+        control_config,
+        sat_vap_pres
     )
 
     CO2_concentration_change_rate, CO2_release_rate = derive_CO2(airflow, CO2_concentration, input_values)
 
-    # Avoid duplicates to ensure strictly monotonically increasing list as it is a requirement of InterpolatedUnivariateSpline
-    if t not in [x["t"] for x in control_register]: 
-        control_register.append({
-            "t": t,
-            "dehum_rate_g_per_s": dehum_rate,
-            "heating_rate_J_per_s": heating_rate,
-            "CO2_release_rate_mol_per_s": CO2_release_rate,
-            "airflow_m3_per_s": airflow,
-            "ambient_humidity_at_inside_temp_RH": ambient_humidity_at_inside_temp,     
-        })
-
-    return [
-        humidity_ratio_change_rate, 
-        temp_change_rate, 
-        CO2_concentration_change_rate, 
-    ]
+    change_rates = (humidity_ratio_change_rate, temp_change_rate, CO2_concentration_change_rate)
+    control_signals = (dehum_rate, heating_rate, CO2_release_rate, airflow, ambient_humidity_at_inside_temp)
+    return change_rates, control_signals
+
+
+def airflow_model(t, y, t_max, input_values, control_recorder, prev_airflows_at_t_steps, control_config):
+    change_rates, control_signals = get_change_rates(y, input_values, control_recorder, prev_airflows_at_t_steps, control_config)
+
+    # Control signals are only recorded for single states: a batch of states (vectorized call) is not a step of the solver
+    is_single_state = is_scalar(control_signals[1])
+
+    if control_recorder is not None and is_single_state:
+        control_recorder.record(t, control_signals)
+
+    # Keep the shape of y: (3,) or (3, 1) for a single state, (3, k) for a batch
+    if not is_single_state:
+        change_rates = np.broadcast_arrays(*change_rates)
+    return np.array(change_rates, dtype=float).reshape(np.shape(y))
+
+
+def stack_gradient(d_humidity_ratio, d_temp, d_CO2_concentration):
+    """
+    Gradient with respect to (humidity ratio, temp, CO2 concentration), shape (3,) for a single state or (3, k) for a batch.
+    """
+    if is_scalar(d_humidity_ratio) and is_scalar(d_temp) and is_scalar(d_CO2_concentration):
+        return np.array([d_humidity_ratio, d_temp, d_CO2_concentration], dtype=float)
+    return np.array(np.broadcast_arrays(d_humidity_ratio, d_temp, d_CO2_concentration), dtype=float)
+
+
+def airflow_model_jacobian(t, y, t_max, input_values, control_recorder, prev_airflows_at_t_steps, control_config):
+    """
+    Analytic Jacobian of `airflow_model` with respect to (humidity ratio, temp, CO2 concentration), so that the
+    BDF solver does not have to estimate it with finite differences. Takes the same arguments as `airflow_model`.
+
+    Piecewise terms (clipped state, saturated humidity, airflow limits, dehumidification, heating mode)
+    are differentiated on the branch that is active at y, like the right hand side evaluates them.
+
+    Returns
+    -------
+    jacobian : ndarray, shape (3, 3), or (3, 3, k) for a batch of k states
+        jacobian[i, j] = d(change rate of variable i) / d(variable j)
+    """
+    humidity_ratio, temp, CO2_concentration, humidity, ambient_humidity_ratio, ambient_humidity_at_inside_temp, sat_vap_pres = get_humidity_state(y, input_values, report_limits=False)
+    y = np.asarray(y, dtype=float)
+    if y.size == 3:
+        raw_humidity_ratio, raw_temp, _ = y.ravel().tolist()
+    else:
+        raw_humidity_ratio, raw_temp, _ = y
+
+    # Unpack input values
+    ambient_temp = input_values["ambient_data"]["temp"]
+    ambient_humidity = input_values["ambient_data"]["humidity"]
+    structure_volume: m3 = input_values["structure"].volume
+    UA: W_per_K = input_values["structure"].heat_transfer_coefficient
+
+    max_humidity: RH = control_config["max_humidity"]
+    max_temp: C = control_config["max_temp"]
+
+    airflow = get_airflow(control_config["airflow_mode"], humidity, ambient_humidity_at_inside_temp, temp, input_values["ambient_data"], control_recorder, prev_airflows_at_t_steps, control_config)
+    mass_airflow: kg_per_s = air_density * airflow
+
+    # Derivatives of the clipped state with respect to y
+    d_humidity_ratio = where(raw_humidity_ratio >= 0, 1., 0.)
+    d_temp = where((raw_temp >= -100) & (raw_temp <= 200), 1., 0.)
+
+    # Relative humidity: RH = 100 * Pw(W) / Pws(T), constant once saturated
+    d_ln_sat_vap_pres = get_sat_vap_pres_log_derivative(temp)
+    is_saturated = humidity >= 100
+    bounded_humidity_ratio = maximum(humidity_ratio, MIN_HUM_RATIO)
+    d_humidity_d_W = where(is_saturated | (humidity_ratio < MIN_HUM_RATIO), 0., 
+        100 * pressure * MOLECULAR_WEIGHT_RATIO / (MOLECULAR_WEIGHT_RATIO + bounded_humidity_ratio)**2 / sat_vap_pres)
+    d_humidity_d_T = where(is_saturated, 0., -humidity * d_ln_sat_vap_pres)
+    d_humidity = stack_gradient(d_humidity_d_W * d_humidity_ratio, d_humidity_d_T * d_temp, 0)
+
+    d_ambient_humidity_at_inside_temp = stack_gradient(0, -ambient_humidity_at_inside_temp * d_ln_sat_vap_pres * d_temp, 0)
+
+    # Airflow and dehumidification
+    d_airflow = get_airflow_humidity_sensitivity(control_config["airflow_mode"], humidity) * d_humidity
+    d_mass_airflow = air_density * d_airflow
+    d_dehum_rate = where(humidity > max_humidity, 0.2, 0.) * d_humidity
+
+    # Inside air enthalpy: h(T, W') where W' = W, or the saturation humidity ratio of T once saturated
+    inside_humidity_ratio = get_hum_ratio_from_rel_hum(temp, humidity / 100, pressure, sat_vap_pres)
+    d_inside_humidity_ratio = where(
+        is_saturated,
+        stack_gradient(0, MOLECULAR_WEIGHT_RATIO * pressure * sat_vap_pres * d_ln_sat_vap_pres / (pressure - sat_vap_pres)**2 * d_temp, 0),
+        stack_gradient(where(humidity_ratio > MIN_HUM_RATIO, d_humidity_ratio, 0.), 0, 0)
+    )
+    inside_enthalpy: J_per_kg = get_moist_air_enthalpy(temp, inside_humidity_ratio)
+    d_inside_enthalpy = 1000 * ((1.006 + 1.86 * inside_humidity_ratio) * stack_gradient(0, d_temp, 0) + (2501 + 1.86 * temp) * d_inside_humidity_ratio)
+    _, ambient_enthalpy = get_ambient_air_properties(ambient_temp, ambient_humidity)
+
+    # Heating
+    target_temp: C = get_target_temp(ambient_humidity_at_inside_temp, control_config)
+    is_target_lowered = (control_config["temp_mode"] == "dynamic") & (max_humidity > ambient_humidity_at_inside_temp) \
+        & (max_temp - (max_humidity - ambient_humidity_at_inside_temp) > control_config["min_temp"])
+    d_target_temp = where(is_target_lowered, d_ambient_humidity_at_inside_temp, 0.)
+    d_heating_rate = where(temp > target_temp, -2300 * stack_gradient(0, d_temp, 0), 2000 * (d_target_temp - stack_gradient(0, d_temp, 0)))
+
+    # d(humidity ratio change rate)
+    d_H2O = ((ambient_humidity_ratio - humidity_ratio) * 1000 * d_mass_airflow - stack_gradient(d_humidity_ratio, 0, 0) * mass_airflow * 1000 - d_dehum_rate) / 1000 / structure_volume * air_density
+
+    # d(temp change rate)
+    d_enthalpy = (ambient_enthalpy - inside_enthalpy) * d_mass_airflow - d_inside_enthalpy * mass_airflow \
+        - UA * stack_gradient(0, d_temp, 0) + water_evaporation_heat * d_dehum_rate + d_heating_rate
+
+    # d(CO2 concentration change rate)
+    # The dilution rate has the shape of the state, also when the airflow is shared by a whole batch of states
+    dilution_rate = amount_to_ppm(ppm_to_amount(1, airflow), structure_volume) + 0 * CO2_concentration
+    d_CO2 = amount_to_ppm(ppm_to_amount(ambient_CO2 - CO2_concentration, d_airflow), structure_volume) \
+        - stack_gradient(0, 0, dilution_rate)
+
+    return np.array(np.broadcast_arrays(d_H2O, d_enthalpy, d_CO2))
+
+
+def get_batch_value(values):
+    """
+    Input value or control config entry of a batch of configurations: the value itself if all configurations share it
+    (which keeps the cheaper scalar code paths, e.g. for a single airflow mode), else an array of the values.
+    """
+    if all(value == values[0] for value in values):
+        return values[0]
+    return np.array(values)
+
+
+def stack_batch_rows(rows, batch_size):
+    """
+    Stacks values of a batch of configurations into an array of shape (len(rows), batch_size). Values shared by all
+    configurations (e.g. the airflow of a single CONST mode) are broadcast.
+    """
+    stacked_rows = np.empty((len(rows), batch_size))
+    for row_index, row in enumerate(rows):
+        stacked_rows[row_index] = row
+    return stacked_rows
+
+
+def batch_airflow_model(t, y, t_max, input_values, control_recorder, prev_airflows_at_t_steps, control_config):
+    """
+    `airflow_model` of a batch of N greenhouse configurations, integrated as one ODE system. y is the flattened (3, N)
+    state: the humidity ratios, then the temps, then the CO2 concentrations of the configurations. Input values and
+    control config entries are arrays of N values, or values shared by all configurations.
+
+    The control signals of all configurations are recorded at once, in a `ControlRecorder` of the same batch size.
+    In a vectorized call, y has shape (3 N, k) for k states of the batch, which are not recorded (see `airflow_model`).
+    """
+    state_count = 1 if np.ndim(y) == 1 else np.shape(y)[1]
+    if state_count == 1:
+        states = np.reshape(y, (3, -1))
+    else:
+        # (3, k, N): the configurations on the last axis, along which the input values and control config arrays broadcast
+        states = np.reshape(y, (3, -1, state_count)).transpose(0, 2, 1)
+    batch_size = states.shape[-1]
+    change_rates, control_signals = get_change_rates(states, input_values, control_recorder, prev_airflows_at_t_steps, control_config)
+
+    if state_count > 1:
+        change_rates = np.array([np.broadcast_to(change_rate, (state_count, batch_size)) for change_rate in change_rates])
+        return change_rates.transpose(0, 2, 1).reshape(np.shape(y))
+
+    if control_recorder is not None:
+        control_recorder.record(t, stack_batch_rows(control_signals, batch_size))
+
+    return stack_batch_rows(change_rates, batch_size).reshape(np.shape(y))
+
+
+def batch_airflow_model_jacobian(t, y, t_max, input_values, control_recorder, prev_airflows_at_t_steps, control_config):
+    """
+    Jacobian of `batch_airflow_model`. The configurations do not interact, so it is block diagonal (a 3 x 3 block per
+    configuration, interleaved by the state layout) and returned as a sparse matrix, which the BDF solver factorizes
+    in O(N) instead of O(N^3).
+    """
+    states = np.reshape(y, (3, -1))
+    batch_size = states.shape[1]
+    jacobian = np.broadcast_to(np.reshape(airflow_model_jacobian(t, states, t_max, input_values, None, prev_airflows_at_t_steps, control_config), (3, 3, -1)), (3, 3, batch_size))
+
+    # jacobian[i, j, n] is the derivative of variable i with respect to variable j of configuration n
+    rows, columns, members = np.meshgrid(np.arange(3), np.arange(3), np.arange(batch_size), indexing="ij")
+    return csc_matrix(
+        (jacobian.ravel(), (rows.ravel() * batch_size + members.ravel(), columns.ravel() * batch_size + members.ravel())), 
+        shape=(3 * batch_size, 3 * batch_size)
+    )
+
+
+def get_period_index(t: s, time_period: s, period_count: int) -> int:
+    # Period k is (k * time_period, (k + 1) * time_period]: boundaries belong to the period they end, like the
+    # climate sampled at them (and the control signals recorded there, see `ControlRecorder.get_results`)
+    return min(max(math.ceil(t / time_period) - 1, 0), period_count - 1)
+
+
+def continuous_airflow_model(t, y, time_period, period_input_values, period_control_configs, control_recorder=None, is_batch=False):
+    """
+    `airflow_model` (or `batch_airflow_model`) over a horizon of consecutive periods, with piecewise constant inputs:
+    at time t, the input values and control config of the period t falls into are used.
+    """
+    period_index = get_period_index(t, time_period, len(period_input_values))
+    model = batch_airflow_model if is_batch else airflow_model
+    return model(t, y, time_period, period_input_values[period_index], control_recorder, None, period_control_configs[period_index])
+
+
+def continuous_airflow_model_jacobian(t, y, time_period, period_input_values, period_control_configs, control_recorder=None, is_batch=False):
+    period_index = get_period_index(t, time_period, len(period_input_values))
+    model_jacobian = batch_airflow_model_jacobian if is_batch else airflow_model_jacobian
+    return model_jacobian(t, y, time_period, period_input_values[period_index], None, None, period_control_configs[period_index])
+
+
+# Largest change of the inputs of the climate model over periods merged into one step, see `Greenhouse.run_adaptive`
+merge_tolerances = {
+    "ambient_temp": 0.5, # C
+    "ambient_humidity": 2, # RH
+    "power_irradiated": 50, # W
+    "crop_rates": 0.1, # relative change of the H2O evaporation and CO2 assimilation rates of the crop
+}
+
+
+def get_mean_input_values(period_input_values) -> dict:
+    """
+    Input values of `airflow_model` averaged over consecutive periods, to solve them as one step.
+    """
+    def get_mean(get_value):
+        return float(np.mean([get_value(input_values) for input_values in period_input_values]))
+
+    return {
+        **period_input_values[0],
+        "H2O_mass_evaporation_rate": get_mean(lambda input_values: input_values["H2O_mass_evaporation_rate"]),
+        "CO2_assimilation_rate": get_mean(lambda input_values: input_values["CO2_assimilation_rate"]),
+        "ambient_data": {
+            "temp": get_mean(lambda input_values: input_values["ambient_data"]["temp"]),
+            "humidity": get_mean(lambda input_values: input_values["ambient_data"]["humidity"]),
+        },
+        "power_irradiated": get_mean(lambda input_values: input_values["power_irradiated"]),
+    }
+
+
+def get_merged_segments(period_input_values, is_single, tolerances=merge_tolerances, max_merged_periods=12) -> list:
+    """
+    Splits consecutive periods into segments (start, stop) of periods solved as one step (see `Greenhouse.run_adaptive`).
+    A period is merged into the segment before it unless one of them must be solved on its own (`is_single`), the
+    segment already has `max_merged_periods` periods, or an input of the climate model changed by more than its
+    tolerance since the start of the segment.
+    """
+    ambient_temps: C = np.array([input_values["ambient_data"]["temp"] for input_values in period_input_values])
+    ambient_humidities: RH = np.array([input_values["ambient_data"]["humidity"] for input_values in period_input_values])
+    powers_irradiated: W = np.array([input_values["power_irradiated"] for input_values in period_input_values])
+    crop_rates = np.array([[input_values["H2O_mass_evaporation_rate"], input_values["CO2_assimilation_rate"]] for input_values in period_input_values])
+
+    segments = []
+    start = 0
+    for index in range(1, len(period_input_values)):
+        is_merged = (
+            not is_single[start]
+            and not is_single[index]
+            and index - start < max_merged_periods
+            and abs(ambient_temps[index] - ambient_temps[start]) <= tolerances["ambient_temp"]
+            and abs(ambient_humidities[index] - ambient_humidities[start]) <= tolerances["ambient_humidity"]
+            and abs(powers_irradiated[index] - powers_irradiated[start]) <= tolerances["power_irradiated"]
+            and np.all(np.abs(crop_rates[index] - crop_rates[start]) <= tolerances["crop_rates"] * np.abs(crop_rates[start]))
+        )
+        if not is_merged:
+            segments.append((start, index))
+            start = index
+    segments.append((start, len(period_input_values)))
+
+    return segments
+
+
+
+class Greenhouse:
+    def __init__(self, 
+        resample_period: s,
+        airflow_mode="CONST:0.1",
+        temp_mode="const",
+        min_temp=17,
+        max_temp=27,
+        max_humidity=70,
+        block_sunlight=False,
+        roof_panel_type="polycarbonate",
+        crop_cohort_count=None,
+        history_mode="latest",
+        psychrometrics="exact",
+        control_policy="last",
+        step_energy_results=True,
+        barrel_light_model="surface_estimate"
+    ):
+        # Constructor arguments, to create greenhouses of the same configuration from a checkpoint (see `from_checkpoint`)
+        self.config = {
+            "resample_period": resample_period,
+            "airflow_mode": airflow_mode,
+            "temp_mode": temp_mode,
+            "min_temp": min_temp,
+            "max_temp": max_temp,
+            "max_humidity": max_humidity,
+            "block_sunlight": block_sunlight,
+            "roof_panel_type": roof_panel_type,
+            "crop_cohort_count": crop_cohort_count,
+            "history_mode": history_mode,
+            "psychrometrics": psychrometrics,
+            "control_policy": control_policy,
+            "step_energy_results": step_energy_results,
+            "barrel_light_model": barrel_light_model,
+        }
+
+        self.time_period: s = pd.to_timedelta(resample_period).total_seconds()
+
+        self.min_temp: C = min_temp
+        self.max_temp: C = max_temp
+        self.max_humidity: RH = max_humidity
+
+        # Supported values: humidity_control, light_control, CONST:{float}
+        self.airflow_mode: str = airflow_mode
+
+        # Supported values: dynamic or else
+        self.temp_mode: str = temp_mode
+
+        # Supported values: True, False
+        self.block_sunlight = block_sunlight
+
+        # Supported values: insolight, solarbrite, polycarbonate
+        self.roof_panel_type = roof_panel_type
+
+        # Supported values: latest, ring:{int}, every:{int} (see `History`)
+        self.history_mode = history_mode
+
+        # Supported values: exact (psychrolib formulas), tabulated (faster, see `get_sat_vap_pres_tabulated` for its error)
+        assert psychrometrics in ["exact", "tabulated"], f"Psychrometrics '{psychrometrics}' is not supported."
+        self.psychrometrics = psychrometrics
+        self.get_sat_vap_pres = get_sat_vap_pres_tabulated if psychrometrics == "tabulated" else get_sat_vap_pres
+
+        # Supported values: last, mean, final (which control signal values are reported for a period, see `ControlRecorder`)
+        self.control_recorder = ControlRecorder(control_policy)
+
+        # Whether `run` adds the energy used by the fan, heat pump and dehumidifier to its results. They can also be
+        # computed afterwards for all steps at once from the control signals, see `add_step_energy`.
+        self.step_energy_results = step_energy_results
+
+        # Init subsystems
+        self.structure = Structure(roof_panel_type=self.roof_panel_type)
+        self.dehumidifier = Dehumidifier()
+        self.heatpump = HeatPump()
+        self.fan = Fan()
+        self.crop = SweetBasil(
+            time_period=self.time_period, 
+            plants_per_barrel=self.structure.plants_per_barrel, 
+            barrel_count=self.structure.barrel_count,
+            cohort_count=crop_cohort_count,
+            history_mode=self.history_mode
+        )
+        # Supported values: surface_estimate, rotation, faces (natural light on the barrels, see `AdaptiveLighting`)
+        self.light = AdaptiveLighting(self.time_period, self.structure, self.crop, roof_panel_type=roof_panel_type, history_mode=self.history_mode, barrel_light_model=barrel_light_model)
+
+        # Init register to store previous period's values
+        self.prev_period = {
+            "humidity_ratio": 0.0085881067, # 70 RH at 1 bar and 25 Celsius
+            "temp": 17,
+            "CO2_concentration": 410,
+        }
+
+        self.prev_airflows_at_t_steps = History(self.history_mode)
+
+        # KPIs updated at every step, see `track_kpis`
+        self.kpis = None
+
+        # Wall time of the subsystems and solver statistics, see `enable_profiling`
+        self.profiler = disabled_profiler
+
+
+    def track_kpis(self, integration="step", rollups=()):
+        """
+        Starts accumulating the KPIs (energy, cost, harvest, climate statistics) of the following steps of `run`,
+        `run_continuous` and `GreenhouseBatch.run` in a `KPIAccumulator`, which is returned and kept in `kpis`.
+        The results of the steps do not need to be kept to report them.
+        """
+        self.kpis = KPIAccumulator(self, integration, rollups)
+        return self.kpis
+
+
+    def update_kpis(self, timestamp, results):
+        if self.kpis is not None:
+            self.kpis.update(timestamp, results)
+
+
+    def enable_profiling(self, callback=None, keep_records=True):
+        """
+        Starts recording the wall time of each subsystem at each step (structure irradiance, solar panel, lighting,
+        crop, ODE solver, equipment energy) and the statistics of each `solve_ivp` call in a `Profiler`, which is
+        returned and kept in `profiler`. See `Profiler` for the `callback` and `keep_records` arguments.
+
+        Open loop inputs precomputed with `get_open_loop_inputs` are recorded once for all rows, outside of steps.
+        A `run_continuous` solve is recorded at the step of its first period.
+        """
+        self.profiler = Profiler(callback, keep_records)
+        return self.profiler
+
+
+    def disable_profiling(self):
+        self.profiler = disabled_profiler
+
+
+    def get_checkpoint(self) -> dict:
+        """
+        Complete simulation state of the greenhouse (climate at the end of the last period, crop and lighting and
+        airflow registers) and its configuration. Everything is copied, so the checkpoint is unaffected by further
+        runs, and it only holds floats and small NumPy arrays, so it pickles compactly.
+
+        A checkpoint is resumed with `restore_checkpoint`, or forked into greenhouses of other configurations with
+        `from_checkpoint` and `fork`, e.g. to simulate what-if branches from a shared simulated prefix.
+        """
+        return {
+            "config": dict(self.config),
+            "prev_period": dict(self.prev_period),
+            "prev_airflows_at_t_steps": self.prev_airflows_at_t_steps.get_state(),
+            "crop": self.crop.get_state(),
+            "lighting_dimmer": self.light.light.dimmer.get_state(),
+        }
+
+
+    def restore_checkpoint(self, checkpoint):
+        """
+        Sets the simulation state of the greenhouse to the one of a checkpoint, keeping its own configuration.
+        Its `crop_cohort_count` and `history_mode` must be the same as in the checkpoint.
+        """
+        self.prev_period = dict(checkpoint["prev_period"])
+        self.prev_airflows_at_t_steps.set_state(checkpoint["prev_airflows_at_t_steps"])
+        self.crop.set_state(checkpoint["crop"])
+        self.light.light.dimmer.set_state(checkpoint["lighting_dimmer"])
+
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint, **config):
+        """
+        Creates a greenhouse in the state of a checkpoint, with the configuration of the checkpointed greenhouse except
+        for the constructor arguments given, e.g. `Greenhouse.from_checkpoint(checkpoint, max_humidity=60)`.
+        """
+        greenhouse = cls(**{**checkpoint["config"], **config})
+        greenhouse.restore_checkpoint(checkpoint)
+        return greenhouse
+
+
+    def fork(self, configs):
+        """
+        Creates one greenhouse per dict of constructor arguments in `configs`, each continuing from the current state
+        of this greenhouse (which is unchanged) with those arguments changed, see `from_checkpoint`.
+        """
+        checkpoint = self.get_checkpoint()
+        return [type(self).from_checkpoint(checkpoint, **config) for config in configs]
+
+
+    def get_open_loop_inputs(self, df):
+        """
+        Computes the inputs of `run` which do not depend on the state of the greenhouse climate (irradiance on the structure,
+        solar panel output, natural and supplemented light) for every row of a weather dataframe in one vectorized pass.
+
+        Returns
+        -------
+        df : pd.DataFrame
+            Copy of `df` extended with the open-loop inputs as columns. Its rows can be passed to `run` directly.
+        """
+        timestamps = df.index
+        irradiance: W_per_m2 = df["solarradiation"].to_numpy(dtype=float)
+
+        # SECTION 1: Get input from solar radiation
+        # Get distribution of irradiance on different panels (solar and non-solar) of the greenhouse (factoring in sun position, tilt and azimuth angles)
+        with self.profiler.measure("structure_irradiance", len(df)):
+            results: [W, W_per_m2] = self.structure.get_irradiance_by_panel_type(timestamps, irradiance)
+        solar_power_on_nonsolar_panels, irradiance_on_solar_panels = results
+
+        # Get electrical energy generated and heat irradiated to the greenhouse
+        with self.profiler.measure("solar_panel", len(df)):
+            results: [W, W, W_per_m2] = self.light.solarpanel.run(irradiance_on_solar_panels)
+        solar_power_generated, solar_power_transmitted, transparency = results
+        solar_energy_generated: kWh = J_to_kWh(solar_power_generated * self.time_period)
+
+        # ASSUMPTION: roof and front wall has the same transparency (not true if solar panels are installed only on roof)
+        transmitted_irradiance: W_per_m2 = irradiance * transparency
+
+        if self.block_sunlight:
+            transmitted_irradiance = np.zeros(len(df))
+
+        # Calculate energy used for lighting
+        PPFD: umol_per_m2_s = irradiance_to_PPFD(transmitted_irradiance)
+        PAR_inside: umol_per_m2 = PPFD * self.time_period
+        with self.profiler.measure("lighting", len(df)):
+            lighting_results = self.light.run(timestamps, PAR_inside, self.structure.coordinates)
+
+        return df.assign(
+            natural_PPFD=PPFD,
+            solar_energy_generated_kWh=solar_energy_generated,
+            power_irradiated_W=transmitted_irradiance * self.structure.compiled.irradiated_area,
+            **lighting_results
+        )
+
+
+    def run(self, timestamp, data):
+        self.profiler.set_step(timestamp)
+        with self.profiler.measure("step"):
+            # Compute open-loop inputs for this row alone if they were not precomputed with `get_open_loop_inputs`
+            if "power_irradiated_W" not in data:
+                data = self.get_open_loop_inputs(pd.DataFrame([data], index=pd.DatetimeIndex([timestamp]))).iloc[0]
+
+            input_values, period_results = self.get_period_inputs(data)
+            airflow_results = self.register_airflow(input_values, is_light=period_results["target_PAR"] != 0)
+
+            results = self.get_period_results(data, period_results, airflow_results)
+            self.update_kpis(timestamp, results)
+        self.profiler.set_step(None)
+
+        return results
+
+
+    def run_continuous(self, df):
+        """
+        Alternative to calling `run` row by row: simulates all rows of a weather dataframe, integrating the greenhouse
+        climate over the whole horizon as one ODE problem instead of restarting the solver every period.
+
+        The crop, lighting and weather inputs do not depend on the climate, so they are computed for all periods first
+        and used as piecewise constant inputs of the ODE. The climate is sampled at the end of each period.
+
+        Returns
+        -------
+        results : pd.DataFrame
+            Same columns as the results of `run`, one row per row of `df`.
+        """
+        if "power_irradiated_W" not in df:
+            df = self.get_open_loop_inputs(df)
+
+        period_inputs = self.get_all_period_inputs(df)
+        period_input_values = [input_values for input_values, _ in period_inputs]
+        is_light_values = [period_results["target_PAR"] != 0 for _, period_results in period_inputs]
+
+        self.profiler.set_step(df.index[0])
+        airflow_results = self.register_airflow_continuous(period_input_values, is_light_values)
+
+        return self.collect_results(df, period_inputs, airflow_results)
+
+
+    def run_adaptive(self, df, tolerances=None, max_merged_periods=12, refine_period_count=1):
+        """
+        Alternative to calling `run` row by row which coarsens steady periods: consecutive rows of a weather dataframe
+        whose climate model inputs (ambient temperature and humidity, irradiated power, crop evaporation and
+        assimilation) change less than `tolerances` (see `merge_tolerances`) are solved as one step of up to
+        `max_merged_periods` rows, with their inputs averaged, e.g. at night.
+
+        Rows with a harvest, and the `refine_period_count` rows before and after a lighting switch (which also
+        switches the control setpoints) or a sunrise or sunset, are solved one by one like with `run`.
+
+        The crop and lighting still advance row by row, and the climate is reported at the end of every row,
+        interpolated within merged steps from the dense output of the solver.
+
+        Returns
+        -------
+        results : pd.DataFrame
+            Same columns as the results of `run`, one row per row of `df`.
+        """
+        assert refine_period_count >= 1, "The rows on both sides of a transition must be solved on their own."
+        tolerances = {**merge_tolerances, **(tolerances or {})}
+
+        if "power_irradiated_W" not in df:
+            df = self.get_open_loop_inputs(df)
+
+        period_inputs = self.get_all_period_inputs(df)
+        period_input_values = [input_values for input_values, _ in period_inputs]
+        is_light_values = np.array([period_results["target_PAR"] != 0 for _, period_results in period_inputs])
+        is_harvest = np.array([period_results["harvested_plant_count"] > 0 for _, period_results in period_inputs])
+        is_daylight = df["natural_PPFD"].to_numpy() > 0
+
+        # Refine around sunrise, sunset and lighting switches: the rows on both sides of a transition are not merged
+        is_single = is_harvest.copy()
+        is_transition = (is_light_values[1:] != is_light_values[:-1]) | (is_daylight[1:] != is_daylight[:-1])
+        for index in np.flatnonzero(is_transition) + 1:
+            is_single[max(index - refine_period_count, 0):index + refine_period_count] = True
+
+        airflow_results = []
+        for start, stop in get_merged_segments(period_input_values, is_single, tolerances, max_merged_periods):
+            self.profiler.set_step(df.index[start])
+            if stop - start == 1:
+                airflow_results.append(self.register_airflow(period_input_values[start], is_light_values[start]))
+            else:
+                airflow_results.extend(self.register_airflow_merged(period_input_values[start:stop], is_light_values[start]))
+
+        return self.collect_results(df, period_inputs, airflow_results)
+
+
+    def get_all_period_inputs(self, df) -> list:
+        """
+        Inputs of the climate model and crop, lighting and energy results of every row (see `get_period_inputs`).
+        """
+        period_inputs = []
+        for timestamp, data in df.iterrows():
+            self.profiler.set_step(timestamp)
+            period_inputs.append(self.get_period_inputs(data))
+        return period_inputs
+
+
+    def collect_results(self, df, period_inputs, airflow_results) -> pd.DataFrame:
+        """
+        Results of every row of `df`, from its period inputs and the climate solved for it.
+        """
+        collector = ResultCollector(self.get_result_schema(), len(df), df.index)
+        for (timestamp, data), (_, period_results), period_airflow_results in zip(df.iterrows(), period_inputs, airflow_results):
+            self.profiler.set_step(timestamp)
+            results = self.get_period_results(data, period_results, period_airflow_results)
+            self.update_kpis(timestamp, results)
+            collector.append(results)
+        self.profiler.set_step(None)
+
+        return collector.to_dataframe()
+
+
+    def get_result_schema(self):
+        """
+        Names and dtypes of the results of `run` (and `run_continuous`), to collect them with a `ResultCollector`.
+        """
+        return {
+            # Crop and energy
+            "harvested_weight_g": float,
+            "harvested_plant_count": int,
+            "natural_PPFD": float,
+            "total_energy_used_kWh": float,
+            "total_energy_generated_kWh": float,
+            "net_energy_kWh": float,
+            "CO2_assimilation_rate_umol_per_s": float,
+            **{key: float for key in self.light.result_keys},
+
+            # Climate and control signals
+            "humidity": float,
+            "humidity_ratio": float,
+            "temp": float,
+            "CO2_concentration": float,
+            "t": float,
+            **{name: float for name in ControlRecorder.signal_names},
+
+            "ambient_humidity": float,
+            "ambient_temp": float,
+            "ambient_light_umol_per_m2_s": float,
+
+            **({key: float for key in step_energy_keys} if self.step_energy_results else {}),
+        }
+
+
+    def get_period_inputs(self, data):
+        """
+        Grows the crop for one period and collects the inputs of the climate model. None of them depend on the
+        greenhouse climate.
+
+        Returns
+        -------
+        input_values : dict
+            Inputs of `airflow_model` for the period.
+        period_results : dict
+            Crop, lighting and energy results of the period.
+        """
+        lighting_results = {key: data[key] for key in self.light.result_keys}
+
+        # SECTION 2: Grow plants
+        with self.profiler.measure("crop_grow"):
+            results: [g, int, mol_per_s, mol, mol_per_s, mol] = self.crop.grow(1e-6 * lighting_results["actual_PPFD_umol_per_m2_s"] * self.time_period)
+        harvested_weight, harvested_plant_count, CO2_assimilation_rate, CO2_assimilated, H20_evaporation_rate, H2O_evaporated = results
+
+        # SECTION 3: Deal with resulting CO2, water, heat
+        # Calculate net energy
+        total_energy_used: kWh = lighting_results["energy_used_by_lighting_kWh"] #+ energy_for_dehumidification + energy_for_heating
+        total_energy_generated: kWh = data["solar_energy_generated_kWh"]
+        net_energy: kWh = total_energy_generated - total_energy_used
+
+        input_values = {
+            "H2O_mass_evaporation_rate": 18 * H20_evaporation_rate, # 18: molar mass of H20
+            "CO2_assimilation_rate": CO2_assimilation_rate,
+            # Plain floats instead of the pandas row, as the ODE right hand side reads them at every evaluation
+            "ambient_data": {"temp": float(data["temp"]), "humidity": float(data["humidity"])}, 
+            "power_irradiated": data["power_irradiated_W"],
+            # Numeric form of the structure (heat transfer coefficient, volume), see `CompiledStructure`
+            "structure": self.structure.compiled,
+            "get_sat_vap_pres": self.get_sat_vap_pres,
+        }
+
+        return input_values, {
+            "harvested_weight_g": harvested_weight,
+            "harvested_plant_count": harvested_plant_count,
+            "natural_PPFD": data["natural_PPFD"],
+            "total_energy_used_kWh": total_energy_used,
+            "total_energy_generated_kWh": total_energy_generated,
+            "net_energy_kWh": net_energy,
+
+            "CO2_assimilation_rate_umol_per_s": CO2_assimilated / self.time_period * 1e6,
+
+            **lighting_results,
+        }
+
+
+    def get_period_results(self, data, period_results, airflow_results):
+        results = {
+            **period_results,
+            **airflow_results,
+            
+            "ambient_humidity": data.humidity,
+            "ambient_temp": data.temp,
+            "ambient_light_umol_per_m2_s": data.solarradiation * 2.1,
+        }
+        if not self.step_energy_results:
+            return results
+
+        with self.profiler.measure("equipment_energy"):
+            energy_used_by_dehum_J, _ = self.dehumidifier.run(airflow_results["dehum_rate_g_per_s"] * self.time_period)
+            energy_used_by_fan_J = self.fan.get_energy_usage(airflow_results["airflow_m3_per_s"] * self.time_period)
+            energy_used_by_heating_J = self.heatpump.get_energy_usage(airflow_results["heating_rate_J_per_s"] * self.time_period)
+        
+        return {
+            **results,
+
+            "energy_used_by_fan_J": energy_used_by_fan_J,
+            "energy_used_by_heating_J": energy_used_by_heating_J,
+            "energy_used_by_dehum_J": energy_used_by_dehum_J,
+        }
+
+
+    def get_control_config(self, is_light):
+        return {
+            "airflow_mode": self.airflow_mode,
+            "temp_mode": self.temp_mode,
+            "min_temp": self.min_temp,
+            "max_temp": self.max_temp,
+            "max_humidity": self.max_humidity,
+            "is_light": is_light,
+        }
+
+
+    def register_airflow(self, input_values, is_light):
+        # Set up initial values for odeint
+        init_values = [
+            self.prev_period["humidity_ratio"], 
+            self.prev_period["temp"], 
+            self.prev_period["CO2_concentration"]
+        ]
+
+        # Stores the control signals at the t values of each integration step
+        self.control_recorder.reset()
+        control_recorder = self.get_solver_control_recorder()
+
+        # Only the state at the end of the period is used, so the solver reports its own steps without a dense interpolant
+        t_max: s = self.time_period
+
+        # Set up control signal config
+        control_config = self.get_control_config(is_light)
+
+        # Solve diff equations
+        with self.profiler.measure("solve_ivp"):
+            results = solve_ivp(
+                airflow_model, 
+                (0, t_max,), 
+                init_values, 
+                method="BDF", 
+                jac=airflow_model_jacobian,
+                vectorized=True,
+                args=(t_max, input_values, control_recorder, self.prev_airflows_at_t_steps, control_config)
+            )
+        self.profiler.record_solver(results)
+
+        new_values = results["y"].T[-1]
+        if self.control_recorder.policy == "final":
+            self.record_final_controls(t_max, new_values, input_values, control_config)
+
+        control_results = self.control_recorder.get_results(0, t_max)
+
+        return self.register_period_end(new_values, control_results)
+
+
+    def register_airflow_continuous(self, period_input_values, is_light_values):
+        """
+        Solves the climate of consecutive periods as one ODE problem, starting from the end of the previous period.
+        The solver keeps its step size and Jacobian across period boundaries instead of starting from scratch.
+
+        Returns
+        -------
+        airflow_results : list of dict
+            Results of each period, like `register_airflow` would return them.
+        """
+        init_values = [
+            self.prev_period["humidity_ratio"], 
+            self.prev_period["temp"], 
+            self.prev_period["CO2_concentration"]
+        ]
+
+        period_control_configs = [self.get_control_config(is_light) for is_light in is_light_values]
+
+        self.control_recorder.reset()
+        control_recorder = self.get_solver_control_recorder()
+
+        # Sample the climate at the end of each period
+        t_steps = self.time_period * np.arange(1, len(period_input_values) + 1)
+
+        with self.profiler.measure("solve_ivp", len(period_input_values)):
+            results = solve_ivp(
+                continuous_airflow_model, 
+                (0, t_steps[-1],), 
+                init_values, 
+                t_eval=t_steps, 
+                method="BDF", 
+                jac=continuous_airflow_model_jacobian,
+                vectorized=True,
+                # Do not step over a period without evaluating its inputs
+                max_step=self.time_period,
+                args=(self.time_period, period_input_values, period_control_configs, control_recorder)
+            )
+        self.profiler.record_solver(results)
+        assert results.success, f"Continuous climate integration failed: {results.message}"
+
+        return self.register_periods_end(results["y"].T, t_steps, period_input_values, period_control_configs)
+
+
+    def register_airflow_merged(self, period_input_values, is_light):
+        """
+        Solves the climate of consecutive quiescent periods as one step, with their input values averaged (see
+        `run_adaptive`). The climate at the end of each period is interpolated from the dense output of the solver.
+
+        Returns
+        -------
+        airflow_results : list of dict
+            Results of each period, like `register_airflow` would return them.
+        """
+        init_values = [
+            self.prev_period["humidity_ratio"], 
+            self.prev_period["temp"], 
+            self.prev_period["CO2_concentration"]
+        ]
+
+        input_values = get_mean_input_values(period_input_values)
+        control_config = self.get_control_config(is_light)
+
+        self.control_recorder.reset()
+        control_recorder = self.get_solver_control_recorder()
+
+        t_steps = self.time_period * np.arange(1, len(period_input_values) + 1)
+        t_max = t_steps[-1]
+
+        with self.profiler.measure("solve_ivp", len(period_input_values)):
+            results = solve_ivp(
+                airflow_model, 
+                (0, t_max,), 
+                init_values, 
+                t_eval=t_steps, 
+                method="BDF", 
+                jac=airflow_model_jacobian,
+                vectorized=True,
+                args=(t_max, input_values, control_recorder, self.prev_airflows_at_t_steps, control_config)
+            )
+        self.profiler.record_solver(results)
+        assert results.success, f"Merged climate integration failed: {results.message}"
+
+        period_count = len(period_input_values)
+        return self.register_periods_end(results["y"].T, t_steps, [input_values] * period_count, [control_config] * period_count)
+
+
+    def register_periods_end(self, period_new_values, t_steps, period_input_values, period_control_configs):
+        """
+        Registers the end of consecutive periods solved as one ODE problem, whose climate was sampled at `t_steps`
+        (the end of each period).
+        """
+        airflow_results = []
+        for period_index, (new_values, input_values, control_config) in enumerate(zip(period_new_values, period_input_values, period_control_configs)):
+            t_from, t_to = t_steps[period_index] - self.time_period, t_steps[period_index]
+            if self.control_recorder.policy == "final":
+                self.control_recorder.reset()
+                self.record_final_controls(t_to, new_values, input_values, control_config)
+
+            control_results = self.control_recorder.get_results(t_from, t_to)
+            airflow_results.append(self.register_period_end(new_values, control_results))
+
+        return airflow_results
+
+
+    def get_solver_control_recorder(self):
+        # With the "final" policy, control signals are not recorded during the solve, only recomputed from the final state
+        return None if self.control_recorder.policy == "final" else self.control_recorder
+
+
+    def record_final_controls(self, t, new_values, input_values, control_config):
+        airflow_model(t, new_values, t, input_values, self.control_recorder, self.prev_airflows_at_t_steps, control_config)
+
+
+    def register_period_end(self, new_values, control_results):
+        new_humidity_ratio, new_temp, new_CO2_concentration = new_values
+
+        pressure: Pa = 101325 # TODO: get this from weather data
+        new_humidity: RH = psychrolib.GetRelHumFromHumRatio(new_temp, new_humidity_ratio, pressure) * 100
+
+        self.prev_airflows_at_t_steps.append(control_results["airflow_m3_per_s"])
+
+        # Set new values as starting values for next period
+        self.prev_period["humidity_ratio"] = new_humidity_ratio
+        self.prev_period["temp"] = new_temp
+        self.prev_period["CO2_concentration"] = new_CO2_concentration
+
+        return {
+            "humidity": new_humidity,
+            "humidity_ratio": new_humidity_ratio,
+            "temp": new_temp,
+            "CO2_concentration": new_CO2_concentration,
+            **control_results,
+        }
+
+
+class GreenhouseBatch:
+    """
+    Simulates several greenhouse configurations through the same weather at once, instead of running one `Greenhouse`
+    after the other. The greenhouses can differ in airflow mode, temp mode, temperature and humidity limits, roof panel
+    type and sunlight blocking, but must share the resample period, psychrometrics and control policy.
+
+    The open-loop inputs and the crop do not depend on the climate, only on the light reaching the plants. They are computed
+    once per group of greenhouses with the same roof panel type, sunlight blocking, barrel light model, crop cohort count
+    and history mode, by the first greenhouse of the group. The crop and lighting of the other greenhouses of the group are
+    set to its state after each run, so every greenhouse can be checkpointed, forked or run further on its own. The climates
+    of all greenhouses are integrated as one ODE system of N x 3 variables, with a single solver call per period (see `batch_airflow_model`).
+    """
+    def __init__(self, greenhouses):
+        self.greenhouses = list(greenhouses)
+        assert len(self.greenhouses) > 0, "A greenhouse batch needs at least one greenhouse."
+
+        first_greenhouse = self.greenhouses[0]
+        for greenhouse in self.greenhouses:
+            assert greenhouse.time_period == first_greenhouse.time_period, "All greenhouses of a batch must have the same resample period."
+            assert greenhouse.psychrometrics == first_greenhouse.psychrometrics, "All greenhouses of a batch must use the same psychrometrics."
+            assert greenhouse.control_recorder.policy == first_greenhouse.control_recorder.policy, "All greenhouses of a batch must have the same control policy."
+
+        self.time_period: s = first_greenhouse.time_period
+        self.get_sat_vap_pres = first_greenhouse.get_sat_vap_pres
+        self.control_recorder = ControlRecorder(first_greenhouse.control_recorder.policy, batch_size=len(self.greenhouses))
+
+        # Group greenhouses by the light reaching the plants: index of the group of each greenhouse, first greenhouse of each group
+        self.group_indices = []
+        self.group_leaders = []
+        group_keys = []
+        for greenhouse in self.greenhouses:
+            group_key = (greenhouse.roof_panel_type, greenhouse.block_sunlight, greenhouse.light.barrel_light_model, greenhouse.crop.cohort_count, greenhouse.history_mode)
+            if group_key not in group_keys:
+                group_keys.append(group_key)
+                self.group_leaders.append(greenhouse)
+            self.group_indices.append(group_keys.index(group_key))
+
+        # Compiled structures of all greenhouses, whose heat transfer coefficients and volumes are arrays if they differ
+        self.structures = stack_compiled_structures([greenhouse.structure.compiled for greenhouse in self.greenhouses])
+
+        self.profiler = disabled_profiler
+
+
+    def enable_profiling(self, callback=None, keep_records=True):
+        """
+        Starts recording the wall time and statistics of the batch `solve_ivp` calls in a `Profiler`, which is returned
+        and kept in `profiler` (see `Greenhouse.enable_profiling`). The open-loop inputs and crop of the group leaders are
+        recorded by their own profilers.
+        """
+        self.profiler = Profiler(callback, keep_records)
+        return self.profiler
+
+
+    def disable_profiling(self):
+        self.profiler = disabled_profiler
+
+
+    def run(self, df, continuous=False):
+        """
+        Simulates all rows of a weather dataframe for every greenhouse of the batch, period by period like `Greenhouse.run`,
+        or over the whole horizon at once like `Greenhouse.run_continuous`.
+
+        Returns
+        -------
+        results : list of pd.DataFrame
+            One dataframe per greenhouse, in the order of `greenhouses`: `df` extended with the open-loop inputs and the
+            results of that greenhouse.
+        """
+        group_dfs = [greenhouse.get_open_loop_inputs(df) for greenhouse in self.group_leaders]
+        group_rows = [[data for _, data in group_df.iterrows()] for group_df in group_dfs]
+        group_period_inputs = [[greenhouse.get_period_inputs(data) for data in rows] for greenhouse, rows in zip(self.group_leaders, group_rows)]
+
+        period_input_values = []
+        period_control_configs = []
+        for period_inputs in zip(*group_period_inputs):
+            member_period_inputs = [period_inputs[group_index] for group_index in self.group_indices]
+            period_input_values.append(self.get_batch_input_values([input_values for input_values, _ in member_period_inputs]))
+            period_control_configs.append(self.get_batch_control_config([period_results["target_PAR"] != 0 for _, period_results in member_period_inputs]))
+
+        if continuous:
+            self.profiler.set_step(df.index[0])
+            airflow_results = self.register_airflow_continuous(period_input_values, period_control_configs)
+        else:
+            airflow_results = []
+            for timestamp, input_values, control_config in zip(df.index, period_input_values, period_control_configs):
+                self.profiler.set_step(timestamp)
+                airflow_results.append(self.register_airflow(input_values, control_config))
+        self.profiler.set_step(None)
+
+        # Only the crop and lighting of the group leaders were run
+        for greenhouse, group_index in zip(self.greenhouses, self.group_indices):
+            group_leader = self.group_leaders[group_index]
+            if greenhouse is not group_leader:
+                greenhouse.crop.set_state(group_leader.crop.get_state())
+                greenhouse.light.light.dimmer.set_state(group_leader.light.light.dimmer.get_state())
+
+        results = []
+        for member_index, (greenhouse, group_index) in enumerate(zip(self.greenhouses, self.group_indices)):
+            collector = ResultCollector(greenhouse.get_result_schema(), len(df), df.index)
+            for timestamp, data, (_, period_results), period_airflow_results in zip(df.index, group_rows[group_index], group_period_inputs[group_index], airflow_results):
+                member_results = greenhouse.get_period_results(data, period_results, period_airflow_results[member_index])
+                greenhouse.update_kpis(timestamp, member_results)
+                collector.append(member_results)
+
+            results.append(collector.add_to(group_dfs[group_index]))
+
+        return results
+
+
+    def get_batch_input_values(self, member_input_values):
+        """
+        Input values of `batch_airflow_model` from the input values of each greenhouse for the same period.
+        """
+        return {
+            "H2O_mass_evaporation_rate": get_batch_value([input_values["H2O_mass_evaporation_rate"] for input_values in member_input_values]),
+            "CO2_assimilation_rate": get_batch_value([input_values["CO2_assimilation_rate"] for input_values in member_input_values]),
+            # Same weather for all greenhouses
+            "ambient_data": member_input_values[0]["ambient_data"],
+            "power_irradiated": get_batch_value([input_values["power_irradiated"] for input_values in member_input_values]),
+            "structure": self.structures,
+            "get_sat_vap_pres": self.get_sat_vap_pres,
+        }
+
+
+    def get_batch_control_config(self, is_light_values):
+        member_control_configs = [greenhouse.get_control_config(is_light) for greenhouse, is_light in zip(self.greenhouses, is_light_values)]
+        return {key: get_batch_value([control_config[key] for control_config in member_control_configs]) for key in member_control_configs[0]}
+
+
+    def get_init_values(self):
+        # Flattened (3, N) state, see `batch_airflow_model`
+        return np.array([
+            [greenhouse.prev_period[key] for greenhouse in self.greenhouses]
+            for key in ["humidity_ratio", "temp", "CO2_concentration"]
+        ], dtype=float).ravel()
+
+
+    def register_airflow(self, input_values, control_config):
+        self.control_recorder.reset()
+        control_recorder = self.get_solver_control_recorder()
+
+        t_max = self.time_period
+
+        with self.profiler.measure("solve_ivp"):
+            results = solve_ivp(
+                batch_airflow_model, 
+                (0, t_max,), 
+                self.get_init_values(), 
+                method="BDF", 
+                jac=batch_airflow_model_jacobian,
+                vectorized=True,
+                args=(t_max, input_values, control_recorder, None, control_config)
+            )
+        self.profiler.record_solver(results)
+        assert results.success, f"Batch climate integration failed: {results.message}"
+
+        new_values = results["y"].T[-1]
+        if self.control_recorder.policy == "final":
+            batch_airflow_model(t_max, new_values, t_max, input_values, self.control_recorder, None, control_config)
+
+        control_results = self.control_recorder.get_results(0, t_max)
+
+        return self.register_period_end(new_values, control_results)
+
+
+    def register_airflow_continuous(self, period_input_values, period_control_configs):
+        """
+        Batch version of `Greenhouse.register_airflow_continuous`.
+
+        Returns
+        -------
+        airflow_results : list of list of dict
+            For each period, the results of each greenhouse.
+        """
+        self.control_recorder.reset()
+        control_recorder = self.get_solver_control_recorder()
+
+        # Sample the climate at the end of each period
+        t_steps = self.time_period * np.arange(1, len(period_input_values) + 1)
+
+        with self.profiler.measure("solve_ivp", len(period_input_values)):
+            results = solve_ivp(
+                continuous_airflow_model, 
+                (0, t_steps[-1],), 
+                self.get_init_values(), 
+                t_eval=t_steps, 
+                method="BDF", 
+                jac=continuous_airflow_model_jacobian,
+                vectorized=True,
+                # Do not step over a period without evaluating its inputs
+                max_step=self.time_period,
+                args=(self.time_period, period_input_values, period_control_configs, control_recorder, True)
+            )
+        self.profiler.record_solver(results)
+        assert results.success, f"Continuous batch climate integration failed: {results.message}"
+
+        airflow_results = []
+        for period_index, (new_values, input_values, control_config) in enumerate(zip(results["y"].T, period_input_values, period_control_configs)):
+            t_from, t_to = t_steps[period_index] - self.time_period, t_steps[period_index]
+            if self.control_recorder.policy == "final":
+                self.control_recorder.reset()
+                batch_airflow_model(t_to, new_values, t_to, input_values, self.control_recorder, None, control_config)
+
+            control_results = self.control_recorder.get_results(t_from, t_to)
+            airflow_results.append(self.register_period_end(new_values, control_results))
+
+        return airflow_results
+
+
+    def get_solver_control_recorder(self):
+        return None if self.control_recorder.policy == "final" else self.control_recorder
+
+
+    def register_period_end(self, new_values, control_results):
+        """
+        Registers the end of a period in each greenhouse of the batch, and returns their results.
+        """
+        states = np.reshape(new_values, (3, -1))
+        return [
+            greenhouse.register_period_end(states[:, member_index], {
+                key: value if key == "t" else value[member_index] for key, value in control_results.items()
+            })
+            for member_index, greenhouse in enumerate(self.greenhouses)
+        ]
@@ -0,0 +1,23 @@
+from helpers.types import *
+from helpers.math_helpers import where
+
+
+class HeatPump:
+    def __init__(self):
+        self.heating_efficiency: BTU_per_kWh = 22 * 1000
+        self.cooling_efficiency: BTU_per_kWh = 24 * 1000
+
+
+    def get_energy_usage(self, heat_change: J) -> J:
+        """
+        Energy used to add (positive) or remove (negative) heat. `heat_change` can also be an array (e.g. of
+        consecutive periods), in which case the efficiency is chosen for each value and an array is returned.
+        """
+        efficiency = where(heat_change > 0, self.heating_efficiency, self.cooling_efficiency)
+
+        J_per_BTU: J = 1055.06
+        heat: BTU = abs(heat_change) / J_per_BTU
+        energy_usage: kWh = heat / efficiency
+        energy_usage_J = energy_usage * 3.6e+6
+
+        return energy_usage_J
@@ -0,0 +1,33 @@
+"""
+Runs the validations of the model functions, which are not run on import:
+
+    python -m greenhouse.self_test
+"""
+import sys
+import importlib
+sys.path.insert(0, '/work/greenhouse-simulator-2/')
+
+
+# Modules with a `validate` function, in dependency order
+validated_modules = [
+    "helpers.psychro",
+    "helpers.solar_conversions",
+    "helpers.control_recorder",
+    "helpers.result_collector",
+    "helpers.result_writer",
+    "helpers.kpi",
+    "helpers.profiler",
+    "helpers.benchmark",
+    "helpers.runner",
+    "greenhouse.structure.structure",
+    "greenhouse.adaptive_lighting.barrel_rotation",
+]
+
+
+def run_self_test(modules=validated_modules):
+    for module_name in modules:
+        importlib.import_module(module_name).validate()
+
+
+if __name__ == "__main__":
+    run_self_test()
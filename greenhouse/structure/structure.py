@@ -1,9 +1,13 @@
 import sys
-from pysolar import solar
+import math
+import numpy as np
+import pandas as pd
 from datetime import datetime, timezone
+from typing import NamedTuple
 
 from helpers.types import *
 from helpers.math_helpers import *
+from greenhouse.structure.materials import *
 
 
 # =============================================================================================================================================================
@@ -25,6 +29,8 @@ def get_elevation_angle(coordinates, timestamp) -> deg:
         Angle of the sun above the horizon.
 
     """
+    from pysolar import solar
+
     elevation_angle: deg = solar.get_altitude(coordinates["latitude"], coordinates["longitude"], timestamp)
 
     # If elevation angle is negative (in the night), return 0.
@@ -33,25 +39,6 @@ def get_elevation_angle(coordinates, timestamp) -> deg:
 
     return elevation_angle
 
-### VALIDATION
-
-# Lisbon coordinates
-coordinates = { "latitude": 38.7436883, "longitude": -9.1393}
-
-sc = "1: 0° at sunrise (minus 4 min)."
-sunrise = datetime(2021, 3, 22, 6, 40, 0, tzinfo=timezone.utc)
-assert round(get_elevation_angle(coordinates, sunrise)) == 0, f"get_elevation_angle validation FAILED - {sc}"
-
-sc = "2: 0° at sunset (plus 4 min)."
-sunset = datetime(2021, 9, 22, 18, 31, 0, tzinfo=timezone.utc)
-assert round(get_elevation_angle(coordinates, sunset)) == 0, f"get_elevation_angle validation FAILED - {sc}"
-
-sc = "3: 90° at solar noon at Tropic of Cancer on the summer solstice."
-coordinates = { "latitude": 23.43645, "longitude": 0}
-sunset = datetime(2021, 6, 21, 12, 2, 0, tzinfo=timezone.utc)
-assert round(get_elevation_angle(coordinates, sunset)) == 90, f"get_elevation_angle validation FAILED - {sc}"
-
-print("Validation PASSED: get_elevation_angle")
 
 
 # =============================================================================================================================================================
@@ -73,28 +60,12 @@ def get_azimuth_angle(coordinates, timestamp) -> deg:
         Azimuth angle at given location and time, indicating the sun's position during the day. North == 0°, East == 90°, South == 180°, and West == 270°.
 
     """
+    from pysolar import solar
+
     azimuth_angle: deg = solar.get_azimuth(coordinates["latitude"], coordinates["longitude"], timestamp)
 
     return azimuth_angle
 
-### VALIDATION
-
-# Lisbon coordinates
-coordinates = { "latitude": 38.7436883, "longitude": -9.1393}
-
-sc = "1: At solar noon, the azimuth is 180° (on northern hemisphere)."
-solar_noon = datetime(2021, 6, 20, 12, 38, 0, tzinfo=timezone.utc)
-assert round(get_azimuth_angle(coordinates, solar_noon)) == 180, f"get_azimuth_angle validation FAILED - {sc}"
-
-sc = "2: At the equinoxes, the azimuth is 90° at sunrise."
-sunrise = datetime(2021, 3, 22, 6, 44, 0, tzinfo=timezone.utc)
-assert round(get_azimuth_angle(coordinates, sunrise)) == 90, f"get_azimuth_angle validation FAILED - {sc}"
-
-sc = "3: At the equinoxes, the azimuth is 270° at sunset."
-sunset = datetime(2021, 9, 22, 18, 27, 0, tzinfo=timezone.utc)
-assert round(get_azimuth_angle(coordinates, sunset)) == 270, f"get_azimuth_angle validation FAILED - {sc}"
-
-print("Validation PASSED: get_azimuth_angle")
 
 
 # =============================================================================================================================================================
@@ -134,36 +105,666 @@ def get_intensity_coeff(coordinates, timestamp, panel_tilt, panel_azimuth):
 
     return intensity_coeff
 
-### VALIDATION
 
-sc = "1: get_intensity_coeff is 1 if panel tilt equals sun's zenith angle and panel faces the sun directly."
-coordinates = { "latitude": 23.43645, "longitude": 0}
-date = datetime(2021, 6, 21, 16, 26, 0, tzinfo=timezone.utc)
 
-assert round(get_intensity_coeff(coordinates, date, 60, 284), 2) == 1, f"get_intensity_coeff validation FAILED - {sc}"
 
-sc = "2: get_intensity_coeff is 1 if panel lays flat on the ground and the sun is directly overhead."
-coordinates = { "latitude": 23.43645, "longitude": 0}
-date = datetime(2021, 6, 21, 12, 2, 0, tzinfo=timezone.utc)
+# =============================================================================================================================================================
+
+def get_solar_position(coordinates, timestamps) -> [np.ndarray, np.ndarray]:
+    """
+    Calculates the sun elevation (α, alpha) and azimuth (Θ, theta) angles for a whole series of timestamps in one pass.
+    Vectorized counterpart of `get_elevation_angle` and `get_azimuth_angle`, based on the NOAA solar position equations
+    with the same atmospheric refraction correction as pysolar.
+    Source: https://gml.noaa.gov/grad/solcalc/calcdetails.html
+
+    Parameters
+    ----------
+    coordinates: dict
+        Dictionary with coordinates stored under 'latitude' and 'longitude' keys.
+    timestamps: DatetimeIndex | datetime
+        Timestamps including timezone information to get the angles at.
+
+    Returns
+    -------
+    elevation_angles: deg[]
+        Angles of the sun above the horizon, 0 in the night (same as `get_elevation_angle`).
+    azimuth_angles: deg[]
+        Azimuth angles of the sun. North == 0°, East == 90°, South == 180°, and West == 270°.
+
+    """
+    if isinstance(timestamps, datetime):
+        timestamps = [timestamps]
+    timestamps = pd.DatetimeIndex(timestamps)
+    assert timestamps.tz is not None, "get_solar_position requires timestamps with timezone information."
+
+    # Days (and Julian centuries) since the J2000.0 epoch
+    days = np.asarray((timestamps - pd.Timestamp("2000-01-01 12:00:00", tz=timezone.utc)) / pd.Timedelta(days=1), dtype=float)
+    jc = days / 36525
+
+    # Position of the sun on the ecliptic
+    mean_longitude: deg = (280.46646 + jc * (36000.76983 + jc * 0.0003032)) % 360
+    mean_anomaly: rad = np.radians(357.52911 + jc * (35999.05029 - 0.0001537 * jc))
+    eccentricity = 0.016708634 - jc * (0.000042037 + 0.0000001267 * jc)
+    equation_of_center: deg = np.sin(mean_anomaly) * (1.914602 - jc * (0.004817 + 0.000014 * jc)) \
+        + np.sin(2 * mean_anomaly) * (0.019993 - 0.000101 * jc) \
+        + np.sin(3 * mean_anomaly) * 0.000289
+    omega: rad = np.radians(125.04 - 1934.136 * jc)
+    apparent_longitude: rad = np.radians(mean_longitude + equation_of_center - 0.00569 - 0.00478 * np.sin(omega))
+
+    # Declination of the sun
+    mean_obliquity: deg = 23 + (26 + (21.448 - jc * (46.815 + jc * (0.00059 - jc * 0.001813))) / 60) / 60
+    obliquity: rad = np.radians(mean_obliquity + 0.00256 * np.cos(omega))
+    declination: rad = np.arcsin(np.sin(obliquity) * np.sin(apparent_longitude))
+
+    # Hour angle from the true solar time
+    y = np.tan(obliquity / 2) ** 2
+    L: rad = np.radians(mean_longitude)
+    equation_of_time = 4 * np.degrees(
+        y * np.sin(2 * L)
+        - 2 * eccentricity * np.sin(mean_anomaly)
+        + 4 * eccentricity * y * np.sin(mean_anomaly) * np.cos(2 * L)
+        - 0.5 * y ** 2 * np.sin(4 * L)
+        - 1.25 * eccentricity ** 2 * np.sin(2 * mean_anomaly)
+    ) # in minutes
+    minutes_of_day = ((days + 0.5) % 1) * 1440 # J2000.0 epoch is at noon
+    true_solar_time = (minutes_of_day + equation_of_time + 4 * coordinates["longitude"]) % 1440
+    hour_angle: rad = np.radians(true_solar_time / 4 - 180)
+
+    # Elevation angle, corrected for atmospheric refraction with the formula used by pysolar (NREL SPA)
+    latitude: rad = np.radians(coordinates["latitude"])
+    sin_elevation = np.sin(latitude) * np.sin(declination) + np.cos(latitude) * np.cos(declination) * np.cos(hour_angle)
+    elevation_angles: deg = np.degrees(np.arcsin(np.clip(sin_elevation, -1, 1)))
+
+    standard_pressure: Pa = 101325
+    standard_temperature = 288.15 # K
+    refraction_coeff = (standard_pressure * 2.830 * 1.02) / (1010 * standard_temperature * 60)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        refraction: deg = refraction_coeff / np.tan(np.radians(elevation_angles + 10.3 / (elevation_angles + 5.11)))
+    elevation_angles = np.where(elevation_angles >= -(0.26667 + 0.5667), elevation_angles + refraction, elevation_angles)
+
+    # If elevation angle is negative (in the night), use 0.
+    elevation_angles = np.clip(elevation_angles, 0, None)
+
+    # Azimuth angle measured clockwise from North
+    azimuth_angles: deg = (np.degrees(np.arctan2(
+        np.sin(hour_angle),
+        np.cos(hour_angle) * np.sin(latitude) - np.tan(declination) * np.cos(latitude)
+    )) + 180) % 360
+
+    return elevation_angles, azimuth_angles
+
+
+def get_sun_vectors(elevation_angles, azimuth_angles) -> np.ndarray:
+    """
+    Converts sun positions to unit vectors pointing towards the sun, with (East, North, Up) components.
+
+    Returns
+    -------
+    sun_vectors: np.ndarray
+        Array of shape (len(elevation_angles), 3).
+    """
+    alpha: rad = np.radians(np.atleast_1d(elevation_angles))
+    theta: rad = np.radians(np.atleast_1d(azimuth_angles))
+
+    return np.stack([np.cos(alpha) * np.sin(theta), np.cos(alpha) * np.cos(theta), np.sin(alpha)], axis=-1)
+
+
+def get_surface_normals(tilts, azimuths) -> np.ndarray:
+    """
+    Converts panel orientations to unit normal vectors with (East, North, Up) components.
+
+    Returns
+    -------
+    surface_normals: np.ndarray
+        Array of shape (len(tilts), 3).
+    """
+    beta: rad = np.radians(np.atleast_1d(tilts))
+    psi: rad = np.radians(np.atleast_1d(azimuths))
+
+    return np.stack([np.sin(beta) * np.sin(psi), np.sin(beta) * np.cos(psi), np.cos(beta)], axis=-1)
 
-assert round(get_intensity_coeff(coordinates, date, 0, 0), 2) == 1, f"get_intensity_coeff validation FAILED - {sc}"
 
-sc = "3: get_intensity_coeff is 0 if panel is vertical and the sun is directly overhead."
-coordinates = { "latitude": 23.43645, "longitude": 0}
-date = datetime(2021, 6, 21, 12, 2, 0, tzinfo=timezone.utc)
+def get_intensity_coeffs(elevation_angles, azimuth_angles, panel_tilts, panel_azimuths) -> np.ndarray:
+    """
+    Vectorized counterpart of `get_intensity_coeff`: calculates the intensity coefficient of every panel at every sun position
+    as a single matrix product of sun vectors and panel normals.
 
-assert round(get_intensity_coeff(coordinates, date, 90, 0), 2) == 0, f"get_intensity_coeff validation FAILED - {sc}"
+    Parameters
+    ----------
+    elevation_angles: deg[]
+        Sun elevation angles, as returned by `get_solar_position`.
+    azimuth_angles: deg[]
+        Sun azimuth angles, as returned by `get_solar_position`.
+    panel_tilts: deg[]
+        Tilt angle of each panel (0° is flat on the ground, 90° is vertical).
+    panel_azimuths: deg[]
+        Orientation of each panel expressed as azimuth angle.
 
-sc = "4: get_intensity_coeff is 0.5 if panel tilt is 60° and the sun is directly overhead."
-coordinates = { "latitude": 23.43645, "longitude": 0}
-date = datetime(2021, 6, 21, 12, 2, 0, tzinfo=timezone.utc)
+    Returns
+    -------
+    intensity_coeffs: np.ndarray
+        Matrix of shape (timestep, panel) with the intensity coefficients, clipped at 0.
+    """
+    intensity_coeffs = get_sun_vectors(elevation_angles, azimuth_angles) @ get_surface_normals(panel_tilts, panel_azimuths).T
+
+    return np.clip(intensity_coeffs, 0, None)
 
-assert round(get_intensity_coeff(coordinates, date, 60, 0), 2) == 0.5, f"get_intensity_coeff validation FAILED - {sc}"
 
-sc = "5: get_intensity_coeff is 0.5 if panel lays flat on the ground and the sun elevation angle is 30°."
-coordinates = { "latitude": 23.43645, "longitude": 0}
-date = datetime(2021, 6, 21, 16, 26, 0, tzinfo=timezone.utc)
+def get_solar_geometry(coordinates, timestamps, panel_tilts, panel_azimuths) -> [np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Calculates sun elevation, sun azimuth and the (timestep, panel) intensity coefficient matrix for a whole simulation horizon in one pass.
+    """
+    elevation_angles, azimuth_angles = get_solar_position(coordinates, timestamps)
+    intensity_coeffs = get_intensity_coeffs(elevation_angles, azimuth_angles, panel_tilts, panel_azimuths)
+
+    return elevation_angles, azimuth_angles, intensity_coeffs
 
-assert round(get_intensity_coeff(coordinates, date, 0, 0), 2) == 0.5, f"get_intensity_coeff validation FAILED - {sc}"
 
-print("Validation PASSED: get_intensity_coeff")
+def get_barrel_face_azimuths(face_count) -> np.ndarray:
+    """
+    Azimuth angles of the centers of `face_count` equal vertical faces around a barrel, over the full circle.
+    """
+    return (np.arange(face_count) + 0.5) * 360 / face_count
+
+
+class CompiledStructure(NamedTuple):
+    """
+    Immutable numeric form of a `Structure` (see `Structure.compile`), read by the climate model, irradiance and lighting
+    calculations instead of the panel dicts: one read-only array per panel property (in the order of `panel_names`) and
+    the aggregates computed once.
+
+    Compiled structures of several variants can be stacked (see `stack_compiled_structures`) to evaluate them in batch,
+    the panel arrays then have shape (structure, panel).
+    """
+    panel_names: tuple
+    areas: m2
+    U_values: W_per_m2_K
+    # NaN for the panels not reached by sunlight
+    tilts: deg
+    azimuths: deg
+    transparencies: float
+    is_solar: bool
+
+    # Overall heat transfer coefficient: the conductive heat transfer rate is linear in the temperature difference
+    heat_transfer_coefficient: W_per_K
+    volume: m3
+    irradiated_area: m2
+    roof_panel_depth: m
+    barrel_surface_total: m2
+    barrel_face_area: m2
+
+
+def get_readonly_array(values) -> np.ndarray:
+    array = np.array(values)
+    array.flags.writeable = False
+    return array
+
+
+def stack_compiled_structures(compiled_structures) -> CompiledStructure:
+    """
+    Stacks the compiled forms of structure variants with the same panels. Panel arrays are stacked into arrays of shape
+    (structure, panel). Aggregates become arrays of shape (structure,), or stay scalars if all variants share them
+    (which keeps the cheaper scalar code paths of the climate model).
+    """
+    panel_names = compiled_structures[0].panel_names
+    assert all(compiled_structure.panel_names == panel_names for compiled_structure in compiled_structures), "Only structures with the same panels can be stacked."
+
+    def stack(values):
+        if isinstance(values[0], np.ndarray):
+            return get_readonly_array(np.stack(values))
+        if all(value == values[0] for value in values):
+            return values[0]
+        return get_readonly_array(values)
+
+    return CompiledStructure(panel_names, *[stack(values) for values in list(zip(*compiled_structures))[1:]])
+
+
+def get_panel_intensity_coeffs(compiled_structure, coordinates, timestamps) -> np.ndarray:
+    """
+    Intensity coefficients of the panels of a compiled structure (or stacked structures) at each timestamp, 0 for the
+    panels not reached by sunlight.
+
+    Returns
+    -------
+    intensity_coeffs : np.ndarray
+        Array of shape (timestep, panel), or (timestep, structure, panel) for stacked structures.
+    """
+    is_sunlit = ~np.isnan(compiled_structure.tilts)
+    _, _, sunlit_intensity_coeffs = get_solar_geometry(coordinates, timestamps, compiled_structure.tilts[is_sunlit], compiled_structure.azimuths[is_sunlit])
+
+    intensity_coeffs = np.zeros((len(sunlit_intensity_coeffs), *compiled_structure.tilts.shape))
+    intensity_coeffs[:, is_sunlit] = sunlit_intensity_coeffs
+
+    return intensity_coeffs
+
+
+def get_irradiance_by_panel_type(compiled_structure, coordinates, timestamps, irradiance: W_per_m2) -> [W, W_per_m2]:
+    """
+    Solar power transmitted through the non-solar panels and irradiance on the solar panel (0 without one) of a compiled
+    structure at each timestamp, see `Structure.get_irradiance_by_panel_type`. With stacked structures, both have shape
+    (timestep, structure).
+    """
+    # Panels of all structures as rows of (structure, panel) arrays, of which only the sunlit ones are computed
+    tilts: deg = np.atleast_2d(compiled_structure.tilts)
+    is_sunlit = ~np.isnan(tilts)
+    structure_indices, _ = np.nonzero(is_sunlit)
+    _, _, intensity_coeffs = get_solar_geometry(coordinates, timestamps, tilts[is_sunlit], np.atleast_2d(compiled_structure.azimuths)[is_sunlit])
+
+    # Sums over the panels of each structure as matrix products: (sunlit panel, structure) weights
+    is_of_structure = structure_indices[:, np.newaxis] == np.arange(len(tilts))
+    is_solar = np.atleast_2d(compiled_structure.is_solar)[is_sunlit]
+    transmitted_areas: m2 = (np.atleast_2d(compiled_structure.areas) * np.atleast_2d(compiled_structure.transparencies))[is_sunlit]
+    irradiance: W_per_m2 = np.reshape(irradiance, (-1, 1))
+
+    solar_power_on_nonsolar_panels: W = intensity_coeffs @ (is_of_structure * np.where(is_solar, 0, transmitted_areas)[:, np.newaxis]) * irradiance
+    # At most one panel is solar
+    irradiance_on_solar_panels: W_per_m2 = intensity_coeffs @ (is_of_structure * is_solar[:, np.newaxis]) * irradiance
+
+    if compiled_structure.tilts.ndim == 1:
+        return solar_power_on_nonsolar_panels[:, 0], irradiance_on_solar_panels[:, 0]
+
+    return solar_power_on_nonsolar_panels, irradiance_on_solar_panels
+
+
+# =============================================================================================================================================================
+
+class Structure:
+    def __init__(self,
+        width=6,
+        depth=2.6,
+        front_height=2.5,
+        rear_height=3,
+        barrel_count=6,
+        plants_per_barrel=200,
+        barrel_diameter=0.57,
+        barrel_height=1.5,
+        barrel_rotator_power=10,
+        barrel_face_count=36,
+        latitude=38.7436883,
+        longitude=-9.1952227,
+        azimuth=180,
+        roof_panel_type="polycarbonate"
+    ):
+        # Set up greenhouse primary parameters
+        self.width: m = width
+        self.depth: m = depth
+        self.front_height: m = front_height
+        self.rear_height: m = rear_height
+
+        self.barrel_count = barrel_count
+        self.plants_per_barrel = plants_per_barrel
+        self.barrel_diameter: m = barrel_diameter
+        self.barrel_height: m = barrel_height
+        self.barrel_rotator_power: W = barrel_rotator_power
+
+        # Set up location parameters
+        self.coordinates = { "latitude": latitude, "longitude": longitude }
+        self.azimuth = azimuth
+
+        # Calculate derived parameters from primaries
+        self.height_diff: m = self.rear_height - self.front_height
+        self.roof_incline: deg = math.degrees(math.atan(self.height_diff / self.depth)) # Optimal for power generation when it equals to latitude
+
+        self.barrel_circumference: m = math.pi * self.barrel_diameter
+        self.barrel_surface_total: m2 = self.barrel_count * self.barrel_circumference * self.barrel_height
+        self.barrel_surface_exposed_to_sun: m2 = self.barrel_surface_total / 3
+
+        # The surface of the barrels as vertical faces, whose normals are computed once for all irradiance calculations
+        self.barrel_face_azimuths: deg = get_barrel_face_azimuths(barrel_face_count)
+        self.barrel_face_normals = get_surface_normals(np.full(barrel_face_count, 90), self.barrel_face_azimuths)
+        self.barrel_face_area: m2 = self.barrel_surface_total / barrel_face_count
+
+        # Calculate surface areas (A) and volume (V)
+        self.A_roof_panel: m2 = self.get_roof_panel_depth() * self.width
+        self.A_front_panel: m2 = self.width * self.front_height
+        self.A_side_panel: m2 = self.get_side_panel_area()
+        self.A_rear_panel: m2 = self.width * self.rear_height
+        self.A_floor: m2 = self.width * self.depth
+
+        is_roof_solar = False
+        if roof_panel_type == "insolight":
+            roof_panel = InsolightMaterial()
+            is_roof_solar = True
+        elif roof_panel_type == "solarbrite":
+            roof_panel = SolarBriteMaterial()
+            is_roof_solar = True
+        elif roof_panel_type == "polycarbonate":
+            roof_panel = Polycarbonate()
+        else:
+            raise Exception(f"Roof panel type '{roof_panel_type}' is not supported.")
+
+        self.panels = {
+            "slanted_roof": {
+                "material": roof_panel,
+                "area": self.A_roof_panel,
+                "tilt": self.roof_incline,
+                "azimuth_offset": 0,
+                "solar": is_roof_solar
+            },
+            "front_panel": {
+                "material": Polycarbonate(),
+                "area": self.A_front_panel,
+                "tilt": 90,
+                "azimuth_offset": 0,
+                "solar": False
+            },
+            "left_panel": {
+                "material": Polycarbonate(),
+                "area": self.A_side_panel,
+                "tilt": 90,
+                "azimuth_offset": 90,
+                "solar": False
+            },
+            "right_panel": {
+                "material": Polycarbonate(),
+                "area": self.A_side_panel,
+                "tilt": 90,
+                "azimuth_offset": -90,
+                "solar": False
+            },
+            "rear_panel": {
+                "material": Polycarbonate(),
+                "area": self.A_rear_panel,
+                "solar": False
+            },
+            "floor": {
+                "material": Plywood(),
+                "area": self.A_floor,
+                "solar": False
+            }
+        }
+
+        # Make sure that 0 or 1 solar panels are there
+        solar_panel_count = 0
+        for panel_name in self.panels:
+            if self.panels[panel_name]["solar"]:
+                solar_panel_count += 1
+        assert solar_panel_count <= 1, "Only one structure panel can be solar."
+
+        self.compiled: CompiledStructure = self.compile()
+
+
+    def compile(self) -> CompiledStructure:
+        """
+        Compiles the panels and dimensions into their numeric form. Done once when the structure is created: `compiled`
+        has to be recompiled if the panels or dimensions are changed afterwards.
+        """
+        panels = list(self.panels.values())
+        areas: m2 = np.array([panel["area"] for panel in panels], dtype=float)
+        U_values: W_per_m2_K = np.array([panel["material"].U_value for panel in panels], dtype=float)
+        is_solar = np.array([panel["solar"] for panel in panels])
+
+        return CompiledStructure(
+            panel_names=tuple(self.panels),
+            areas=get_readonly_array(areas),
+            U_values=get_readonly_array(U_values),
+            tilts=get_readonly_array([panel.get("tilt", np.nan) for panel in panels]),
+            azimuths=get_readonly_array([self.azimuth + panel.get("azimuth_offset", 0) for panel in panels]),
+            # Opaque materials (e.g. plywood) have no transparency
+            transparencies=get_readonly_array([getattr(panel["material"], "transparency", 0) for panel in panels]),
+            is_solar=get_readonly_array(is_solar),
+            heat_transfer_coefficient=float(np.sum(U_values * areas)),
+            volume=self.get_volume(),
+            irradiated_area=float(np.sum(areas[is_solar])),
+            roof_panel_depth=self.get_roof_panel_depth(),
+            barrel_surface_total=self.barrel_surface_total,
+            barrel_face_area=self.barrel_face_area,
+        )
+
+
+    @property
+    def irradiated_area(self) -> m2:
+        return self.compiled.irradiated_area
+
+    @property
+    def power_consumption(self) -> W:
+        """
+        Get electric power consumption of the structure. Includes: barrel rotators.
+        """
+        return self.barrel_count * self.barrel_rotator_power
+
+
+    @property
+    def roof_panel_depth(self) -> m:
+        return self.compiled.roof_panel_depth
+
+
+    @property
+    def volume(self) -> m3:
+        return self.compiled.volume
+
+
+    def get_roof_panel_depth(self) -> m:
+        """
+        Calculate depth (side edge if observing from front) of roof panel using Pythagoras' theorem
+        """
+        tan_alpha = self.height_diff / self.depth
+        alpha: rad = math.atan(tan_alpha)
+
+        return self.height_diff / math.sin(alpha)
+
+
+    def get_volume(self) -> m3:
+        """
+        Get total air volume of the greenhouse, including an estimated offset accounting for the equipment inside.
+        """
+        offset = 0.98
+        V_triangle: m3 = (self.height_diff * self.depth) / 2 * self.width
+        V_rectangle: m3 = self.depth * self.front_height * self.width
+        V_total: m3 = V_triangle + V_rectangle
+
+        return V_total * offset
+    
+
+    def get_side_panel_area(self) -> m2:
+        """
+        Calculate area of trapeziod-shaped side panels.
+        """
+        A_triangle: m2 = (self.height_diff * self.depth) / 2
+        A_rectangle: m2 = self.depth * self.front_height
+
+        return A_triangle + A_rectangle
+
+
+    def get_heat_transfer_rate(self, delta_T: C) -> W:
+        """
+        Get the heat transfer rate through the structure.
+        """
+        return self.compiled.heat_transfer_coefficient * delta_T
+
+
+    def get_irradiance_on_panels(self, timestamp, irradiance: W_per_m2):
+        """
+        Get solar irradiance on each panel.
+
+        Parameters
+        ----------
+        timestamp : datetime | DatetimeIndex
+            A single timestamp, or a whole series of timestamps to compute the irradiance for in one vectorized pass.
+        irradiance : W_per_m2 | W_per_m2[]
+            Solar irradiance at `timestamp` (same length as `timestamp` if it is a series).
+
+        Returns
+        -------
+        irradiance_on_panels : dict
+            Solar irradiance for each panel per square meters.
+        """
+        intensity_coeffs = get_panel_intensity_coeffs(self.compiled, self.coordinates, timestamp)
+
+        # Return scalars if a single timestamp was passed
+        if isinstance(timestamp, datetime):
+            intensity_coeffs = intensity_coeffs[0]
+
+        # To filter out panels that are not reached by sunlight
+        irradiance_on_panels = {}
+        for i, panel_name in enumerate(self.compiled.panel_names):
+            if not np.isnan(self.compiled.tilts[i]):
+                irradiance_on_panels[panel_name] = intensity_coeffs[..., i] * irradiance
+
+        return irradiance_on_panels
+
+
+    def get_barrel_face_intensity_coeffs(self, timestamp) -> np.ndarray:
+        """
+        Intensity coefficients of the faces of the barrels (see `barrel_face_azimuths`), computed as one matrix
+        product of the sun vectors of all timestamps and the precomputed face normals.
+
+        Returns
+        -------
+        intensity_coeffs : np.ndarray
+            Matrix of shape (timestep, face) for a DatetimeIndex, or a (face,) array for a single timestamp.
+        """
+        elevation_angles, azimuth_angles = get_solar_position(self.coordinates, timestamp)
+        intensity_coeffs = np.clip(get_sun_vectors(elevation_angles, azimuth_angles) @ self.barrel_face_normals.T, 0, None)
+
+        return intensity_coeffs[0] if isinstance(timestamp, datetime) else intensity_coeffs
+
+
+    def get_irradiance_by_panel_type(self, timestamp, irradiance: W_per_m2) -> [W, W_per_m2]:
+        results: [W, W_per_m2] = get_irradiance_by_panel_type(self.compiled, self.coordinates, timestamp, irradiance)
+        solar_power_on_nonsolar_panels, irradiance_on_solar_panels = results
+
+        # Return scalars if a single timestamp was passed
+        if isinstance(timestamp, datetime):
+            return solar_power_on_nonsolar_panels[0], irradiance_on_solar_panels[0]
+
+        return solar_power_on_nonsolar_panels, irradiance_on_solar_panels
+
+
+
+### VALIDATION
+def validate():
+    # Lisbon coordinates
+    coordinates = { "latitude": 38.7436883, "longitude": -9.1393}
+
+    sc = "1: 0° at sunrise (minus 4 min)."
+    sunrise = datetime(2021, 3, 22, 6, 40, 0, tzinfo=timezone.utc)
+    assert round(get_elevation_angle(coordinates, sunrise)) == 0, f"get_elevation_angle validation FAILED - {sc}"
+
+    sc = "2: 0° at sunset (plus 4 min)."
+    sunset = datetime(2021, 9, 22, 18, 31, 0, tzinfo=timezone.utc)
+    assert round(get_elevation_angle(coordinates, sunset)) == 0, f"get_elevation_angle validation FAILED - {sc}"
+
+    sc = "3: 90° at solar noon at Tropic of Cancer on the summer solstice."
+    coordinates = { "latitude": 23.43645, "longitude": 0}
+    sunset = datetime(2021, 6, 21, 12, 2, 0, tzinfo=timezone.utc)
+    assert round(get_elevation_angle(coordinates, sunset)) == 90, f"get_elevation_angle validation FAILED - {sc}"
+
+    print("Validation PASSED: get_elevation_angle")
+
+    # Lisbon coordinates
+    coordinates = { "latitude": 38.7436883, "longitude": -9.1393}
+
+    sc = "1: At solar noon, the azimuth is 180° (on northern hemisphere)."
+    solar_noon = datetime(2021, 6, 20, 12, 38, 0, tzinfo=timezone.utc)
+    assert round(get_azimuth_angle(coordinates, solar_noon)) == 180, f"get_azimuth_angle validation FAILED - {sc}"
+
+    sc = "2: At the equinoxes, the azimuth is 90° at sunrise."
+    sunrise = datetime(2021, 3, 22, 6, 44, 0, tzinfo=timezone.utc)
+    assert round(get_azimuth_angle(coordinates, sunrise)) == 90, f"get_azimuth_angle validation FAILED - {sc}"
+
+    sc = "3: At the equinoxes, the azimuth is 270° at sunset."
+    sunset = datetime(2021, 9, 22, 18, 27, 0, tzinfo=timezone.utc)
+    assert round(get_azimuth_angle(coordinates, sunset)) == 270, f"get_azimuth_angle validation FAILED - {sc}"
+
+    print("Validation PASSED: get_azimuth_angle")
+
+    sc = "1: get_intensity_coeff is 1 if panel tilt equals sun's zenith angle and panel faces the sun directly."
+    coordinates = { "latitude": 23.43645, "longitude": 0}
+    date = datetime(2021, 6, 21, 16, 26, 0, tzinfo=timezone.utc)
+
+    assert round(get_intensity_coeff(coordinates, date, 60, 284), 2) == 1, f"get_intensity_coeff validation FAILED - {sc}"
+
+    sc = "2: get_intensity_coeff is 1 if panel lays flat on the ground and the sun is directly overhead."
+    coordinates = { "latitude": 23.43645, "longitude": 0}
+    date = datetime(2021, 6, 21, 12, 2, 0, tzinfo=timezone.utc)
+
+    assert round(get_intensity_coeff(coordinates, date, 0, 0), 2) == 1, f"get_intensity_coeff validation FAILED - {sc}"
+
+    sc = "3: get_intensity_coeff is 0 if panel is vertical and the sun is directly overhead."
+    coordinates = { "latitude": 23.43645, "longitude": 0}
+    date = datetime(2021, 6, 21, 12, 2, 0, tzinfo=timezone.utc)
+
+    assert round(get_intensity_coeff(coordinates, date, 90, 0), 2) == 0, f"get_intensity_coeff validation FAILED - {sc}"
+
+    sc = "4: get_intensity_coeff is 0.5 if panel tilt is 60° and the sun is directly overhead."
+    coordinates = { "latitude": 23.43645, "longitude": 0}
+    date = datetime(2021, 6, 21, 12, 2, 0, tzinfo=timezone.utc)
+
+    assert round(get_intensity_coeff(coordinates, date, 60, 0), 2) == 0.5, f"get_intensity_coeff validation FAILED - {sc}"
+
+    sc = "5: get_intensity_coeff is 0.5 if panel lays flat on the ground and the sun elevation angle is 30°."
+    coordinates = { "latitude": 23.43645, "longitude": 0}
+    date = datetime(2021, 6, 21, 16, 26, 0, tzinfo=timezone.utc)
+
+    assert round(get_intensity_coeff(coordinates, date, 0, 0), 2) == 0.5, f"get_intensity_coeff validation FAILED - {sc}"
+
+    print("Validation PASSED: get_intensity_coeff")
+
+    sc = "1: Same validation scenarios as `get_elevation_angle`, `get_azimuth_angle` and `get_intensity_coeff`."
+    coordinates = { "latitude": 38.7436883, "longitude": -9.1393}
+    timestamps = pd.DatetimeIndex([
+        datetime(2021, 3, 22, 6, 40, 0, tzinfo=timezone.utc), # elevation 0° at sunrise (minus 4 min)
+        datetime(2021, 9, 22, 18, 31, 0, tzinfo=timezone.utc), # elevation 0° at sunset (plus 4 min)
+        datetime(2021, 6, 20, 12, 38, 0, tzinfo=timezone.utc), # azimuth 180° at solar noon
+        datetime(2021, 3, 22, 6, 44, 0, tzinfo=timezone.utc), # azimuth 90° at sunrise at the equinoxes
+        datetime(2021, 9, 22, 18, 27, 0, tzinfo=timezone.utc), # azimuth 270° at sunset at the equinoxes
+    ])
+    elevation_angles, azimuth_angles = get_solar_position(coordinates, timestamps)
+    assert list(np.round(elevation_angles[:2])) == [0, 0], f"get_solar_position validation FAILED - {sc}"
+    assert list(np.round(azimuth_angles[2:])) == [180, 90, 270], f"get_solar_position validation FAILED - {sc}"
+
+    coordinates = { "latitude": 23.43645, "longitude": 0}
+    timestamps = pd.DatetimeIndex([
+        datetime(2021, 6, 21, 12, 2, 0, tzinfo=timezone.utc), # sun directly overhead
+        datetime(2021, 6, 21, 16, 26, 0, tzinfo=timezone.utc), # sun elevation angle is 30°
+    ])
+    elevation_angles, _, intensity_coeffs = get_solar_geometry(coordinates, timestamps, [60, 0, 90, 60], [284, 0, 0, 0])
+    assert round(elevation_angles[0]) == 90, f"get_solar_position validation FAILED - {sc}"
+    assert list(np.round(intensity_coeffs[0, 1:], 2)) == [1, 0, 0.5], f"get_intensity_coeffs validation FAILED - {sc}"
+    assert list(np.round(intensity_coeffs[1, :2], 2)) == [1, 0.5], f"get_intensity_coeffs validation FAILED - {sc}"
+
+    sc = "2: Agrees with the pysolar based scalar functions within 0.1° throughout the year."
+    coordinates = { "latitude": 38.7436883, "longitude": -9.1393}
+    timestamps = pd.date_range("2020-01-01 07:00", "2020-12-31 19:00", freq="797min", tz=timezone.utc)[::16]
+    elevation_angles, azimuth_angles = get_solar_position(coordinates, timestamps)
+    for timestamp, elevation_angle, azimuth_angle in zip(timestamps, elevation_angles, azimuth_angles):
+        assert abs(get_elevation_angle(coordinates, timestamp) - elevation_angle) < 0.1, f"get_solar_position validation FAILED - {sc}"
+        assert abs(get_azimuth_angle(coordinates, timestamp) - azimuth_angle) < 0.1, f"get_solar_position validation FAILED - {sc}"
+
+    print("Validation PASSED: get_solar_position, get_intensity_coeffs")
+
+    sc = "3: Barrel faces match get_intensity_coeff, and get cos(elevation) / π on average over the full circle."
+    structure = Structure(barrel_face_count=36)
+    timestamps = pd.DatetimeIndex([datetime(2021, 6, 21, 9, 0, 0, tzinfo=timezone.utc), datetime(2021, 12, 21, 14, 0, 0, tzinfo=timezone.utc)])
+    intensity_coeffs = structure.get_barrel_face_intensity_coeffs(timestamps)
+    elevation_angles, _ = get_solar_position(structure.coordinates, timestamps)
+    assert intensity_coeffs.shape == (2, 36), f"get_barrel_face_intensity_coeffs validation FAILED - {sc}"
+    assert np.allclose(intensity_coeffs.mean(axis=1), np.cos(np.radians(elevation_angles)) / math.pi, rtol=1e-2), f"get_barrel_face_intensity_coeffs validation FAILED - {sc}"
+    for face_index in [0, 12, 20]:
+        intensity_coeff = get_intensity_coeff(structure.coordinates, timestamps[0], 90, structure.barrel_face_azimuths[face_index])
+        assert abs(intensity_coeffs[0, face_index] - intensity_coeff) < 1e-2, f"get_barrel_face_intensity_coeffs validation FAILED - {sc}"
+    assert np.allclose(structure.get_barrel_face_intensity_coeffs(timestamps[0].to_pydatetime()), intensity_coeffs[0]), f"get_barrel_face_intensity_coeffs validation FAILED - {sc}"
+
+    print("Validation PASSED: get_barrel_face_intensity_coeffs")
+
+    sc = "1: The compiled structure matches the panels, and its aggregates the per-panel sums."
+    structure = Structure(roof_panel_type="insolight")
+    compiled_structure = structure.compiled
+    assert compiled_structure.panel_names == tuple(structure.panels) and compiled_structure.is_solar.tolist() == [True, False, False, False, False, False], f"Structure.compile validation FAILED - {sc}"
+    assert np.isclose(compiled_structure.heat_transfer_coefficient, sum(panel["material"].U_value * panel["area"] for panel in structure.panels.values())), f"Structure.compile validation FAILED - {sc}"
+    assert compiled_structure.irradiated_area == structure.A_roof_panel and np.isclose(structure.roof_panel_depth, math.hypot(structure.height_diff, structure.depth)) and not compiled_structure.areas.flags.writeable, f"Structure.compile validation FAILED - {sc}"
+
+    sc = "2: Stacked structure variants get the irradiance of each variant."
+    structures = [Structure(roof_panel_type=roof_panel_type, azimuth=azimuth) for roof_panel_type, azimuth in [("polycarbonate", 180), ("insolight", 180), ("solarbrite", 135)]]
+    compiled_structures = stack_compiled_structures([structure.compiled for structure in structures])
+    assert compiled_structures.areas.shape == (3, 6) and compiled_structures.volume == structure.volume and len(compiled_structures.irradiated_area) == 3, f"stack_compiled_structures validation FAILED - {sc}"
+    timestamps = pd.date_range("2021-06-21 06:00", "2021-06-21 20:00", freq="60min", tz=timezone.utc)
+    irradiance: W_per_m2 = np.linspace(0, 900, len(timestamps))
+    solar_power_on_nonsolar_panels, irradiance_on_solar_panels = get_irradiance_by_panel_type(compiled_structures, structure.coordinates, timestamps, irradiance)
+    assert solar_power_on_nonsolar_panels.shape == (len(timestamps), 3), f"get_irradiance_by_panel_type validation FAILED - {sc}"
+    for structure_index, structure in enumerate(structures):
+        results = structure.get_irradiance_by_panel_type(timestamps, irradiance)
+        assert np.allclose(solar_power_on_nonsolar_panels[:, structure_index], results[0]) and np.allclose(irradiance_on_solar_panels[:, structure_index], results[1]), f"get_irradiance_by_panel_type validation FAILED - {sc}"
+
+    print("Validation PASSED: Structure.compile, stack_compiled_structures")
@@ -0,0 +1,191 @@
+import os
+import re
+import json
+import timeit
+import platform
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy
+
+
+BENCHMARK_DIRECTORY = Path(__file__).parent.parent / "benchmarks"
+
+# Relative slowdown of a benchmark (on its fastest repeat) over the baseline that counts as a regression
+DEFAULT_THRESHOLD = 0.25
+
+
+def time_function(function, repeat=5, number=None) -> dict:
+    """
+    Times `function()` like `timeit`: `repeat` rounds of `number` calls each (by default, as many as take 0.2 s).
+    The fastest round is the most reproducible estimate, the others are noise from the machine.
+
+    Returns
+    -------
+    timings : dict
+        min_s, median_s and max_s (seconds per call over the rounds), number, repeat.
+    """
+    timer = timeit.Timer(function)
+    if number is None:
+        number, _ = timer.autorange()
+
+    times = np.array(timer.repeat(repeat=repeat, number=number)) / number
+    return {
+        "min_s": float(times.min()),
+        "median_s": float(np.median(times)),
+        "max_s": float(times.max()),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def run_benchmarks(benchmarks, pattern=None) -> dict:
+    """
+    Times each benchmark whose name matches the regular expression `pattern` (all by default), printing one line each.
+
+    Parameters
+    ----------
+    benchmarks : dict
+        Name -> function to time, or dict of `time_function` arguments (function, repeat, number) for the benchmarks
+        which are too slow for the defaults.
+
+    Returns
+    -------
+    results : dict
+        Name -> timings of each benchmark run (see `time_function`), with the environment they were measured in.
+    """
+    timings = {}
+    for name, benchmark in benchmarks.items():
+        if pattern is not None and re.search(pattern, name) is None:
+            continue
+
+        benchmark = benchmark if isinstance(benchmark, dict) else {"function": benchmark}
+        timings[name] = time_function(**benchmark)
+        print(f"{name}: {format_duration(timings[name]['min_s'])} (median {format_duration(timings[name]['median_s'])}, {timings[name]['repeat']} x {timings[name]['number']} calls)")
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": get_environment(),
+        "benchmarks": timings,
+    }
+
+
+def get_environment() -> dict:
+    """
+    Machine, library versions and commit the benchmarks run on, to tell apart regressions of the code from changes
+    of the environment.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIRECTORY.parent, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        "machine": get_machine_name(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "pandas": pd.__version__,
+        "commit": commit,
+    }
+
+
+def get_machine_name() -> str:
+    """
+    Name of the machine results are stored under, the BENCHMARK_MACHINE environment variable or the host name.
+    Timings are only compared between runs on the same machine.
+    """
+    return os.environ.get("BENCHMARK_MACHINE") or platform.node() or "default"
+
+
+def save_results(results, directory=BENCHMARK_DIRECTORY / "results") -> Path:
+    """
+    Stores the results of `run_benchmarks` as results/<machine>/<timestamp>.json, and returns the path.
+    """
+    machine_directory = Path(directory) / results["environment"]["machine"]
+    machine_directory.mkdir(parents=True, exist_ok=True)
+
+    path = machine_directory / f"{results['timestamp'].replace(':', '-')}.json"
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2)
+    return path
+
+
+def load_results(path) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+def get_baseline_path(machine=None, directory=BENCHMARK_DIRECTORY / "results") -> Path:
+    """
+    Path of the baseline results of a machine (the current one by default), which later runs are compared to.
+    """
+    return Path(directory) / (machine or get_machine_name()) / "baseline.json"
+
+
+def save_baseline(results, directory=BENCHMARK_DIRECTORY / "results") -> Path:
+    """
+    Stores the results of `run_benchmarks` as the baseline of their machine. Benchmarks of the baseline which were
+    not run (see `pattern`) keep their previous timings.
+    """
+    path = get_baseline_path(results["environment"]["machine"], directory)
+    baseline = load_results(path) if path.exists() else {"benchmarks": {}}
+    baseline = {**results, "benchmarks": {**baseline["benchmarks"], **results["benchmarks"]}}
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(baseline, file, indent=2)
+    return path
+
+
+def compare_results(results, baseline, threshold=DEFAULT_THRESHOLD) -> pd.DataFrame:
+    """
+    Compares the fastest timings of the benchmarks run in both `results` and `baseline`.
+
+    Returns
+    -------
+    comparison : pd.DataFrame
+        Indexed by benchmark name: baseline_s, current_s, ratio (current / baseline), and is_regression (ratio above
+        1 + threshold).
+    """
+    names = [name for name in results["benchmarks"] if name in baseline["benchmarks"]]
+    comparison = pd.DataFrame({
+        "baseline_s": [baseline["benchmarks"][name]["min_s"] for name in names],
+        "current_s": [results["benchmarks"][name]["min_s"] for name in names],
+    }, index=pd.Index(names, name="benchmark"))
+
+    comparison["ratio"] = comparison["current_s"] / comparison["baseline_s"]
+    comparison["is_regression"] = comparison["ratio"] > 1 + threshold
+    return comparison
+
+
+def assert_no_regressions(comparison):
+    regressions = comparison[comparison["is_regression"]]
+    assert len(regressions) == 0, "Benchmarks slower than the baseline: " + ", ".join(
+        f"{name} ({ratio:.2f}x)" for name, ratio in regressions["ratio"].items()
+    )
+
+
+def format_duration(duration: float) -> str:
+    for unit, scale in [("s", 1), ("ms", 1e-3), ("us", 1e-6)]:
+        if duration >= scale:
+            return f"{duration / scale:.3g} {unit}"
+    return f"{duration / 1e-9:.3g} ns"
+
+
+### VALIDATION
+def validate():
+    timings = time_function(lambda: sum(range(100)), repeat=3, number=10)
+    assert timings["number"] == 10 and timings["repeat"] == 3 and 0 < timings["min_s"] <= timings["median_s"] <= timings["max_s"], "Error while validating `time_function`"
+    baseline_results = {"benchmarks": {"a": {"min_s": 1.0}, "b": {"min_s": 2.0}}}
+    current_results = {"benchmarks": {"a": {"min_s": 1.2}, "b": {"min_s": 3.0}, "c": {"min_s": 1.0}}}
+    comparison = compare_results(current_results, baseline_results, threshold=0.25)
+    assert comparison.index.tolist() == ["a", "b"] and comparison["is_regression"].tolist() == [False, True], "Error while validating `compare_results`"
+    assert format_duration(0.0123) == "12.3 ms" and format_duration(2e-7) == "200 ns", "Error while validating `format_duration`"
+    print("Validation PASSED: benchmark.py")
@@ -0,0 +1,146 @@
+import numpy as np
+
+
+class ControlRecorder:
+    """
+    Records the control signals `airflow_model` computes at the times the ODE solver evaluates it, in preallocated
+    NumPy arrays, and reports one value per signal for a period.
+
+    Supported policies:
+        last: values at the latest time evaluated in the period.
+        mean: time-weighted average over the period (trapezoidal, values held constant towards the period edges).
+        final: values at the end of the period, recomputed from the final state. Nothing is recorded during the solve,
+            the caller evaluates the model once more at the final state (see `Greenhouse.register_airflow`).
+
+    The solver can evaluate the model several times at the same time (Newton iterations, rejected steps); only the first
+    evaluation at a given time is kept.
+
+    With a `batch_size`, each signal is an array of that many values (one per configuration of a `GreenhouseBatch`),
+    and the results are lists of values.
+    """
+    signal_names = [
+        "dehum_rate_g_per_s",
+        "heating_rate_J_per_s",
+        "CO2_release_rate_mol_per_s",
+        "airflow_m3_per_s",
+        "ambient_humidity_at_inside_temp_RH",
+    ]
+
+    def __init__(self, policy="last", capacity=1024, batch_size=None):
+        assert policy in ["last", "mean", "final"], f"Control policy '{policy}' is not supported."
+        self.policy = policy
+
+        # Shape of the values recorded at one time
+        self.record_shape = (len(self.signal_names),) if batch_size is None else (len(self.signal_names), batch_size)
+
+        self.times = np.zeros(capacity)
+        self.values = np.zeros((capacity, *self.record_shape))
+        self.count = 0
+
+        # Times recorded so far, for O(1) deduplication
+        self.recorded_times = set()
+
+        # Recorded values sorted by time, computed once when results are first requested
+        self.sorted_records = None
+
+
+    def __len__(self):
+        return self.count
+
+
+    def reset(self):
+        """
+        Forgets the recorded values, keeping the allocated arrays.
+        """
+        self.count = 0
+        self.recorded_times.clear()
+        self.sorted_records = None
+
+
+    def record(self, t, values):
+        """
+        Records the control signals (in the order of `signal_names`) evaluated at time t, unless t is already recorded.
+        """
+        if t in self.recorded_times:
+            return
+        self.recorded_times.add(t)
+
+        if self.count == len(self.times):
+            self._grow()
+
+        self.times[self.count] = t
+        self.values[self.count] = values
+        self.count += 1
+        self.sorted_records = None
+
+
+    def get_results(self, t_from, t_to) -> dict:
+        """
+        Control signals of the period (t_from, t_to] according to the policy, and the time "t" (relative to t_from)
+        they are reported at.
+        """
+        assert self.count > 0, "No control signals were recorded."
+        times, values = self._get_sorted_records()
+
+        start = np.searchsorted(times, t_from, side="right")
+        end = np.searchsorted(times, t_to, side="right")
+
+        is_empty = end == start
+        if is_empty:
+            # No evaluation in the period, fall back to the latest one before it
+            start = max(end - 1, 0)
+            end = start + 1
+
+        if self.policy == "mean" and not is_empty:
+            period_times = np.concatenate([[t_from], times[start:end], [t_to]])
+            period_values = np.concatenate([values[start:start + 1], values[start:end], values[end - 1:end]])
+            durations = np.diff(period_times).reshape(-1, *[1] * len(self.record_shape))
+            areas = (period_values[1:] + period_values[:-1]) / 2 * durations
+            signal_values = areas.sum(axis=0) / (t_to - t_from)
+            t = t_to
+        else:
+            signal_values = values[end - 1]
+            t = times[end - 1]
+
+        return {
+            "t": t - t_from,
+            **dict(zip(self.signal_names, signal_values.tolist())),
+        }
+
+
+    def _get_sorted_records(self):
+        if self.sorted_records is None:
+            order = np.argsort(self.times[:self.count], kind="stable")
+            self.sorted_records = self.times[:self.count][order], self.values[:self.count][order]
+        return self.sorted_records
+
+
+    def _grow(self):
+        """
+        Doubles the preallocated arrays when they are full.
+        """
+        capacity = 2 * len(self.times)
+        times = np.zeros(capacity)
+        values = np.zeros((capacity, *self.record_shape))
+        times[:self.count] = self.times[:self.count]
+        values[:self.count] = self.values[:self.count]
+        self.times, self.values = times, values
+
+
+### VALIDATION
+def validate():
+    recorder = ControlRecorder("last", capacity=2)
+    for t, airflow in [(0, 1), (2, 3), (1, 2), (2, 99), (4, 5)]:
+        recorder.record(t, [0, 0, 0, airflow, 0])
+    assert len(recorder) == 4, "Error while validating `ControlRecorder.record` deduplication"
+    assert recorder.get_results(0, 4)["airflow_m3_per_s"] == 5 and recorder.get_results(0, 4)["t"] == 4
+    assert recorder.get_results(0, 3)["airflow_m3_per_s"] == 3, "Error while validating `ControlRecorder` 'last' policy"
+    recorder.policy = "mean"
+    # t=0 is not in the period (0, 4], so 2 (at t=1) is held from 0 to 1, then linear through 3 (at t=2) and 5 (at t=4)
+    assert np.isclose(recorder.get_results(0, 4)["airflow_m3_per_s"], (2 + 2.5 + 8) / 4), "Error while validating `ControlRecorder` 'mean' policy"
+    assert np.isclose(recorder.get_results(2, 4)["airflow_m3_per_s"], 5) and recorder.get_results(2, 4)["t"] == 2, "Error while validating `ControlRecorder` 'mean' policy"
+    batch_recorder = ControlRecorder("mean", capacity=2, batch_size=2)
+    for t, airflow in [(1, 2), (2, 3), (4, 5)]:
+        batch_recorder.record(t, [[0, 0], [0, 0], [0, 0], [airflow, 2 * airflow], [0, 0]])
+    assert np.allclose(batch_recorder.get_results(0, 4)["airflow_m3_per_s"], [(2 + 2.5 + 8) / 4, (2 + 2.5 + 8) / 2]), "Error while validating batched `ControlRecorder`"
+    print("Validation PASSED: control_recorder.py")
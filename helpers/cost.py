@@ -1,4 +1,5 @@
 import numpy as np
+import pandas as pd
 
 from helpers.types import *
 from helpers.conversions import *
@@ -6,30 +7,60 @@ from helpers.conversions import *
 
 electricity_cost: EUR_per_kWh = 0.145
 
-def get_total_cost(df, greenhouse):
-        time_period = greenhouse.time_period
-        # Fan
-        auc_airflow: m3 = np.trapz(df["airflow_m3_per_s"], dx=time_period)  # auc: Area Under Curve
-        energy_used_by_fan: J = greenhouse.fan.get_energy_usage(auc_airflow)
+# Per-step energy use of the equipment driven by the control signals, see `get_step_energy`
+step_energy_keys = ["energy_used_by_fan_J", "energy_used_by_heating_J", "energy_used_by_dehum_J"]
+
+
+def get_step_energy(df, greenhouse) -> dict:
+    """
+    Energy used by the fan, the heat pump and the dehumidifier in each step, computed from the control signal columns
+    of the results at once (the same values `Greenhouse.run` adds to its results, see `step_energy_results`).
+    `df` can be a results DataFrame or a `ResultReader`.
+    """
+    time_period = greenhouse.time_period
+    energy_used_by_dehum, _ = greenhouse.dehumidifier.run(np.asarray(df["dehum_rate_g_per_s"]) * time_period)
+
+    return {
+        "energy_used_by_fan_J": greenhouse.fan.get_energy_usage(np.asarray(df["airflow_m3_per_s"]) * time_period),
+        "energy_used_by_heating_J": greenhouse.heatpump.get_energy_usage(np.asarray(df["heating_rate_J_per_s"]) * time_period),
+        "energy_used_by_dehum_J": energy_used_by_dehum,
+    }
 
-        # Heating
-        auc_heating: J = np.trapz(df["heating_rate_J_per_s"], dx=time_period)
-        energy_used_by_heating: J = greenhouse.heatpump.get_energy_usage(auc_heating)
 
-        # Dehumidification
-        auc_dehum: g = np.trapz(df["dehum_rate_g_per_s"], dx=time_period)
-        energy_used_by_dehum, _ = greenhouse.dehumidifier.run(auc_dehum)
+def add_step_energy(df, greenhouse) -> pd.DataFrame:
+    """
+    Returns a copy of the results with the per-step energy columns of `get_step_energy` added (or replaced).
+    """
+    return df.assign(**get_step_energy(df, greenhouse))
 
-        # Lighting
-        energy_used_by_lighting: J = df['energy_used_by_lighting_J'].sum()
 
-        total_energy: J = energy_used_by_fan + energy_used_by_heating + energy_used_by_dehum + energy_used_by_lighting
+def get_energy_accounting(df, greenhouse) -> pd.DataFrame:
+    """
+    Energy used by each piece of equipment, energy generated, net energy and electricity cost of each step.
+    """
+    step_energy = get_step_energy(df, greenhouse)
+    energy_used_by_lighting: J = np.asarray(df["energy_used_by_lighting_J"])
+    total_energy_used: J = sum(step_energy.values()) + energy_used_by_lighting
+    energy_generated: kWh = np.asarray(df["total_energy_generated_kWh"])
+    net_energy: kWh = J_to_kWh(total_energy_used) - energy_generated
 
-        # Energy generated
-        total_energy_generated: kWh = df['total_energy_generated_kWh'].sum()
+    return pd.DataFrame({
+        **step_energy,
+        "energy_used_by_lighting_J": energy_used_by_lighting,
+        "total_energy_used_J": total_energy_used,
+        "energy_generated_kWh": energy_generated,
+        "net_energy_kWh": net_energy,
+        "cost_EUR": net_energy * electricity_cost,
+    }, index=df.index)
+
+
+def get_total_cost(df, greenhouse):
+    """
+    Electricity cost of the simulated period (net of the energy generated), yield and number of plants harvested.
+    The energy of each piece of equipment is accounted for step by step, see `get_energy_accounting`.
+    """
+    total_cost: EUR = get_energy_accounting(df, greenhouse)["cost_EUR"].sum()
+    total_yield: kg = np.sum(df['harvested_weight_g']) / 1000
+    total_harvested_plant_count = np.sum(df["harvested_plant_count"])
 
-        total_cost: EUR = (J_to_kWh(total_energy) - total_energy_generated) * electricity_cost
-        total_yield: kg = df['harvested_weight_g'].sum() / 1000
-        total_harvested_plant_count = df["harvested_plant_count"].sum()
-        
-        return total_cost, total_yield, total_harvested_plant_count
\ No newline at end of file
+    return total_cost, total_yield, total_harvested_plant_count
@@ -1,28 +1,38 @@
-import pandas as pd
-from datetime import timezone
-from pathlib import Path
+import sys
+sys.path.insert(0, '/work/greenhouse-simulator-2/')
 
-def get_weather_data(date_from, date_to, resample_period="min"):
+from helpers.weather_store import DEFAULT_SITE, get_weather_store, resample_weather_data
+
+def get_weather_data(date_from, date_to, resample_period="min", site=DEFAULT_SITE):
     """
     Valid resample values: https://pandas.pydata.org/pandas-docs/stable/user_guide/timeseries.html#offset-aliases
+
+    The weather data is read from the binary store of the site (see `WeatherStore`), and resamples are cached.
     """
-    # Read data from CSV file
-    weather_df = pd.read_csv(Path(__file__).parent.parent / "weather_data/Lisboa_2020.csv", index_col=0)
+    return get_weather_store(site).get_weather_data(date_from, date_to, resample_period)
 
-    # Convert timestamp column from string to pandas timestamp
-    weather_df["timestamp"] = pd.to_datetime(weather_df['timestamp'], format='%Y-%m-%d %H:%M:%S')
 
-    # Keep rows only within the provided range
-    date_to = f"{date_to}T00:00:00.000000" # To avoid cutting off the last hour of the day
-    weather_of_day_df = weather_df[(weather_df['timestamp'] >= date_from) & (weather_df['timestamp'] <= date_to)].copy(deep=True)
+def iter_weather_data(date_from, date_to, resample_period="min", chunk_hours=168, site=DEFAULT_SITE):
+    """
+    Same weather data as `get_weather_data`, yielded in chunks of `chunk_hours` hours that are resampled on demand,
+    for long, high resolution runs (see `WeatherStore.iter_weather_data`).
+    """
+    return get_weather_store(site).iter_weather_data(date_from, date_to, resample_period, chunk_hours)
 
-    # Set TimestampIndex as interpolation requires it
-    weather_of_day_df.set_index('timestamp', inplace=True)
 
-    # Resample from hourly data then interpolate it
-    weather_of_day_df = weather_of_day_df.resample(resample_period).interpolate(method='polynomial', order=2)
+def read_weather_data(site=DEFAULT_SITE):
+    """
+    Reads the hourly weather data of the whole year, indexed by timestamp.
+    """
+    return get_weather_store(site).get_hourly_data()
+
 
-    # Add timezone information
-    weather_of_day_df = weather_of_day_df.tz_localize(timezone.utc)
+def prepare_weather_data(weather_df, date_from, date_to, resample_period="min"):
+    """
+    Cuts the date range out of the hourly weather data returned by `read_weather_data`, and resamples it.
+    """
+    # Keep rows only within the provided range
+    date_to = f"{date_to}T00:00:00.000000" # To avoid cutting off the last hour of the day
+    weather_of_day_df = weather_df[(weather_df.index >= date_from) & (weather_df.index <= date_to)].copy(deep=True)
 
-    return weather_of_day_df
\ No newline at end of file
+    return resample_weather_data(weather_of_day_df, resample_period)
@@ -0,0 +1,181 @@
+import numpy as np
+
+
+class History:
+    """
+    Bounded register of the values a simulation variable takes step by step, stored in preallocated NumPy arrays
+    instead of an ever-growing list, so memory stays flat on long runs.
+
+    Supported modes:
+        latest: keep only the last value.
+        ring:{N}: keep the last N values (fixed size ring buffer).
+        every:{N}: keep the last value, plus a snapshot of every N-th value (downsampled history, grows N times slower than the run).
+
+    Values can be scalars or arrays of a fixed shape. `history[-1]` always returns the last value; for arrays it is a view,
+    so it can be modified in place (e.g. when crops are harvested).
+    """
+    def __init__(self, mode="latest"):
+        name, _, size = mode.partition(":")
+        assert name in ["latest", "ring", "every"], f"History mode '{mode}' is not supported."
+        if name != "latest":
+            assert size.isdigit() and int(size) > 0, f"History mode '{mode}' needs a positive integer size, e.g. '{name}:100'."
+
+        self.mode = mode
+        self.is_downsampled = name == "every"
+        self.stride = int(size) if self.is_downsampled else 1
+        self.capacity = int(size) if name == "ring" else 1
+
+        # Total number of values appended so far
+        self.count = 0
+
+        # Preallocated on first append, when the shape and dtype of values is known
+        self.values = None
+        self.scratch = None
+
+
+    def __len__(self):
+        if self.is_downsampled:
+            return self._snapshot_count + (0 if self._is_snapshot(self.count - 1) else int(self.count > 0))
+        return min(self.count, self.capacity)
+
+
+    def __getitem__(self, index):
+        length = len(self)
+        if index < 0:
+            index += length
+        if index < 0 or index >= length:
+            raise IndexError(f"History index out of range (retaining {length} values in '{self.mode}' mode)")
+
+        if self.is_downsampled:
+            if index == length - 1:
+                return self._get_latest()
+            return self.values[index]
+
+        # Position of the oldest retained value in the ring buffer
+        start = self.count - length
+        return self.values[(start + index) % self.capacity]
+
+
+    def append(self, value):
+        value = np.asarray(value)
+        if self.values is None:
+            self._allocate(value.shape, value.dtype)
+
+        step = self.count
+        if self.is_downsampled:
+            if self._is_snapshot(step):
+                self._ensure_capacity(self._snapshot_count + 1)
+                self.values[self._snapshot_count] = value
+            else:
+                self.scratch[...] = value
+        else:
+            self.values[step % self.capacity] = value
+
+        self.count += 1
+
+
+    def extend(self, values):
+        """
+        Appends a sequence of values (along the first axis) at once.
+        """
+        values = np.asarray(values)
+        if len(values) == 0:
+            return
+        if self.values is None:
+            self._allocate(values.shape[1:], values.dtype)
+
+        steps = self.count + np.arange(len(values))
+        if self.is_downsampled:
+            is_snapshot = steps % self.stride == 0
+            snapshots = values[is_snapshot]
+            self._ensure_capacity(self._snapshot_count + len(snapshots))
+            self.values[self._snapshot_count:self._snapshot_count + len(snapshots)] = snapshots
+            if not is_snapshot[-1]:
+                self.scratch[...] = values[-1]
+        else:
+            # Only the last `capacity` values survive in the ring buffer
+            kept = slice(max(len(values) - self.capacity, 0), None)
+            self.values[steps[kept] % self.capacity] = values[kept]
+
+        self.count += len(values)
+
+
+    def get_state(self) -> dict:
+        """
+        Copy of the retained values and counters, to restore them with `set_state` (e.g. in a greenhouse checkpoint).
+        """
+        values = self.values
+        if self.is_downsampled and values is not None:
+            # Only the filled part of the growing snapshot buffer
+            values = values[:max(self._snapshot_count, 1)]
+
+        return {
+            "mode": self.mode,
+            "count": self.count,
+            "values": None if values is None else values.copy(),
+            "scratch": None if self.scratch is None else self.scratch.copy(),
+        }
+
+
+    def set_state(self, state):
+        assert state["mode"] == self.mode, f"Cannot restore a '{state['mode']}' history into a '{self.mode}' one."
+        self.count = state["count"]
+        self.values = None if state["values"] is None else state["values"].copy()
+        self.scratch = None if state["scratch"] is None else state["scratch"].copy()
+
+
+    @property
+    def steps(self) -> np.ndarray:
+        """
+        Step numbers (0 for the first appended value) of the retained values, oldest first.
+        """
+        if self.is_downsampled:
+            steps = np.arange(self._snapshot_count) * self.stride
+            if not self._is_snapshot(self.count - 1) and self.count > 0:
+                steps = np.append(steps, self.count - 1)
+            return steps
+        return np.arange(self.count - len(self), self.count)
+
+
+    def to_array(self) -> np.ndarray:
+        """
+        Returns a copy of the retained values, oldest first.
+        """
+        if self.values is None:
+            return np.array([])
+        return np.array([self[i] for i in range(len(self))])
+
+
+    @property
+    def _snapshot_count(self):
+        return (self.count + self.stride - 1) // self.stride
+
+
+    def _is_snapshot(self, step):
+        return step >= 0 and step % self.stride == 0
+
+
+    def _get_latest(self):
+        if self.is_downsampled and not self._is_snapshot(self.count - 1):
+            return self.scratch
+        if self.is_downsampled:
+            return self.values[self._snapshot_count - 1]
+        return self.values[(self.count - 1) % self.capacity]
+
+
+    def _allocate(self, shape, dtype):
+        # Store at least as floats, so that an integer first value (e.g. 0) does not truncate later ones
+        dtype = np.result_type(dtype, np.float64)
+        self.values = np.zeros((self.capacity, *shape), dtype=dtype)
+        self.scratch = np.zeros(shape, dtype=dtype)
+
+
+    def _ensure_capacity(self, required):
+        """
+        Downsampled histories grow by doubling the preallocated snapshot buffer when it is full.
+        """
+        if required > len(self.values):
+            capacity = max(required, 2 * len(self.values))
+            values = np.zeros((capacity, *self.values.shape[1:]), dtype=self.values.dtype)
+            values[:len(self.values)] = self.values
+            self.values = values
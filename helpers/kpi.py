@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+
+import sys
+sys.path.insert(0, '/work/greenhouse-simulator-2/')
+
+from helpers.types import *
+from helpers.conversions import *
+from helpers.cost import electricity_cost, step_energy_keys, get_step_energy
+
+
+# Energy series integrated by `KPIAccumulator`, in this order
+energy_keys = [*step_energy_keys, "energy_used_by_lighting_J", "energy_generated_kWh"]
+
+
+class KPISums:
+    """
+    Running sums, minimums and maximums of the KPIs of a span of steps (the whole run, or a day or month of it).
+    """
+    def __init__(self):
+        self.energies = np.zeros(len(energy_keys))
+        self.harvested_weight: g = 0.0
+        self.harvested_plant_count = 0
+
+        self.step_count = 0
+        self.temp_sum: C = 0.0
+        self.temp_min: C = np.inf
+        self.temp_max: C = -np.inf
+        self.humidity_sum: RH = 0.0
+        self.humidity_min: RH = np.inf
+        self.humidity_max: RH = -np.inf
+
+
+    def add(self, energies, results):
+        self.energies += energies
+        self.harvested_weight += results["harvested_weight_g"]
+        self.harvested_plant_count += int(results["harvested_plant_count"])
+
+        temp, humidity = results["temp"], results["humidity"]
+        self.step_count += 1
+        self.temp_sum += temp
+        self.temp_min = min(self.temp_min, temp)
+        self.temp_max = max(self.temp_max, temp)
+        self.humidity_sum += humidity
+        self.humidity_min = min(self.humidity_min, humidity)
+        self.humidity_max = max(self.humidity_max, humidity)
+
+
+    def get_kpis(self) -> dict:
+        energies = dict(zip(energy_keys, self.energies.tolist()))
+        total_energy_used: J = sum(energies[key] for key in energy_keys[:-1])
+        net_energy: kWh = J_to_kWh(total_energy_used) - energies["energy_generated_kWh"]
+        step_count = max(self.step_count, 1)
+
+        return {
+            **energies,
+            "total_energy_used_J": total_energy_used,
+            "net_energy_kWh": net_energy,
+            "cost_EUR": net_energy * electricity_cost,
+            "harvested_weight_g": self.harvested_weight,
+            "harvested_plant_count": self.harvested_plant_count,
+            "step_count": self.step_count,
+            "temp_min": self.temp_min,
+            "temp_max": self.temp_max,
+            "temp_mean": self.temp_sum / step_count,
+            "humidity_min": self.humidity_min,
+            "humidity_max": self.humidity_max,
+            "humidity_mean": self.humidity_sum / step_count,
+        }
+
+
+class KPIAccumulator:
+    """
+    Key performance indicators of a simulation, accumulated step by step from the results of `Greenhouse.run` in
+    constant memory, so that they can be reported without keeping the results (see `Greenhouse.track_kpis`):
+    energy used by the fan, heat pump, dehumidifier and lighting, energy generated, net energy and cost, harvested
+    weight and plant count, and minimum, maximum and mean temperature and humidity.
+
+    Supported integrations of the energy series:
+        step: sum of the energy of each step, equal to the totals of `get_energy_accounting` and `get_total_cost`.
+        trapezoid: trapezoidal integral of the power of each step over the timestamps of the results (half a step
+            less at both ends than `step` with evenly spaced timestamps).
+
+    With `rollups` (pandas period aliases, e.g. ["D", "M"]), the KPIs are also reported per day, month, etc.
+    (see `get_rollup`). A trapezoid between two steps is counted in the period of its later step. Rollups keep one
+    row per elapsed period.
+    """
+    def __init__(self, greenhouse, integration="step", rollups=()):
+        assert integration in ["step", "trapezoid"], f"KPI integration '{integration}' is not supported."
+        self.greenhouse = greenhouse
+        self.time_period: s = greenhouse.time_period
+        self.integration = integration
+
+        self.totals = KPISums()
+
+        # Period alias -> [current period, its sums, KPIs of the elapsed periods, timestamp the next period starts at]
+        self.rollups = {freq: [None, None, [], None] for freq in rollups}
+
+        # Timestamp and energies of the previous step, for the trapezoidal integration
+        self.prev_timestamp = None
+        self.prev_energies = None
+
+
+    def __len__(self):
+        return self.totals.step_count
+
+
+    def update(self, timestamp, results):
+        """
+        Adds the results of one step (a dict or row of the results of `Greenhouse.run`) at `timestamp`.
+        The per-step energy of the equipment is computed from the control signals if it is not in the results
+        (see `step_energy_results`).
+        """
+        if step_energy_keys[0] in results:
+            step_energy = [results[key] for key in step_energy_keys]
+        else:
+            step_energy = get_step_energy(results, self.greenhouse).values()
+        energies = np.array([*step_energy, results["energy_used_by_lighting_J"], results["total_energy_generated_kWh"]], dtype=float)
+
+        if self.integration == "trapezoid":
+            increments = np.zeros(len(energy_keys))
+            if self.prev_timestamp is not None:
+                duration: s = (timestamp - self.prev_timestamp).total_seconds()
+                increments = (self.prev_energies + energies) / 2 * duration / self.time_period
+            self.prev_timestamp, self.prev_energies = timestamp, energies
+            energies = increments
+
+        self.totals.add(energies, results)
+
+        for freq, rollup in self.rollups.items():
+            # Steps are added in time order, so the period only changes when its end is reached
+            if rollup[0] is None or timestamp >= rollup[3]:
+                timestamp = pd.Timestamp(timestamp)
+                period = timestamp.tz_localize(None).to_period(freq)
+                if rollup[0] is not None:
+                    rollup[2].append({"period": rollup[0], **rollup[1].get_kpis()})
+                rollup[0], rollup[1], rollup[3] = period, KPISums(), (period + 1).start_time.tz_localize(timestamp.tz)
+            rollup[1].add(energies, results)
+
+
+    def get_kpis(self) -> dict:
+        """
+        KPIs of all the steps added so far.
+        """
+        return self.totals.get_kpis()
+
+
+    def get_rollup(self, freq) -> pd.DataFrame:
+        """
+        KPIs of each period (e.g. "D" or "M", one of the `rollups`) of the steps added so far, indexed by period.
+        The last period is the current one, which can be incomplete.
+        """
+        period, sums, rows, _ = self.rollups[freq]
+        rows = rows if period is None else [*rows, {"period": period, **sums.get_kpis()}]
+        return pd.DataFrame(rows, columns=["period", *self.totals.get_kpis()]).set_index("period")
+
+
+### VALIDATION
+def validate():
+    class ValidationGreenhouse:
+        time_period: s = 3600
+
+    timestamps = pd.date_range("2020-01-01 22:00", periods=4, freq="60min", tz="UTC")
+    step_results = [
+        {
+            "energy_used_by_fan_J": fan, "energy_used_by_heating_J": 2 * fan, "energy_used_by_dehum_J": 0.0,
+            "energy_used_by_lighting_J": 3.6e6, "total_energy_generated_kWh": 0.5,
+            "harvested_weight_g": 10.0 * fan, "harvested_plant_count": 1, "temp": 20 + fan, "humidity": 60 - fan,
+        }
+        for fan in [1.0, 2.0, 3.0, 4.0]
+    ]
+    accumulator = KPIAccumulator(ValidationGreenhouse(), rollups=["D"])
+    trapezoid_accumulator = KPIAccumulator(ValidationGreenhouse(), integration="trapezoid")
+    for timestamp, results in zip(timestamps, step_results):
+        accumulator.update(timestamp, results)
+        trapezoid_accumulator.update(timestamp, results)
+    kpis = accumulator.get_kpis()
+    assert len(accumulator) == 4 and kpis["energy_used_by_fan_J"] == 10 and kpis["energy_used_by_heating_J"] == 20, "Error while validating `KPIAccumulator`"
+    assert np.isclose(kpis["net_energy_kWh"], J_to_kWh(30 + 4 * 3.6e6) - 2) and kpis["harvested_plant_count"] == 4, "Error while validating `KPIAccumulator`"
+    assert kpis["temp_min"] == 21 and kpis["temp_max"] == 24 and kpis["humidity_mean"] == 57.5, "Error while validating `KPIAccumulator`"
+    assert np.isclose(trapezoid_accumulator.get_kpis()["energy_used_by_fan_J"], (1 + 2) / 2 + (2 + 3) / 2 + (3 + 4) / 2), "Error while validating `KPIAccumulator` trapezoid integration"
+    daily_kpis = accumulator.get_rollup("D")
+    assert daily_kpis["energy_used_by_fan_J"].tolist() == [3, 7] and daily_kpis["step_count"].tolist() == [2, 2], "Error while validating `KPIAccumulator` rollups"
+    print("Validation PASSED: kpi.py")
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 from helpers.types import *
 
 
@@ -9,4 +10,34 @@ def cos(angle: deg):
     return math.cos(math.radians(angle))
 
 def tan(angle: deg):
-    return math.tan(math.radians(angle))
\ No newline at end of file
+    return math.tan(math.radians(angle))
+
+
+# Element-wise functions for model code that is evaluated both on single values (plain floats) and on batches
+# (NumPy arrays). NumPy functions called on floats return 0-d arrays at a cost of about a microsecond each, which
+# dominates when an ODE right hand side is evaluated one state at a time, so floats are kept as floats.
+def is_scalar(value) -> bool:
+    return isinstance(value, (float, int, bool, np.bool_))
+
+def where(condition, x, y):
+    if is_scalar(condition):
+        return x if condition else y
+    return np.where(condition, x, y)
+
+def maximum(a, b):
+    if is_scalar(a) and is_scalar(b):
+        return max(a, b)
+    return np.maximum(a, b)
+
+def minimum(a, b):
+    if is_scalar(a) and is_scalar(b):
+        return min(a, b)
+    return np.minimum(a, b)
+
+def clip(value, lower, upper):
+    return minimum(maximum(value, lower), upper)
+
+def any_true(condition) -> bool:
+    if is_scalar(condition):
+        return bool(condition)
+    return bool(np.any(condition))
@@ -0,0 +1,164 @@
+from contextlib import nullcontext
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+
+class Measurement:
+    """
+    Context manager of `Profiler.measure`, which records the wall time of its block.
+    """
+    def __init__(self, profiler, subsystem, row_count):
+        self.profiler = profiler
+        self.subsystem = subsystem
+        self.row_count = row_count
+
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.subsystem, perf_counter() - self.start, self.row_count)
+        return False
+
+
+class Profiler:
+    """
+    Records the wall time of each subsystem of a simulation (structure irradiance, solar panel, lighting, crop, ODE
+    solver, ...) at each step, and the statistics of each `solve_ivp` call, see `Greenhouse.enable_profiling`.
+
+    Records are kept as a tidy frame (`get_timings`, `get_solver_stats`) unless `keep_records` is False, and passed to
+    `callback` (if any) as they are made, as dicts with the columns of these frames and a "kind" ("timing" or "solver").
+    Totals per subsystem are always kept (`get_summary`).
+    """
+    is_enabled = True
+
+    def __init__(self, callback=None, keep_records=True):
+        self.callback = callback
+        self.keep_records = keep_records
+
+        # Timestamp of the current step of the simulation, None outside of steps (e.g. precomputed open loop inputs)
+        self.step = None
+
+        self.timings = []
+        self.solver_stats = []
+        # Subsystem -> [call count, row count, total wall time]
+        self.totals = {}
+        # Wall time of the last measured block, reported with the solver statistics
+        self.last_duration = None
+
+
+    def set_step(self, timestamp):
+        self.step = timestamp
+
+
+    def measure(self, subsystem, row_count=1) -> Measurement:
+        """
+        Context manager recording the wall time of its block as the time of `subsystem` at the current step, for
+        `row_count` rows of data (more than one for vectorized computations).
+        """
+        return Measurement(self, subsystem, row_count)
+
+
+    def record(self, subsystem, duration, row_count=1):
+        self.last_duration = duration
+        totals = self.totals.setdefault(subsystem, [0, 0, 0.0])
+        totals[0] += 1
+        totals[1] += row_count
+        totals[2] += duration
+
+        record = {"step": self.step, "subsystem": subsystem, "row_count": row_count, "wall_s": duration}
+        if self.keep_records:
+            self.timings.append(record)
+        if self.callback is not None:
+            self.callback({"kind": "timing", **record})
+
+
+    def record_solver(self, results):
+        """
+        Records the statistics of a `solve_ivp` call (its results), with the wall time of the last measured block.
+        """
+        record = {
+            "step": self.step,
+            "nfev": results.nfev,
+            "njev": results.njev,
+            "nlu": results.nlu,
+            "status": results.status,
+            "wall_s": self.last_duration,
+        }
+        if self.keep_records:
+            self.solver_stats.append(record)
+        if self.callback is not None:
+            self.callback({"kind": "solver", **record})
+
+
+    def get_timings(self) -> pd.DataFrame:
+        """
+        One row per measured block: step, subsystem, row_count, wall_s.
+        """
+        return pd.DataFrame(self.timings, columns=["step", "subsystem", "row_count", "wall_s"])
+
+
+    def get_solver_stats(self) -> pd.DataFrame:
+        """
+        One row per `solve_ivp` call: step, nfev, njev, nlu, status, wall_s.
+        """
+        return pd.DataFrame(self.solver_stats, columns=["step", "nfev", "njev", "nlu", "status", "wall_s"])
+
+
+    def get_summary(self) -> pd.DataFrame:
+        """
+        Totals per subsystem, slowest first: call_count, row_count, wall_s, wall_s_per_row.
+        """
+        summary = pd.DataFrame.from_dict(self.totals, orient="index", columns=["call_count", "row_count", "wall_s"])
+        summary.index.name = "subsystem"
+        summary["wall_s_per_row"] = summary["wall_s"] / summary["row_count"]
+        return summary.sort_values("wall_s", ascending=False)
+
+
+class DisabledProfiler:
+    """
+    Profiler which records nothing, used when profiling is disabled. Measuring a block only enters an empty context.
+    """
+    is_enabled = False
+
+    def __init__(self):
+        self.context = nullcontext()
+
+
+    def set_step(self, timestamp):
+        pass
+
+
+    def measure(self, subsystem, row_count=1):
+        return self.context
+
+
+    def record_solver(self, results):
+        pass
+
+
+# Shared by all greenhouses without profiling
+disabled_profiler = DisabledProfiler()
+
+
+### VALIDATION
+def validate():
+    events = []
+    profiler = Profiler(callback=events.append)
+    profiler.set_step("t0")
+    with profiler.measure("crop", row_count=2):
+        pass
+    with profiler.measure("solver"):
+        pass
+    profiler.record_solver(type("SolverResults", (), {"nfev": 10, "njev": 1, "nlu": 3, "status": 0})())
+    timings = profiler.get_timings()
+    assert timings["subsystem"].tolist() == ["crop", "solver"] and timings["step"].tolist() == ["t0", "t0"], "Error while validating `Profiler`"
+    assert profiler.get_solver_stats()["nfev"].tolist() == [10] and np.isclose(profiler.get_solver_stats()["wall_s"].iloc[0], timings["wall_s"].iloc[1])
+    assert profiler.get_summary().loc["crop", "row_count"] == 2 and [event["kind"] for event in events] == ["timing", "timing", "solver"], "Error while validating `Profiler`"
+    with disabled_profiler.measure("crop"):
+        pass
+    print("Validation PASSED: profiler.py")
@@ -1,12 +1,159 @@
+import math
+import numpy as np
 import psychrolib
 
 import sys
 sys.path.insert(0, '/work/greenhouse-simulator-2/')
 
 from helpers.types import *
+from helpers.math_helpers import is_scalar, where, maximum
 
 
-def get_humid_air_specific_enthalpy(temp: C, humidity: RH, pressure=101325) -> J_per_kg:
-    humidity_ratio: kg_H2O_per_kg_air = psychrolib.GetHumRatioFromRelHum(temp, humidity / 100, pressure)
-    specific_enthalpy_of_moist_air: J_per_kg = psychrolib.GetMoistAirEnthalpy(temp, humidity_ratio)
-    return specific_enthalpy_of_moist_air
\ No newline at end of file
+# Same bounds as psychrolib (SI units)
+MIN_HUM_RATIO: kg_H2O_per_kg_air = 1e-7
+TRIPLE_POINT_WATER: C = 0.01
+ZERO_CELSIUS_AS_K = 273.15
+
+# Ratio of the molecular weights of water vapor and dry air
+MOLECULAR_WEIGHT_RATIO = 0.621945
+
+
+# Versions of the psychrolib functions used by the ODE model that also work on NumPy arrays, so that the right hand
+# side can be evaluated on batches of states and differentiated analytically. Same formulas (ASHRAE Handbook
+# Fundamentals 2017 ch. 1) as psychrolib, which is still used for single values as it is faster on floats.
+def get_sat_vap_pres(temp: C) -> Pa:
+    """
+    Saturation vapor pressure over liquid water (above the triple point) or ice (below it), eqn 5 and 6.
+    """
+    if is_scalar(temp):
+        return psychrolib.GetSatVapPres(temp)
+
+    temp = np.asarray(temp, dtype=float)
+    temp_K = temp + ZERO_CELSIUS_AS_K
+    is_ice = temp <= TRIPLE_POINT_WATER
+
+    # Only evaluate the formula(s) needed, the ODE right hand side calls this a lot
+    ln_pws = 0
+    if np.any(~is_ice):
+        ln_pws = -5.8002206e+03 / temp_K + 1.3914993 + temp_K * (-4.8640239e-02 + temp_K * (4.1764768e-05 - 1.4452093e-08 * temp_K)) \
+            + 6.5459673 * np.log(temp_K)
+    if np.any(is_ice):
+        ln_pws_ice = -5.6745359e+03 / temp_K + 6.3925247 + temp_K * (-9.677843e-03 + temp_K * (6.2215701e-07 + temp_K * (2.0747825e-09 - 9.484024e-13 * temp_K))) \
+            + 4.1635019 * np.log(temp_K)
+        ln_pws = np.where(is_ice, ln_pws_ice, ln_pws)
+    return np.exp(ln_pws)
+
+
+def get_sat_vap_pres_log_derivative(temp: C):
+    """
+    Derivative of ln(saturation vapor pressure) with respect to temperature (1 / K), i.e. d(Pws)/dT = Pws * this.
+    """
+    temp_K = temp + ZERO_CELSIUS_AS_K
+    d_ln_pws_ice = 5.6745359e+03 / temp_K**2 - 9.677843e-03 + 2 * 6.2215701e-07 * temp_K \
+        + 3 * 2.0747825e-09 * temp_K**2 - 4 * 9.484024e-13 * temp_K**3 + 4.1635019 / temp_K
+    d_ln_pws_water = 5.8002206e+03 / temp_K**2 - 4.8640239e-02 + 2 * 4.1764768e-05 * temp_K \
+        - 3 * 1.4452093e-08 * temp_K**2 + 6.5459673 / temp_K
+    return where(temp <= TRIPLE_POINT_WATER, d_ln_pws_ice, d_ln_pws_water)
+
+
+# Fast path: ln(Pws) tabulated every 0.05 C over the validity range of psychrolib (-100 to 200 C), linearly interpolated.
+# The nodes are aligned with the triple point, where the formulas for ice and water meet with a kink.
+# The maximum relative error against psychrolib is 1e-6 (asserted in the validation below), which carries over
+# unchanged to the relative humidity and the humidity ratio of saturated air.
+SAT_VAP_PRES_TABLE_STEP: C = 0.05
+SAT_VAP_PRES_TABLE_TEMPS = TRIPLE_POINT_WATER + SAT_VAP_PRES_TABLE_STEP * np.arange(
+    np.floor((-100 - TRIPLE_POINT_WATER) / SAT_VAP_PRES_TABLE_STEP), 
+    np.ceil((200 - TRIPLE_POINT_WATER) / SAT_VAP_PRES_TABLE_STEP) + 1
+)
+LN_SAT_VAP_PRES_TABLE = np.log(get_sat_vap_pres(SAT_VAP_PRES_TABLE_TEMPS))
+
+# Python list and float copies for single values, indexing a list is much faster than indexing an array
+LN_SAT_VAP_PRES_TABLE_LIST = LN_SAT_VAP_PRES_TABLE.tolist()
+SAT_VAP_PRES_TABLE_START: C = float(SAT_VAP_PRES_TABLE_TEMPS[0])
+SAT_VAP_PRES_TABLE_LAST_INDEX = len(SAT_VAP_PRES_TABLE_TEMPS) - 2
+
+
+def get_sat_vap_pres_tabulated(temp: C) -> Pa:
+    """
+    Saturation vapor pressure interpolated from a precomputed table, a faster replacement of `get_sat_vap_pres`
+    for scalars and arrays. Temperatures outside of the table (-100 to 200 C) are clipped to its ends.
+    """
+    if is_scalar(temp):
+        position = (temp - SAT_VAP_PRES_TABLE_START) / SAT_VAP_PRES_TABLE_STEP
+        index = int(position)
+        if not 0 <= index <= SAT_VAP_PRES_TABLE_LAST_INDEX:
+            position = min(max(position, 0), SAT_VAP_PRES_TABLE_LAST_INDEX + 1)
+            index = min(int(position), SAT_VAP_PRES_TABLE_LAST_INDEX)
+
+        ln_pws_below = LN_SAT_VAP_PRES_TABLE_LIST[index]
+        return math.exp(ln_pws_below + (position - index) * (LN_SAT_VAP_PRES_TABLE_LIST[index + 1] - ln_pws_below))
+
+    # Uniform table, so the interval of each temperature is found with arithmetic instead of a search
+    position = np.clip((np.asarray(temp) - SAT_VAP_PRES_TABLE_START) / SAT_VAP_PRES_TABLE_STEP, 0, SAT_VAP_PRES_TABLE_LAST_INDEX + 1)
+    index = np.minimum(position.astype(int), SAT_VAP_PRES_TABLE_LAST_INDEX)
+    ln_pws_below = LN_SAT_VAP_PRES_TABLE[index]
+    return np.exp(ln_pws_below + (position - index) * (LN_SAT_VAP_PRES_TABLE[index + 1] - ln_pws_below))
+
+
+def get_vap_pres_from_hum_ratio(humidity_ratio: kg_H2O_per_kg_air, pressure: Pa) -> Pa:
+    bounded_humidity_ratio = maximum(humidity_ratio, MIN_HUM_RATIO)
+    return pressure * bounded_humidity_ratio / (MOLECULAR_WEIGHT_RATIO + bounded_humidity_ratio)
+
+
+def get_hum_ratio_from_vap_pres(vapor_pressure: Pa, pressure: Pa) -> kg_H2O_per_kg_air:
+    return maximum(MOLECULAR_WEIGHT_RATIO * vapor_pressure / (pressure - vapor_pressure), MIN_HUM_RATIO)
+
+
+def get_rel_hum_from_hum_ratio(temp: C, humidity_ratio: kg_H2O_per_kg_air, pressure: Pa, sat_vap_pres: Pa = None):
+    """
+    Relative humidity as a fraction (0-1), like psychrolib.GetRelHumFromHumRatio.
+    The saturation vapor pressure at `temp` can be passed if it is already known.
+    """
+    if sat_vap_pres is None:
+        sat_vap_pres = get_sat_vap_pres(temp)
+    return get_vap_pres_from_hum_ratio(humidity_ratio, pressure) / sat_vap_pres
+
+
+def get_hum_ratio_from_rel_hum(temp: C, rel_hum, pressure: Pa, sat_vap_pres: Pa = None) -> kg_H2O_per_kg_air:
+    """
+    Relative humidity as a fraction (0-1), like psychrolib.GetHumRatioFromRelHum.
+    The saturation vapor pressure at `temp` can be passed if it is already known.
+    """
+    if sat_vap_pres is None:
+        sat_vap_pres = get_sat_vap_pres(temp)
+    return get_hum_ratio_from_vap_pres(rel_hum * sat_vap_pres, pressure)
+
+
+def get_moist_air_enthalpy(temp: C, humidity_ratio: kg_H2O_per_kg_air) -> J_per_kg:
+    return (1.006 * temp + maximum(humidity_ratio, MIN_HUM_RATIO) * (2501. + 1.86 * temp)) * 1000
+
+
+def get_humid_air_specific_enthalpy(temp: C, humidity: RH, pressure=101325, sat_vap_pres: Pa = None) -> J_per_kg:
+    humidity_ratio: kg_H2O_per_kg_air = get_hum_ratio_from_rel_hum(temp, humidity / 100, pressure, sat_vap_pres)
+    specific_enthalpy_of_moist_air: J_per_kg = get_moist_air_enthalpy(temp, humidity_ratio)
+    return specific_enthalpy_of_moist_air
+
+
+### VALIDATION
+def validate():
+    psychrolib.SetUnitSystem(psychrolib.SI)
+    temps = np.array([-20, 0.01, 25, 45, 25])
+    humidity_ratios = np.array([0.0005, 0.003, 0.012, 0.05, 0])
+    assert np.allclose(get_sat_vap_pres(temps), [psychrolib.GetSatVapPres(temp) for temp in temps], rtol=1e-12)
+    assert np.allclose(get_rel_hum_from_hum_ratio(temps, humidity_ratios, 101325), [psychrolib.GetRelHumFromHumRatio(temp, humidity_ratio, 101325) for temp, humidity_ratio in zip(temps, humidity_ratios)], rtol=1e-12)
+    assert np.allclose(get_hum_ratio_from_rel_hum(temps, 0.6, 101325), [psychrolib.GetHumRatioFromRelHum(temp, 0.6, 101325) for temp in temps], rtol=1e-12)
+    assert np.allclose(get_moist_air_enthalpy(temps, humidity_ratios), [psychrolib.GetMoistAirEnthalpy(temp, max(humidity_ratio, MIN_HUM_RATIO)) for temp, humidity_ratio in zip(temps, humidity_ratios)], rtol=1e-12)
+
+    # The derivative is checked away from the triple point, where the two formulas meet
+    temps = np.array([-20, -0.5, 0.5, 25, 45])
+    step: C = 1e-5
+    d_ln_pws_numerical = (np.log(get_sat_vap_pres(temps + step)) - np.log(get_sat_vap_pres(temps - step))) / (2 * step)
+    assert np.allclose(get_sat_vap_pres_log_derivative(temps), d_ln_pws_numerical, rtol=1e-6)
+    assert get_sat_vap_pres_log_derivative(25.) == get_sat_vap_pres_log_derivative(temps)[3]
+
+    # Maximum error of the tabulated fast path, on a grid that is not aligned with the table
+    temps = np.linspace(-100, 200, 300_007)
+    sat_vap_pres_error = np.abs(get_sat_vap_pres_tabulated(temps) / get_sat_vap_pres(temps) - 1)
+    assert sat_vap_pres_error.max() < 1e-6, f"Tabulated saturation vapor pressure error is {sat_vap_pres_error.max()}"
+    assert all(np.isclose(get_sat_vap_pres_tabulated(temp), get_sat_vap_pres_tabulated(np.array([temp]))[0], rtol=1e-12) for temp in [-150, -100, -0.02, 0.03, 25.123, 200, 250])
+    print("Validation PASSED: psychrometric functions match psychrolib")
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+
+class ResultCollector:
+    """
+    Collects the results of a simulation (one dict of values per step) into NumPy columns preallocated from an output
+    schema, and builds the DataFrame once at the end, instead of assigning every value into a DataFrame
+    (`df.loc[timestamp, col] = ...`) or building it from a list of dicts.
+
+    Rows that are not set (e.g. after a failed step) are NaN in float columns and 0 in the others.
+    """
+    def __init__(self, schema, length, index=None):
+        """
+        Parameters
+        ----------
+        schema : dict
+            Name -> dtype of each result column, e.g. `Greenhouse.get_result_schema()`.
+        length : int
+            Number of rows (steps).
+        index : pd.Index, optional
+            Index of the DataFrame, e.g. the timestamps of the weather data.
+        """
+        self.schema = dict(schema)
+        self.length = length
+        self.index = index
+
+        self.columns = {
+            name: np.full(length, np.nan, dtype=dtype) if np.issubdtype(np.dtype(dtype), np.floating) else np.zeros(length, dtype=dtype)
+            for name, dtype in self.schema.items()
+        }
+
+        # Number of rows appended or set so far (position of the last one + 1)
+        self.count = 0
+
+
+    def __len__(self):
+        return self.count
+
+
+    def reset(self):
+        """
+        Clears the collected rows, keeping the allocated columns (e.g. to reuse them for the next chunk of a run).
+        """
+        for column in self.columns.values():
+            column[:] = np.nan if np.issubdtype(column.dtype, np.floating) else 0
+        self.count = 0
+
+
+    def set_row(self, position, results):
+        """
+        Sets the values of the row at the integer position from a dict of results. Every key must be in the schema.
+        """
+        columns = self.columns
+        for name, value in results.items():
+            try:
+                column = columns[name]
+            except KeyError:
+                raise KeyError(f"Result '{name}' is not in the output schema.") from None
+            column[position] = value
+
+        self.count = max(self.count, position + 1)
+
+
+    def append(self, results):
+        self.set_row(self.count, results)
+
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(self.columns, index=self.index, copy=False)
+
+
+    def add_to(self, df) -> pd.DataFrame:
+        """
+        Returns a copy of df (with the same index) with the result columns added, or replacing its columns of the same name.
+        """
+        results = self.to_dataframe()
+        return pd.concat([df.drop(columns=results.columns, errors="ignore"), results], axis=1)
+
+
+### VALIDATION
+def validate():
+    collector = ResultCollector({"temp": float, "harvested_plant_count": int}, 3, index=pd.Index(["a", "b", "c"]))
+    collector.append({"temp": 20.5, "harvested_plant_count": 2})
+    collector.set_row(2, {"temp": 21})
+    results = collector.to_dataframe()
+    assert len(collector) == 3 and results["harvested_plant_count"].tolist() == [2, 0, 0], "Error while validating `ResultCollector`"
+    assert results["temp"].iloc[0] == 20.5 and np.isnan(results["temp"].iloc[1]), "Error while validating `ResultCollector`"
+    assert collector.add_to(pd.DataFrame({"temp": [0, 0, 0], "humidity": [1, 2, 3]}, index=results.index))["temp"].iloc[2] == 21
+    print("Validation PASSED: result_collector.py")
@@ -0,0 +1,274 @@
+import io
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# Optional: results are written as Arrow IPC if pyarrow is installed, else as a directory of .npy files
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+import sys
+sys.path.insert(0, '/work/greenhouse-simulator-2/')
+
+from helpers.result_collector import ResultCollector
+
+
+# Metadata file of the npy format (column names, dtypes, length, timezone)
+NPY_METADATA_FILE = "columns.json"
+
+
+def get_npy_header(dtype, length) -> bytes:
+    """
+    Header of a 1-D .npy file. Its size does not depend on the length (128 bytes), so it can be rewritten in place once
+    the final length is known.
+    """
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(header, {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False, "shape": (length,)})
+    return header.getvalue()
+
+
+class ChunkedResultWriter:
+    """
+    Streams the results of a simulation to disk in chunks of a fixed number of rows, so memory stays bounded on long,
+    high resolution runs. The finished output is read back (memory-mapped) with `ResultReader`.
+
+    Supported formats:
+        arrow: a single Arrow IPC file, one record batch per chunk (requires pyarrow).
+        npy: a directory with one .npy file per column (and "timestamp.npy"), which chunks are appended to.
+        auto: arrow if pyarrow is installed, else npy.
+    """
+    def __init__(self, path, schema, chunk_size=10_000, format="auto"):
+        if format == "auto":
+            format = "arrow" if pa is not None else "npy"
+        assert format in ["arrow", "npy"], f"Output format '{format}' is not supported."
+        assert format != "arrow" or pa is not None, "The arrow output format requires pyarrow."
+
+        self.path = path
+        self.format = format
+        self.schema = dict(schema)
+        self.chunk_size = chunk_size
+
+        self.collector = ResultCollector(self.schema, chunk_size)
+        self.timestamps = np.zeros(chunk_size, dtype=np.int64)
+        self.tz = None
+
+        # Number of rows written to disk so far
+        self.length = 0
+
+        self.arrow_writer = None
+        self.npy_files = None
+        if self.format == "npy":
+            os.makedirs(path, exist_ok=True)
+            self.npy_files = {
+                name: open(os.path.join(path, f"{name}.npy"), "wb")
+                for name in ["timestamp", *self.schema]
+            }
+            for name, file in self.npy_files.items():
+                file.write(get_npy_header(self.get_dtype(name), 0))
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exception_info):
+        self.close()
+
+
+    def get_dtype(self, name):
+        return np.int64 if name == "timestamp" else np.dtype(self.schema[name])
+
+
+    def append(self, timestamp, results):
+        """
+        Adds the results (dict) of one step. They are written to disk when the chunk is full.
+        """
+        timestamp = pd.Timestamp(timestamp)
+        if self.tz is None and timestamp.tz is not None:
+            self.tz = str(timestamp.tz)
+
+        self.timestamps[len(self.collector)] = timestamp.value
+        self.collector.append(results)
+
+        if len(self.collector) == self.chunk_size:
+            self.flush()
+
+
+    def extend(self, results):
+        """
+        Adds the results of several steps at once (DataFrame indexed by timestamp, e.g. from `Greenhouse.run_continuous`).
+        """
+        self.flush()
+        if self.tz is None and results.index.tz is not None:
+            self.tz = str(results.index.tz)
+
+        for start in range(0, len(results), self.chunk_size):
+            chunk = results.iloc[start:start + self.chunk_size]
+            self.write_chunk(
+                chunk.index.as_unit("ns").asi8,
+                {name: chunk[name].to_numpy(dtype=self.get_dtype(name)) for name in self.schema}
+            )
+
+
+    def flush(self):
+        """
+        Writes the rows collected so far as a chunk.
+        """
+        count = len(self.collector)
+        if count == 0:
+            return
+
+        self.write_chunk(self.timestamps[:count], {name: column[:count] for name, column in self.collector.columns.items()})
+        self.collector.reset()
+
+
+    def write_chunk(self, timestamps, columns):
+        if self.format == "arrow":
+            if self.arrow_writer is None:
+                self.arrow_writer = pa.ipc.new_file(self.path, self.get_arrow_schema())
+            self.arrow_writer.write_batch(pa.record_batch(
+                [pa.array(timestamps.view("datetime64[ns]")).cast(pa.timestamp("ns", tz=self.tz))] + [pa.array(columns[name]) for name in self.schema],
+                schema=self.get_arrow_schema()
+            ))
+        else:
+            self.npy_files["timestamp"].write(np.ascontiguousarray(timestamps, dtype=np.int64).tobytes())
+            for name in self.schema:
+                self.npy_files[name].write(np.ascontiguousarray(columns[name], dtype=self.get_dtype(name)).tobytes())
+
+        self.length += len(timestamps)
+
+
+    def get_arrow_schema(self):
+        return pa.schema(
+            [pa.field("timestamp", pa.timestamp("ns", tz=self.tz))]
+            + [pa.field(name, pa.from_numpy_dtype(self.get_dtype(name))) for name in self.schema]
+        )
+
+
+    def close(self):
+        """
+        Writes the remaining rows and finalizes the output.
+        """
+        self.flush()
+
+        if self.format == "arrow":
+            if self.arrow_writer is None:
+                # No rows: still write a (valid, empty) file
+                self.arrow_writer = pa.ipc.new_file(self.path, self.get_arrow_schema())
+            self.arrow_writer.close()
+            self.arrow_writer = None
+        elif self.npy_files is not None:
+            for name, file in self.npy_files.items():
+                file.seek(0)
+                file.write(get_npy_header(self.get_dtype(name), self.length))
+                file.close()
+            self.npy_files = None
+
+            with open(os.path.join(self.path, NPY_METADATA_FILE), "w") as metadata_file:
+                json.dump({
+                    "columns": {name: np.dtype(self.get_dtype(name)).str for name in self.schema},
+                    "length": self.length,
+                    "tz": self.tz,
+                }, metadata_file)
+
+
+class ResultReader:
+    """
+    Memory-mapped results written by `ChunkedResultWriter`. Columns are only read when they are accessed:
+        reader["temp"] returns a NumPy array,
+        reader[["temp", "humidity"]] returns a DataFrame indexed by timestamp.
+
+    It can be passed instead of a results DataFrame to `get_total_cost` and to the plotting functions of
+    helpers/visualization, which only read the columns they need.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.format = "npy" if os.path.isdir(path) else "arrow"
+
+        if self.format == "npy":
+            with open(os.path.join(path, NPY_METADATA_FILE)) as metadata_file:
+                metadata = json.load(metadata_file)
+            self.columns = list(metadata["columns"])
+            self.length = metadata["length"]
+            self.tz = metadata["tz"]
+            self.table = None
+        else:
+            assert pa is not None, "Reading arrow output requires pyarrow."
+            # The record batches stay memory-mapped, nothing is read until a column is converted
+            self.table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+            self.columns = [name for name in self.table.column_names if name != "timestamp"]
+            self.length = self.table.num_rows
+            self.tz = self.table.schema.field("timestamp").type.tz
+
+        self.index_cache = None
+
+
+    def __len__(self):
+        return self.length
+
+
+    def __contains__(self, name):
+        return name in self.columns
+
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.get_column(key)
+        return self.to_dataframe(key)
+
+
+    @property
+    def index(self) -> pd.DatetimeIndex:
+        if self.index_cache is None:
+            timestamps = self.read_column("timestamp").view("datetime64[ns]")
+            index = pd.DatetimeIndex(timestamps, name="timestamp")
+            self.index_cache = index.tz_localize("UTC").tz_convert(self.tz) if self.tz is not None else index
+        return self.index_cache
+
+
+    def get_column(self, name) -> np.ndarray:
+        assert name in self.columns, f"Column '{name}' is not in the results."
+        return self.read_column(name)
+
+
+    def read_column(self, name) -> np.ndarray:
+        if self.format == "npy":
+            return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+
+        column = self.table.column(name)
+        if name == "timestamp":
+            column = column.cast(pa.int64())
+        # Zero-copy for a single chunk, otherwise only this column is concatenated
+        return column.to_numpy()
+
+
+    def to_dataframe(self, columns=None) -> pd.DataFrame:
+        """
+        Reads the given columns (all of them by default) into a DataFrame indexed by timestamp.
+        """
+        columns = self.columns if columns is None else list(columns)
+        return pd.DataFrame({name: self.get_column(name) for name in columns}, index=self.index)
+
+
+### VALIDATION
+def validate():
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        timestamps = pd.date_range("2021-06-01", periods=5, freq="h", tz="Europe/Lisbon")
+        for output_format in ["npy", "arrow"] if pa is not None else ["npy"]:
+            path = os.path.join(directory, f"results.{output_format}")
+            with ChunkedResultWriter(path, {"temp": float, "harvested_plant_count": int}, chunk_size=2, format=output_format) as writer:
+                for i, timestamp in enumerate(timestamps[:3]):
+                    writer.append(timestamp, {"temp": 20 + i, "harvested_plant_count": i})
+                writer.extend(pd.DataFrame({"temp": [23., 24.], "harvested_plant_count": [3, 4]}, index=timestamps[3:]))
+
+            reader = ResultReader(path)
+            assert len(reader) == 5 and reader["temp"].tolist() == [20, 21, 22, 23, 24], f"Error while validating `ResultReader` ({output_format})"
+            assert reader[["harvested_plant_count"]].index.equals(timestamps.rename("timestamp")), f"Error while validating `ResultReader` ({output_format})"
+            assert reader["harvested_plant_count"].dtype == np.int64 and reader["harvested_plant_count"].sum() == 10
+            del reader
+    print("Validation PASSED: result_writer.py")
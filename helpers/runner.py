@@ -1,12 +1,415 @@
+import time
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
 import pandas as pd
 
-def run_simulation(df, system):
-    results = []
-    for i, data in df.iterrows():
-        result = system.run(data, i)
-        results.append(result)
+import sys
+sys.path.insert(0, '/work/greenhouse-simulator-2/')
+
+from helpers.data_prep import get_weather_data, read_weather_data, prepare_weather_data
+from helpers.result_collector import ResultCollector
+from helpers.history import History
+from helpers.result_writer import ChunkedResultWriter, ResultReader
+
+
+class SharedWeatherData:
+    """
+    Weather data (numeric columns and timestamp index) copied once into a shared memory block, which the worker processes
+    of `run_batch` attach to and read without copying. The process that creates it must `close` it when the workers are done.
+    """
+    def __init__(self, weather_df):
+        values = weather_df.to_numpy(dtype=float)
+        timestamps = weather_df.index.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+        # Timestamps (as int64 nanoseconds) in the first column, then the weather columns
+        self.shape = (len(weather_df), 1 + values.shape[1])
+        self.columns = list(weather_df.columns)
+        self.index_name = weather_df.index.name
+
+        self.shared_memory = SharedMemory(create=True, size=max(np.prod(self.shape) * 8, 1))
+        table = np.ndarray(self.shape, dtype=np.float64, buffer=self.shared_memory.buf)
+        table[:, 0] = timestamps.view(np.float64)
+        table[:, 1:] = values
+
+
+    def get_spec(self):
+        """
+        Picklable description of the shared block, to `attach` to it from another process.
+        """
+        return self.shared_memory.name, self.shape, self.columns, self.index_name
+
+
+    @staticmethod
+    def attach(spec):
+        """
+        Returns the shared memory block (which must stay referenced while the data is used) and the weather data frame,
+        whose values are a view of the block.
+        """
+        name, shape, columns, index_name = spec
+        shared_memory = SharedMemory(name=name)
+        table = np.ndarray(shape, dtype=np.float64, buffer=shared_memory.buf)
+        table.flags.writeable = False
+
+        index = pd.DatetimeIndex(table[:, 0].view(np.int64).view("datetime64[ns]"), name=index_name)
+        weather_df = pd.DataFrame(table[:, 1:], index=index, columns=columns, copy=False)
+        return shared_memory, weather_df
+
+
+    def close(self):
+        self.shared_memory.close()
+        self.shared_memory.unlink()
+
+
+# Set in each worker process of `run_batch` by `init_worker`
+worker_shared_memory = None
+worker_weather_df = None
+worker_greenhouse_class = None
+worker_summarize = None
+
+
+def init_worker(weather_data_spec, greenhouse_class, summarize):
+    """
+    Attaches a worker process of `run_batch` to the shared weather data (if any). With the "fork" start method, the
+    greenhouse class and summarize function are inherited by the worker instead of being pickled.
+    """
+    global worker_shared_memory, worker_weather_df, worker_greenhouse_class, worker_summarize
+    if weather_data_spec is not None:
+        worker_shared_memory, worker_weather_df = SharedWeatherData.attach(weather_data_spec)
+    worker_greenhouse_class = greenhouse_class
+    worker_summarize = summarize
+
+
+def simulate(greenhouse, df, continuous=False, output_path=None, chunk_size=10_000, output_format="auto", adaptive=False):
+    """
+    Runs a greenhouse through a weather data frame, raising the errors of the model instead of stopping at the failed
+    row. With `adaptive`, steady rows are solved as one step (see
+    `Greenhouse.run_adaptive`).
+
+    With an `output_path`, the results are streamed to disk instead (see `simulate_to_disk`) and a `ResultReader`
+    of them is returned.
+    """
+    if output_path is not None:
+        return simulate_to_disk(greenhouse, df, output_path, continuous, chunk_size, output_format, adaptive)
+
+    df = greenhouse.get_open_loop_inputs(df)
+
+    if continuous or adaptive:
+        results = greenhouse.run_continuous(df) if continuous else greenhouse.run_adaptive(df)
+        return pd.concat([df.drop(columns=results.columns, errors="ignore"), results], axis=1)
+
+    collector = ResultCollector(greenhouse.get_result_schema(), len(df), df.index)
+    for timestamp, row in df.iterrows():
+        collector.append(greenhouse.run(timestamp, row))
+
+    return collector.add_to(df)
+
+
+def iter_chunks(weather, chunk_size):
+    """
+    Consecutive chunks of `chunk_size` rows of a weather data frame, or the chunks of an iterable of weather data frames.
+    """
+    if not isinstance(weather, pd.DataFrame):
+        return iter(weather)
+    return (weather.iloc[start:start + chunk_size] for start in range(0, len(weather), chunk_size))
+
+
+def simulate_to_disk(greenhouse, weather, output_path, continuous=False, chunk_size=10_000, output_format="auto", adaptive=False):
+    """
+    Runs a greenhouse through weather data chunk by chunk, writing the results of each chunk to disk with a
+    `ChunkedResultWriter`, so that memory stays bounded on long, high resolution runs. Only the result columns
+    (`Greenhouse.get_result_schema`) are written, not the weather and open loop input columns.
+
+    `weather` is a weather data frame, which is cut into chunks of `chunk_size` rows, or an iterable of consecutive
+    weather data frames, e.g. `iter_weather_data` from helpers/data_prep, which are used as the chunks. With the
+    latter, the weather data is never fully in memory either.
+
+    The open loop inputs are computed per chunk. With `continuous`, the climate is integrated as one ODE problem per
+    chunk, starting from the state at the end of the previous chunk. With `adaptive`, steady rows of a chunk are solved
+    as one step (see `Greenhouse.run_adaptive`).
+
+    Returns
+    -------
+    results : ResultReader
+        Memory-mapped results, which `get_total_cost` and the plots of helpers/visualization can read.
+    """
+    with ChunkedResultWriter(output_path, greenhouse.get_result_schema(), chunk_size, output_format) as writer:
+        for weather_chunk_df in iter_chunks(weather, chunk_size):
+            chunk_df = greenhouse.get_open_loop_inputs(weather_chunk_df)
+
+            if continuous or adaptive:
+                writer.extend(greenhouse.run_continuous(chunk_df) if continuous else greenhouse.run_adaptive(chunk_df))
+                continue
+
+            for timestamp, row in chunk_df.iterrows():
+                writer.append(timestamp, greenhouse.run(timestamp, row))
+
+    return ResultReader(output_path)
+
+
+def simulate_kpis(greenhouse, weather, continuous=False, integration="step", rollups=(), chunk_size=10_000, adaptive=False):
+    """
+    Runs a greenhouse through weather data without keeping its results, only accumulating their KPIs step by step
+    (see `Greenhouse.track_kpis`), e.g. for large parameter sweeps.
+
+    `weather` is a weather data frame or an iterable of consecutive weather data frames, like in `simulate_to_disk`.
+    With `continuous` (or `adaptive`, see `Greenhouse.run_adaptive`), the results of one chunk of `chunk_size` rows
+    are held at a time.
+
+    Returns
+    -------
+    kpis : KPIAccumulator
+        Totals (`get_kpis`) and rollups (`get_rollup`) of the run.
+    """
+    kpis = greenhouse.track_kpis(integration, rollups)
+
+    for weather_chunk_df in iter_chunks(weather, chunk_size):
+        chunk_df = greenhouse.get_open_loop_inputs(weather_chunk_df)
+
+        if continuous:
+            greenhouse.run_continuous(chunk_df)
+            continue
+        if adaptive:
+            greenhouse.run_adaptive(chunk_df)
+            continue
+
+        for timestamp, row in chunk_df.iterrows():
+            greenhouse.run(timestamp, row)
+
+    return kpis
+
+
+def run_job(config, date_range, resample_period, continuous, keep_results):
+    """
+    Simulates one (config, date range) scenario of `run_batch` in a worker process. Errors are returned, not raised,
+    so that one failed scenario does not abort the others.
+    """
+    start_time = time.perf_counter()
+    df, summary, kpis, error = None, None, None, None
+    try:
+        greenhouse = worker_greenhouse_class(resample_period=resample_period, **config)
+        weather_df = prepare_weather_data(worker_weather_df, date_range[0], date_range[1], resample_period)
+        if keep_results:
+            greenhouse.track_kpis()
+            df = simulate(greenhouse, weather_df, continuous)
+        else:
+            simulate_kpis(greenhouse, weather_df, continuous)
+        kpis = greenhouse.kpis.get_kpis()
+        if worker_summarize is not None:
+            summary = worker_summarize(df, greenhouse)
+    except Exception:
+        error = traceback.format_exc()
+
+    return {
+        "df": df,
+        "summary": summary,
+        "kpis": kpis,
+        "error": error,
+        "elapsed_s": time.perf_counter() - start_time,
+    }
+
+
+def run_batch(greenhouse_class, configs, date_ranges, resample_period, continuous=False, summarize=None, max_workers=None, weather_df=None, keep_results=True):
+    """
+    Simulates every (config, date range) pair in a pool of worker processes.
+
+    The weather data is read once and shared with the workers through shared memory. Workers are started with "fork"
+    (where available), so that they inherit `greenhouse_class` and `summarize` even if they are defined in a notebook
+    (e.g. `Greenhouse`) and cannot be pickled.
+
+    Parameters
+    ----------
+    greenhouse_class : type
+        Class of the simulated greenhouses, e.g. `Greenhouse`.
+    configs : list of dict
+        Constructor keyword arguments of each greenhouse (besides `resample_period`). Every scenario gets a new greenhouse.
+    date_ranges : list of [str, str]
+        Date ranges ([date_from, date_to]) to simulate each config for.
+    summarize : function, optional
+        Called as `summarize(df, greenhouse)` in the worker at the end of each scenario, e.g. `get_total_cost`.
+        Its result must be picklable. Without `keep_results`, df is None (the KPIs are in `greenhouse.kpis`).
+    max_workers : int, optional
+        Number of worker processes, defaults to the number of CPUs.
+    weather_df : pd.DataFrame, optional
+        Hourly weather data indexed by timestamp, defaults to `read_weather_data()`.
+    keep_results : bool
+        Whether the results of each scenario are returned, or only their KPIs (see `simulate_kpis`).
+
+    Returns
+    -------
+    results : list of dict
+        One per scenario, ordered by config then date range (deterministic, whatever order the workers finish in):
+        config_index, date_range_index, df (None if failed or not kept), summary, kpis (`KPIAccumulator.get_kpis`),
+        error (traceback, None if succeeded), elapsed_s.
+    """
+    if weather_df is None:
+        weather_df = read_weather_data()
+
+    jobs = [
+        (config_index, date_range_index, config, date_range)
+        for config_index, config in enumerate(configs)
+        for date_range_index, date_range in enumerate(date_ranges)
+    ]
+
+    start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+    shared_weather_data = SharedWeatherData(weather_df)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=init_worker,
+            initargs=(shared_weather_data.get_spec(), greenhouse_class, summarize)
+        ) as executor:
+            futures = [
+                executor.submit(run_job, config, date_range, resample_period, continuous, keep_results)
+                for _, _, config, date_range in jobs
+            ]
+
+            results = []
+            for (config_index, date_range_index, _, _), future in zip(jobs, futures):
+                try:
+                    job_results = future.result()
+                except Exception:
+                    # The worker process itself failed (e.g. it was killed), not the simulation
+                    job_results = {"df": None, "summary": None, "kpis": None, "error": traceback.format_exc(), "elapsed_s": None}
+
+                results.append({"config_index": config_index, "date_range_index": date_range_index, **job_results})
+    finally:
+        shared_weather_data.close()
+
+    return results
+
+
+def run_segment(config, resample_period, weather_df, spin_up_row_count, elapsed_hours, continuous):
+    """
+    Simulates one segment of `run_parallel_in_time` in a worker process: a new greenhouse with the crop state estimated
+    at the start of the weather data, run through the spin-up rows (results discarded), then through the segment rows.
+
+    Returns the results of the segment, and checkpoints of the greenhouse at the start and end of the segment.
+    """
+    greenhouse = worker_greenhouse_class(resample_period=resample_period, **config)
+    if elapsed_hours > 0:
+        greenhouse.crop.estimate_state_after(elapsed_hours)
+
+    if spin_up_row_count > 0:
+        simulate(greenhouse, weather_df.iloc[:spin_up_row_count], continuous)
+    start_checkpoint = greenhouse.get_checkpoint()
+
+    df = simulate(greenhouse, weather_df.iloc[spin_up_row_count:], continuous)
+    return df, start_checkpoint, greenhouse.get_checkpoint()
+
+
+def get_seam_discrepancy(reference_checkpoint, estimated_checkpoint) -> dict:
+    """
+    Differences between the state of a greenhouse at a segment seam as simulated by the previous segment (reference)
+    and as estimated by the spin-up of the next one.
+    """
+    reference_weights = get_latest_history_value(reference_checkpoint["crop"]["weights"])
+    estimated_weights = get_latest_history_value(estimated_checkpoint["crop"]["weights"])
+    return {
+        **{
+            f"{key}_error": estimated_checkpoint["prev_period"][key] - reference_checkpoint["prev_period"][key]
+            for key in ["temp", "humidity_ratio", "CO2_concentration"]
+        },
+        # Largest relative error of the weight of a cohort
+        "crop_weight_relative_error": np.max(np.abs(estimated_weights / reference_weights - 1)),
+    }
+
+
+def get_latest_history_value(state):
+    """
+    Last value of a `History` from its state (see `History.get_state`). The layout of the stored values depends on
+    the history mode (ring buffer, snapshots), so the history is rebuilt to read it.
+    """
+    history = History(state["mode"])
+    history.set_state(state)
+    return history[-1]
+
+
+def run_parallel_in_time(greenhouse_class, config, date_range, resample_period, segment_count, spin_up="1D", continuous=False, max_workers=None):
+    """
+    Simulates one greenhouse over a long date range split into `segment_count` consecutive segments, which are
+    simulated in parallel worker processes and stitched together.
+
+    Segments after the first start from an estimated state (see `Crop.estimate_state_after`) `spin_up` before their
+    first row, and are simulated through this spin-up window before their results are kept. The air state relaxes
+    within hours, so a day of spin-up is enough for the climate. The crop state is exact after a `grow_period` of
+    spin-up (e.g. "28D" for `SweetBasil`), and approximated at the target DLI before that.
+
+    The discrepancy at each seam, between the state at the end of a segment and the state the spin-up of the next one
+    arrived at, is reported to trade the accuracy against the wall time (longer spin-up, fewer segments).
+
+    Parameters
+    ----------
+    greenhouse_class : type
+        Class of the simulated greenhouse, e.g. `Greenhouse` (inherited by the workers, see `run_batch`).
+    config : dict
+        Constructor keyword arguments of the greenhouse (besides `resample_period`).
+    date_range : [str, str]
+        Date range ([date_from, date_to]) to simulate.
+    segment_count : int
+        Number of segments, with the same number of rows.
+    spin_up : str
+        Duration of the spin-up window of each segment, as a pandas timedelta string.
+    max_workers : int, optional
+        Number of worker processes, defaults to the number of CPUs.
+
+    Returns
+    -------
+    df : pd.DataFrame
+        Weather data and results of the whole date range, like `simulate`.
+    seams : pd.DataFrame
+        Discrepancies at each seam (indexed by the timestamp of the first row of the later segment), see
+        `get_seam_discrepancy`.
+    """
+    weather_df = get_weather_data(date_range[0], date_range[1], resample_period)
+    time_period = pd.to_timedelta(resample_period).total_seconds()
+    spin_up_row_count = int(pd.to_timedelta(spin_up).total_seconds() // time_period)
+
+    segment_starts = np.linspace(0, len(weather_df), segment_count + 1).astype(int)
+    segments = []
+    for start, end in zip(segment_starts[:-1], segment_starts[1:]):
+        spin_up_start = max(start - spin_up_row_count, 0)
+        segments.append((weather_df.iloc[spin_up_start:end], start - spin_up_start, spin_up_start * time_period / 3600))
+
+    start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context(start_method),
+        initializer=init_worker,
+        initargs=(None, greenhouse_class, None)
+    ) as executor:
+        futures = [
+            executor.submit(run_segment, config, resample_period, segment_weather_df, segment_spin_up_row_count, elapsed_hours, continuous)
+            for segment_weather_df, segment_spin_up_row_count, elapsed_hours in segments
+        ]
+        segment_results = [future.result() for future in futures]
+
+    df = pd.concat([segment_df for segment_df, _, _ in segment_results])
+    seams = pd.DataFrame([
+        get_seam_discrepancy(previous_end_checkpoint, start_checkpoint)
+        for (_, _, previous_end_checkpoint), (_, start_checkpoint, _) in zip(segment_results[:-1], segment_results[1:])
+    ], index=weather_df.index[segment_starts[1:-1]])
+
+    return df, seams
+
 
-    df = pd.DataFrame(results)
-    df.reset_index(level=0, inplace=True)
+### VALIDATION
+def validate():
+    def get_checkpoint(history_mode, weights):
+        history = History(history_mode)
+        for weight in weights:
+            history.append(np.full(2, weight, dtype=float))
+        return {"prev_period": {"temp": 20.0, "humidity_ratio": 0.01, "CO2_concentration": 410.0}, "crop": {"weights": history.get_state()}}
 
-    return df
\ No newline at end of file
+    # Latest weights 7 and 9: the estimated weight is 28.6% too high, whatever the history mode stores
+    for history_mode in ["latest", "ring:5", "every:4"]:
+        reference_checkpoint = get_checkpoint(history_mode, [1, 2, 3, 4, 5, 6, 7])
+        estimated_checkpoint = get_checkpoint(history_mode, [3, 1, 4, 1, 5, 9])
+        seam_discrepancy = get_seam_discrepancy(reference_checkpoint, estimated_checkpoint)
+        assert np.isclose(seam_discrepancy["crop_weight_relative_error"], 9 / 7 - 1), f"Error while validating `get_seam_discrepancy` in '{history_mode}' mode"
+        assert seam_discrepancy["temp_error"] == 0, f"Error while validating `get_seam_discrepancy` in '{history_mode}' mode"
+    print("Validation PASSED: runner.py")
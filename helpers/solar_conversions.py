@@ -30,9 +30,10 @@ def projected_DLI_to_PAR_amount(projected_DLI: mol_per_m2_day, time_period: s) -
 
 
 ### VALIDATION
-# With online calculator: https://scynceled.com/dli-calculator/
-assert round(PPFD_to_projected_DLI(900, 16), 2) == 51.84, "Error while validating `PPFD_to_projected_DLI`"
-assert round(projected_DLI_to_PPFD(13, 16), 2) == 225.69, "Error while validating `projected_DLI_to_PPFD`"
+def validate():
+    # With online calculator: https://scynceled.com/dli-calculator/
+    assert round(PPFD_to_projected_DLI(900, 16), 2) == 51.84, "Error while validating `PPFD_to_projected_DLI`"
+    assert round(projected_DLI_to_PPFD(13, 16), 2) == 225.69, "Error while validating `projected_DLI_to_PPFD`"
 
 
-print("Validation PASSED: solar_conversions.py")
+    print("Validation PASSED: solar_conversions.py")
@@ -87,6 +87,7 @@ umol_per_m2_s = NewType('umol / m2 s', float)
 
 # Insulation efficiency
 W_per_m2_K = NewType('W / (m2 K)', float)
+W_per_K = NewType('W / K', float)
 
 # Absolute humidity
 kg_per_m3 = NewType('kg / m3', float)
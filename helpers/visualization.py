@@ -10,7 +10,7 @@ def plot_timeline(df, y, size=320, width=None, height=None, y_label="value"):
     if height == None:
         height = size
 
-    return alt.Chart(df.tz_convert(None).reset_index(), width=width, height=height, title=y).mark_line().encode(
+    return alt.Chart(df[[y]].tz_convert(None).reset_index(), width=width, height=height, title=y).mark_line().encode(
         alt.X("timestamp:T", axis=alt.Axis(title="time")),
         alt.Y(f"{y}:Q", axis=alt.Axis(title=y_label))
     )
@@ -172,7 +172,9 @@ def plot_in_grid(all_dfs, all_dfs_key,  chart_fn, col_count=2, row_count=2, **ch
     return hconcat_chart
 
 
+# The plots below select their columns first, so that `df` can also be a `ResultReader` of results streamed to disk
 def plot_humidity(df, title, show_label=False, width=400, height=200, is_long=False):
+    df = df[["humidity", "ambient_humidity", "ambient_humidity_at_inside_temp_RH", "dehum_rate_g_per_s"]]
     return plot_multiline_dual_y(
         df.resample('D').mean() if is_long else df,
         ["humidity", "ambient_humidity", "ambient_humidity_at_inside_temp_RH"],
@@ -189,6 +191,7 @@ def plot_humidity(df, title, show_label=False, width=400, height=200, is_long=Fa
 
 
 def plot_temperature(df, title, show_label=False, width=400, height=200, is_long=False):
+    df = df[["temp", "ambient_temp", "heating_rate_J_per_s"]]
     return plot_multiline_dual_y(
         df.resample('D').mean() if is_long else df,
         ["temp", "ambient_temp"],
@@ -205,6 +208,7 @@ def plot_temperature(df, title, show_label=False, width=400, height=200, is_long
 
 
 def plot_energy(df, title, show_label=False, width=400, height=200, is_long=False):
+    df = df[["energy_used_by_fan_J", "energy_used_by_heating_J", "energy_used_by_dehum_J", "energy_used_by_lighting_J"]]
     return plot_stacked_area(
         df.resample('D').mean() if is_long else df, 
         ["energy_used_by_fan_J", "energy_used_by_heating_J", "energy_used_by_dehum_J", "energy_used_by_lighting_J"], 
@@ -0,0 +1,180 @@
+import os
+import json
+from collections import OrderedDict
+from datetime import timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+WEATHER_DATA_DIRECTORY = Path(__file__).parent.parent / "weather_data"
+
+# Site of the weather data used when none is given, i.e. weather_data/Lisboa_2020.csv
+DEFAULT_SITE = "Lisboa"
+
+
+def read_weather_csv(path) -> pd.DataFrame:
+    """
+    Reads a CSV file of hourly weather data, indexed by timestamp.
+    """
+    # Read data from CSV file
+    weather_df = pd.read_csv(path, index_col=0)
+
+    # Convert timestamp column from string to pandas timestamp
+    weather_df["timestamp"] = pd.to_datetime(weather_df['timestamp'], format='%Y-%m-%d %H:%M:%S')
+
+    # Set TimestampIndex as interpolation requires it
+    return weather_df.set_index('timestamp')
+
+
+def resample_weather_data(weather_df, resample_period, origin="start_day") -> pd.DataFrame:
+    """
+    Resamples hourly weather data to `resample_period`, interpolating between the hours, and localizes it to UTC.
+    `origin` is the timestamp the resampled grid is aligned to (see `pd.DataFrame.resample`).
+    """
+    # Resample from hourly data then interpolate it
+    weather_df = weather_df.resample(resample_period, origin=origin).interpolate(method='polynomial', order=2)
+
+    # Add timezone information
+    return weather_df.tz_localize(timezone.utc)
+
+
+class WeatherStore:
+    """
+    Hourly weather data of a site, converted once from CSV to a binary cache in weather_data/cache, which is
+    memory-mapped instead of parsing the CSV on every call. Date ranges are sliced out of it without copying, and
+    resampled date ranges are cached (up to `max_cached_resamples`).
+
+    The CSV files of a site are named "<site>.csv" or "<site>_<year>.csv" (e.g. weather_data/Lisboa_2020.csv), have
+    the same columns, and are concatenated in time order. Other sites and years are added by adding such files. The
+    cache of a site is rebuilt when its CSV files change.
+    """
+    def __init__(self, site=DEFAULT_SITE, directory=WEATHER_DATA_DIRECTORY, max_cached_resamples=32):
+        directory = Path(directory)
+        self.site = site
+        self.csv_paths = sorted([*directory.glob(f"{site}.csv"), *directory.glob(f"{site}_[0-9][0-9][0-9][0-9].csv")])
+        assert len(self.csv_paths) > 0, f"No weather data files found for site '{site}' in {directory}."
+
+        cache_directory = directory / "cache"
+        self.timestamps_path = cache_directory / f"{site}.timestamps.npy"
+        self.values_path = cache_directory / f"{site}.values.npy"
+        self.metadata_path = cache_directory / f"{site}.json"
+
+        if not self.is_cache_valid():
+            self.convert()
+
+        with open(self.metadata_path) as metadata_file:
+            self.columns = json.load(metadata_file)["columns"]
+        self.index = pd.DatetimeIndex(np.load(self.timestamps_path), name="timestamp")
+        # Rows are contiguous, so a date range is a view of the file
+        self.values = np.load(self.values_path, mmap_mode="r")
+
+        self.max_cached_resamples = max_cached_resamples
+        self.resample_cache = OrderedDict()
+
+
+    def get_sources(self) -> dict:
+        """
+        File name -> (modification time, size) of the CSV files of the site, to detect changes.
+        """
+        return {path.name: [path.stat().st_mtime_ns, path.stat().st_size] for path in self.csv_paths}
+
+
+    def is_cache_valid(self) -> bool:
+        if not (self.metadata_path.exists() and self.timestamps_path.exists() and self.values_path.exists()):
+            return False
+        with open(self.metadata_path) as metadata_file:
+            return json.load(metadata_file)["sources"] == self.get_sources()
+
+
+    def convert(self):
+        """
+        Converts the CSV files of the site to the binary cache.
+        """
+        weather_df = pd.concat([read_weather_csv(path) for path in self.csv_paths]).sort_index()
+        assert not weather_df.index.has_duplicates, f"The weather data files of site '{self.site}' overlap."
+
+        self.metadata_path.parent.mkdir(parents=True, exist_ok=True)
+        # Written under temporary names and renamed, so that a concurrent reader never sees a partial file.
+        # The metadata is written last, it marks the cache as valid.
+        for path, values in [
+            (self.timestamps_path, weather_df.index.to_numpy()),
+            (self.values_path, np.ascontiguousarray(weather_df.to_numpy(dtype=float))),
+        ]:
+            with open(f"{path}.tmp", "wb") as file:
+                np.save(file, values)
+            os.replace(f"{path}.tmp", path)
+
+        with open(f"{self.metadata_path}.tmp", "w") as metadata_file:
+            json.dump({"columns": list(weather_df.columns), "sources": self.get_sources()}, metadata_file)
+        os.replace(f"{self.metadata_path}.tmp", self.metadata_path)
+
+
+    def get_hourly_data(self, date_from=None, date_to=None) -> pd.DataFrame:
+        """
+        Hourly weather data from `date_from` to the start of `date_to` (the whole store by default), indexed by
+        timestamp. Its values are a read-only view of the memory-mapped cache.
+        """
+        start = 0 if date_from is None else self.index.searchsorted(pd.Timestamp(date_from))
+        end = len(self.index) if date_to is None else self.index.searchsorted(pd.Timestamp(f"{date_to}T00:00:00.000000"), side="right")
+        return pd.DataFrame(self.values[start:end], index=self.index[start:end], columns=self.columns, copy=False)
+
+
+    def get_weather_data(self, date_from, date_to, resample_period="min") -> pd.DataFrame:
+        """
+        Weather data of the date range resampled to `resample_period`, like `get_weather_data` in helpers/data_prep.
+        Returns a copy of the cached resample, which the caller can modify.
+        """
+        key = (str(date_from), str(date_to), resample_period)
+        if key in self.resample_cache:
+            self.resample_cache.move_to_end(key)
+        else:
+            self.resample_cache[key] = resample_weather_data(self.get_hourly_data(date_from, date_to), resample_period)
+            if len(self.resample_cache) > self.max_cached_resamples:
+                self.resample_cache.popitem(last=False)
+
+        return self.resample_cache[key].copy()
+
+
+    def iter_weather_data(self, date_from, date_to, resample_period="min", chunk_hours=168, margin_hours=24):
+        """
+        Generator of the weather data of `get_weather_data`, resampled lazily in chunks of `chunk_hours` hours, so that
+        long horizons at a fine resolution (e.g. a year every 5 seconds) are consumed in constant memory.
+
+        The order 2 polynomial (spline) interpolation is global: every point depends on all the hours of the date range,
+        with an influence that decays by a factor of ~6 per hour. Each chunk is therefore interpolated over a window
+        of `margin_hours` extra hours on both sides (cut at the ends of the date range, like the full interpolation).
+        With the default 24 hours, the chunks match `get_weather_data` to machine precision.
+
+        Yields
+        ------
+        chunk_df : pd.DataFrame
+            Consecutive rows of the resampled weather data, indexed by timestamp.
+        """
+        hourly_df = self.get_hourly_data(date_from, date_to)
+        if len(hourly_df) == 0:
+            return
+
+        # Grid of the resample of the whole date range, whatever hour a window starts at
+        origin = hourly_df.index[0].floor("D")
+
+        for start in range(0, len(hourly_df), chunk_hours):
+            end = start + chunk_hours
+            window_df = hourly_df.iloc[max(start - margin_hours, 0):end + margin_hours]
+            window_df = resample_weather_data(window_df, resample_period, origin=origin)
+
+            # Keep the rows from the first hour of the chunk to the first hour of the next one
+            chunk_start = window_df.index.searchsorted(hourly_df.index[start].tz_localize(timezone.utc))
+            chunk_end = window_df.index.searchsorted(hourly_df.index[end].tz_localize(timezone.utc)) if end < len(hourly_df) else len(window_df)
+            yield window_df.iloc[chunk_start:chunk_end]
+
+
+# One store per site in each process, so that resamples are cached across calls of `get_weather_data`
+weather_stores = {}
+
+
+def get_weather_store(site=DEFAULT_SITE) -> WeatherStore:
+    if site not in weather_stores:
+        weather_stores[site] = WeatherStore(site)
+    return weather_stores[site]